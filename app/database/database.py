@@ -1,7 +1,9 @@
 import asyncio
+import time
 from typing import AsyncGenerator
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from loguru import logger
 
 from config.settings import settings
@@ -11,11 +13,32 @@ class Base(DeclarativeBase):
     pass
 
 
+class CheckoutTimedPool(AsyncAdaptedQueuePool):
+    """Пул соединений с учетом времени ожидания свободного соединения (для метрик)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.checkout_seconds_sum = 0.0
+        self.checkout_seconds_max = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            self.checkouts += 1
+            self.checkout_seconds_sum += waited
+            self.checkout_seconds_max = max(self.checkout_seconds_max, waited)
+
+
 class DatabaseManager:
     def __init__(self):
         self.engine = create_async_engine(
             settings.database_url,
             echo=settings.DEBUG,
+            poolclass=CheckoutTimedPool,
             pool_size=10,
             max_overflow=20
         )
@@ -1,11 +1,25 @@
-from datetime import datetime
+from datetime import datetime, date
 from typing import Optional, List
-from sqlalchemy import BigInteger, String, Integer, Boolean, Text, DateTime, ForeignKey, JSON
+from sqlalchemy import (
+    BigInteger, String, Integer, Boolean, Text, Date, DateTime, ForeignKey, JSON, Index, LargeBinary, Sequence, text
+)
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
 
 from app.database.database import Base
 
+# Эмоджи для статусов анализа
+ANALYSIS_STATUS_EMOJIS = {
+    'started': '🟡',
+    'ready_for_ai': '🟠',
+    'ai_analyzing': '🔵',
+    'ai_completed': '🟢',
+    'completed': '✅',
+    'disputed': '⚠️',
+    'ai_error': '🔴',
+    'expired': '⌛'
+}
+
 
 class Owner(Base):
     __tablename__ = "owners"
@@ -37,6 +51,14 @@ class Salon(Base):
     masters: Mapped[List["Master"]] = relationship("Master", back_populates="salon", cascade="all, delete-orphan")
     analyses: Mapped[List["Analysis"]] = relationship("Analysis", back_populates="salon")
 
+    __table_args__ = (
+        # Постраничный список активных салонов по (name, id)
+        Index('ix_salons_active_name_id', 'name', 'id', postgresql_where=text('is_active')),
+        # Триграммный поиск по названию и городу
+        Index('ix_salons_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        Index('ix_salons_city_trgm', 'city', postgresql_using='gin', postgresql_ops={'city': 'gin_trgm_ops'}),
+    )
+
     @property
     def quota_remaining(self) -> int:
         return max(0, self.quota_limit - self.quota_used)
@@ -62,15 +84,30 @@ class Master(Base):
     salon: Mapped["Salon"] = relationship("Salon", back_populates="masters")
     analyses: Mapped[List["Analysis"]] = relationship("Analysis", back_populates="master")
 
+    __table_args__ = (
+        # Постраничный список активных мастеров по (name, id)
+        Index('ix_masters_active_name_id', 'name', 'id', postgresql_where=text('is_active')),
+        # Триграммный поиск по имени и username
+        Index('ix_masters_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        Index(
+            'ix_masters_telegram_username_trgm', 'telegram_username',
+            postgresql_using='gin', postgresql_ops={'telegram_username': 'gin_trgm_ops'}
+        ),
+    )
+
     def __repr__(self) -> str:
         return f"<Master(id={self.id}, name='{self.name}', telegram_id={self.telegram_id})>"
 
 
 class Analysis(Base):
-    """Расширенная модель анализа для многоэтапного процесса"""
+    """
+    Расширенная модель анализа для многоэтапного процесса
+
+    Таблица секционирована по месяцам created_at, поэтому первичный ключ - (id, created_at).
+    """
     __tablename__ = "analyses"
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    id: Mapped[int] = mapped_column(Integer, Sequence("analyses_id_seq"), primary_key=True)
     master_id: Mapped[int] = mapped_column(Integer, ForeignKey("masters.id", ondelete="CASCADE"))
     salon_id: Mapped[int] = mapped_column(Integer, ForeignKey("salons.id", ondelete="CASCADE"))
 
@@ -84,31 +121,56 @@ class Analysis(Base):
     survey_response: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
 
     # === РЕЗУЛЬТАТЫ ИИ АНАЛИЗА ===
+    # Большие JSON поля не загружаются по умолчанию (группа "ai_payload"),
+    # их подгружают только экраны с результатами: undefer_group("ai_payload")
     # Результат анализа первой руки
-    ai_first_analysis: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
+    ai_first_analysis: Mapped[Optional[dict]] = mapped_column(
+        JSON, nullable=True, deferred=True, deferred_group="ai_payload", deferred_raiseload=True
+    )
     # Результат анализа второй руки
-    ai_second_analysis: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
+    ai_second_analysis: Mapped[Optional[dict]] = mapped_column(
+        JSON, nullable=True, deferred=True, deferred_group="ai_payload", deferred_raiseload=True
+    )
     # Дневник роста, созданный ИИ
-    ai_diary: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
+    ai_diary: Mapped[Optional[dict]] = mapped_column(
+        JSON, nullable=True, deferred=True, deferred_group="ai_payload", deferred_raiseload=True
+    )
 
     # === СТАТУС АНАЛИЗА ===
-    # started, ready_for_ai, ai_analyzing, ai_completed, completed, disputed, ai_error
+    # started, ready_for_ai, ai_analyzing, ai_completed, completed, disputed, ai_error, expired
     status: Mapped[str] = mapped_column(String(50), default="started")
 
     # === ДОПОЛНИТЕЛЬНЫЕ ДАННЫЕ ===
     # Дополнительные данные (для споров, комментариев и т.д.)
-    result_data: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
+    result_data: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True, deferred=True, deferred_raiseload=True)
 
     # === ВРЕМЕННЫЕ МЕТКИ ===
-    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+    # Ключ секционирования; задается приложением при создании анализа
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, primary_key=True, default=datetime.now, server_default=func.now()
+    )
     completed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     ai_started_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     ai_completed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    # Последний признак жизни обработчика ИИ и число запусков (для восстановления после падения)
+    ai_heartbeat_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    ai_attempts: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    # Последнее изменение черновика мастером (None - с момента создания изменений не было)
+    last_activity_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    # Время переноса результатов ИИ в analysis_payload_archive (None - результаты в таблице)
+    payload_archived_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
 
     # Relationships
     master: Mapped["Master"] = relationship("Master", back_populates="analyses")
     salon: Mapped["Salon"] = relationship("Salon", back_populates="analyses")
 
+    __table_args__ = (
+        Index('ix_analyses_status', 'status'),
+        Index('ix_analyses_ai_started_at', 'ai_started_at'),
+        Index('ix_analyses_master_id_created_at', 'master_id', 'created_at'),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
+
     @property
     def total_photos_count(self) -> int:
         """Общее количество фотографий"""
@@ -142,29 +204,31 @@ class Analysis(Base):
     @property
     def status_emoji(self) -> str:
         """Эмоджи для статуса анализа"""
-        status_emojis = {
-            'started': '🟡',
-            'ready_for_ai': '🟠',
-            'ai_analyzing': '🔵',
-            'ai_completed': '🟢',
-            'completed': '✅',
-            'disputed': '⚠️',
-            'ai_error': '🔴'
-        }
-        return status_emojis.get(self.status, '❓')
+        return ANALYSIS_STATUS_EMOJIS.get(self.status, '❓')
 
     def __repr__(self) -> str:
         return f"<Analysis(id={self.id}, master_id={self.master_id}, status='{self.status}')>"
 
 
 class SystemLog(Base):
+    """
+    Журнал действий пользователей
+
+    Таблица секционирована по месяцам created_at, поэтому первичный ключ - (id, created_at).
+    """
     __tablename__ = "system_logs"
+    __table_args__ = (
+        Index('ix_system_logs_created_at', 'created_at'),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    id: Mapped[int] = mapped_column(Integer, Sequence("system_logs_id_seq"), primary_key=True)
     user_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
     action: Mapped[str] = mapped_column(String(255), nullable=False)
     details: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
-    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, primary_key=True, default=datetime.now, server_default=func.now()
+    )
 
     def __repr__(self) -> str:
         return f"<SystemLog(id={self.id}, action='{self.action}', user_id={self.user_id})>"
@@ -198,7 +262,8 @@ class AnalysisReview(Base):
     __tablename__ = "analysis_reviews"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    analysis_id: Mapped[int] = mapped_column(Integer, ForeignKey("analyses.id", ondelete="CASCADE"))
+    # Ссылка на секционированную таблицу analyses без внешнего ключа в БД
+    analysis_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
     reviewer_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)  # ID проверяющего
     reviewer_type: Mapped[str] = mapped_column(String(20), nullable=False)  # 'master', 'manager', 'owner'
 
@@ -213,7 +278,9 @@ class AnalysisReview(Base):
     resolved_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
 
     # Relationships
-    analysis: Mapped["Analysis"] = relationship("Analysis")
+    analysis: Mapped["Analysis"] = relationship(
+        "Analysis", primaryjoin="foreign(AnalysisReview.analysis_id) == Analysis.id", viewonly=True
+    )
 
     def __repr__(self) -> str:
         return f"<AnalysisReview(id={self.id}, analysis_id={self.analysis_id}, type='{self.review_type}')>"
@@ -224,7 +291,8 @@ class AIProcessingLog(Base):
     __tablename__ = "ai_processing_logs"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    analysis_id: Mapped[int] = mapped_column(Integer, ForeignKey("analyses.id", ondelete="CASCADE"))
+    # Ссылка на секционированную таблицу analyses без внешнего ключа в БД
+    analysis_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
 
     processing_step: Mapped[str] = mapped_column(String(50), nullable=False)  # 'first_hand', 'second_hand', 'diary'
     status: Mapped[str] = mapped_column(String(20), nullable=False)  # 'started', 'completed', 'error'
@@ -240,7 +308,124 @@ class AIProcessingLog(Base):
     completed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
 
     # Relationships
-    analysis: Mapped["Analysis"] = relationship("Analysis")
+    analysis: Mapped["Analysis"] = relationship(
+        "Analysis", primaryjoin="foreign(AIProcessingLog.analysis_id) == Analysis.id", viewonly=True
+    )
+
+    def __repr__(self) -> str:
+        return f"<AIProcessingLog(id={self.id}, analysis_id={self.analysis_id}, step='{self.processing_step}')>"
+
+
+class AnalysisDailyStat(Base):
+    """Суточные агрегаты анализов (день создания, салон, мастер, текущий статус)"""
+    __tablename__ = "analysis_daily_stats"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    salon_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    master_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    status: Mapped[str] = mapped_column(String(50), primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ix_analysis_daily_stats_salon_id_day', 'salon_id', 'day'),
+        Index('ix_analysis_daily_stats_master_id_day', 'master_id', 'day'),
+    )
+
+    def __repr__(self) -> str:
+        return f"<AnalysisDailyStat(day={self.day}, salon_id={self.salon_id}, status='{self.status}', count={self.count})>"
+
+
+class AnalysisPayloadArchive(Base):
+    """Холодный архив результатов ИИ завершенных анализов (JSON, сжатый zlib)"""
+    __tablename__ = "analysis_payload_archive"
+
+    analysis_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    analysis_created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    payload: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    archived_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+
+    def __repr__(self) -> str:
+        return f"<AnalysisPayloadArchive(analysis_id={self.analysis_id})>"
+
+
+class SchedulerJobRun(Base):
+    """История запусков фоновых задач планировщика (на всех экземплярах бота)"""
+    __tablename__ = "scheduler_job_runs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    job_name: Mapped[str] = mapped_column(String(100), nullable=False)
+    # Плановое время запуска; уникально для задачи, поэтому запуск выполняет один экземпляр
+    scheduled_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    started_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    # running, success, failed, timeout, cancelled
+    status: Mapped[str] = mapped_column(String(20), nullable=False)
+    duration_ms: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    instance: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+
+    __table_args__ = (
+        Index('ux_scheduler_job_runs_job_name_scheduled_at', 'job_name', 'scheduled_at', unique=True),
+        Index('ix_scheduler_job_runs_started_at', 'started_at'),
+    )
+
+    def __repr__(self) -> str:
+        return f"<SchedulerJobRun(id={self.id}, job_name='{self.job_name}', status='{self.status}')>"
+
+
+class FsmState(Base):
+    """Состояние FSM диалога (общее для всех экземпляров бота)"""
+    __tablename__ = "fsm_states"
+
+    chat_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    bot_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    # 0 - сообщения вне темы форума
+    thread_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, default=0)
+    destiny: Mapped[str] = mapped_column(String(50), primary_key=True, default="default")
+    state: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    data: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index('ix_fsm_states_updated_at', 'updated_at'),
+        # Без журнала WAL: запись дешевле, при аварийном перезапуске Postgres таблица очищается
+        {'prefixes': ['UNLOGGED']},
+    )
+
+    def __repr__(self) -> str:
+        return f"<FsmState(chat_id={self.chat_id}, user_id={self.user_id}, state='{self.state}')>"
+
+
+class OutboxMessage(Base):
+    """Уведомление Telegram, записанное в одной транзакции с изменением данных"""
+    __tablename__ = "outbox"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    # Повторная постановка того же уведомления игнорируется
+    dedup_key: Mapped[str] = mapped_column(String(255), nullable=False)
+    chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    body: Mapped[str] = mapped_column(Text, nullable=False)
+    parse_mode: Mapped[Optional[str]] = mapped_column(String(20), nullable=True)
+    reply_markup: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
+    # Сообщение для изменения вместо отправки нового (например, "ИИ анализ запущен")
+    edit_message_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    # 0 - ответ пользователю, 1 - массовая рассылка (см. app/services/send_queue.py)
+    priority: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # pending, sent, failed
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default="pending")
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now(), nullable=False)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now(), nullable=False)
+    sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ux_outbox_dedup_key', 'dedup_key', unique=True),
+        # Очередь на отправку: только ожидающие уведомления
+        Index('ix_outbox_pending_next_attempt_at', 'next_attempt_at', postgresql_where=text("status = 'pending'")),
+        Index('ix_outbox_created_at', 'created_at'),
+    )
 
     def __repr__(self) -> str:
-        return f"<AIProcessingLog(id={self.id}, analysis_id={self.analysis_id}, step='{self.processing_step}')>"
\ No newline at end of file
+        return f"<OutboxMessage(id={self.id}, chat_id={self.chat_id}, status='{self.status}')>"
@@ -1,5 +1,9 @@
+from html import escape
+
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import (
+    Message, CallbackQuery, InlineQuery, InlineQueryResultArticle, InputTextMessageContent
+)
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
@@ -9,7 +13,11 @@ from app.middlewares.auth import OwnerOnlyMiddleware
 from app.keyboards.admin_kb import get_admin_main_menu, get_statistics_keyboard, get_back_button
 from app.states.admin_states import AdminStates
 from app.database.models import Owner, Salon, Master, Analysis, SystemLog
-from app.utils.helpers import format_datetime, hash_password, verify_password
+from app.services.leaderboards import get_salon_leaderboard, get_master_leaderboard
+from app.services.query_budget import query_budget
+from app.services.search import search_salons, search_masters
+from app.services.statistics import get_analysis_period_counts, get_dashboard_snapshot
+from app.utils.helpers import format_datetime, hash_password, verify_password, log_user_action
 from config.settings import settings
 
 # Импортируем модули с обработчиками
@@ -20,6 +28,7 @@ from .admin_settings import settings_router
 router = Router()
 router.message.middleware(OwnerOnlyMiddleware())
 router.callback_query.middleware(OwnerOnlyMiddleware())
+router.inline_query.middleware(OwnerOnlyMiddleware())
 
 # Подключаем дополнительные роутеры
 router.include_router(salon_router)
@@ -45,6 +54,7 @@ async def process_admin_password(message: Message, state: FSMContext, db_session
             reply_markup=get_admin_main_menu()
         )
         logger.info(f"Admin {message.from_user.id} successfully logged in")
+        await log_user_action(message.from_user.id, "admin_login")
     else:
         await message.answer(
             "❌ Неверный пароль. Попробуйте еще раз:",
@@ -76,41 +86,22 @@ async def statistics_menu(message: Message):
 @router.callback_query(F.data == "stats_general")
 async def general_statistics(callback: CallbackQuery, db_session: AsyncSession):
     """Общая статистика системы"""
-    # Подсчитываем статистику
-    salons_count = await db_session.scalar(
-        select(func.count(Salon.id)).where(Salon.is_active == True)
-    )
-    masters_count = await db_session.scalar(
-        select(func.count(Master.id)).where(Master.is_active == True)
-    )
-    analyses_count = await db_session.scalar(select(func.count(Analysis.id)))
+    from datetime import datetime
 
-    # Общая квота
-    total_quota = await db_session.scalar(
-        select(func.sum(Salon.quota_limit)).where(Salon.is_active == True)
-    ) or 0
-    used_quota = await db_session.scalar(
-        select(func.sum(Salon.quota_used)).where(Salon.is_active == True)
-    ) or 0
+    # Сводка одним запросом (с коротким кешем)
+    snapshot = await get_dashboard_snapshot(db_session)
+    total_quota = snapshot["total_quota"]
+    used_quota = snapshot["used_quota"]
 
     remaining_quota = total_quota - used_quota
     quota_percentage = (used_quota / total_quota * 100) if total_quota > 0 else 0
 
-    # Статистика за сегодня
-    from datetime import datetime, date
-    today = date.today()
-    today_analyses = await db_session.scalar(
-        select(func.count(Analysis.id)).where(
-            func.date(Analysis.created_at) == today
-        )
-    )
-
     await callback.message.edit_text(
         f"📊 *Общая статистика системы*\n\n"
-        f"🏢 Активных салонов: {salons_count}\n"
-        f"👤 Активных мастеров: {masters_count}\n"
-        f"📸 Всего анализов: {analyses_count}\n"
-        f"📅 Анализов сегодня: {today_analyses}\n\n"
+        f"🏢 Активных салонов: {snapshot['salons']}\n"
+        f"👤 Активных мастеров: {snapshot['masters']}\n"
+        f"📸 Всего анализов: {snapshot['analyses']}\n"
+        f"📅 Анализов сегодня: {snapshot['today_analyses']}\n\n"
         f"💰 *Квоты:*\n"
         f"📊 Общий лимит: {total_quota}\n"
         f"✅ Использовано: {used_quota}\n"
@@ -124,13 +115,11 @@ async def general_statistics(callback: CallbackQuery, db_session: AsyncSession):
 
 
 @router.callback_query(F.data == "stats_salons")
+@query_budget(3)
 async def salons_statistics(callback: CallbackQuery, db_session: AsyncSession):
     """Статистика по салонам"""
-    from sqlalchemy.orm import selectinload
-
-    query = select(Salon).where(Salon.is_active == True).order_by(Salon.quota_used.desc())
-    result = await db_session.execute(query)
-    salons = result.scalars().all()
+    leaderboard = await get_salon_leaderboard(db_session, limit=10)
+    salons = leaderboard["items"]
 
     if not salons:
         await callback.message.edit_text(
@@ -144,24 +133,17 @@ async def salons_statistics(callback: CallbackQuery, db_session: AsyncSession):
 
     stats_text = "📊 *ТОП салонов по активности*\n\n"
 
-    for i, salon in enumerate(salons[:10], 1):  # Топ-10
-        masters_count = await db_session.scalar(
-            select(func.count(Master.id)).where(
-                Master.salon_id == salon.id,
-                Master.is_active == True
-            )
-        )
-
-        usage_percent = (salon.quota_used / salon.quota_limit * 100) if salon.quota_limit > 0 else 0
+    for i, salon in enumerate(salons, 1):
+        usage_percent = (salon['quota_used'] / salon['quota_limit'] * 100) if salon['quota_limit'] > 0 else 0
         status_icon = "🟢" if usage_percent < 80 else "🟡" if usage_percent < 95 else "🔴"
 
         stats_text += (
-            f"{i}. {status_icon} *{salon.name}* ({salon.city})\n"
-            f"   👤 Мастеров: {masters_count} | 📸 Анализов: {salon.quota_used}\n"
-            f"   💰 Квоты: {salon.quota_used}/{salon.quota_limit} ({usage_percent:.1f}%)\n\n"
+            f"{i}. {status_icon} *{salon['name']}* ({salon['city']})\n"
+            f"   👤 Мастеров: {salon['masters_count']} | 📸 Анализов: {salon['quota_used']}\n"
+            f"   💰 Квоты: {salon['quota_used']}/{salon['quota_limit']} ({usage_percent:.1f}%)\n\n"
         )
 
-    stats_text += f"📊 Показано: {min(len(salons), 10)} из {len(salons)} салонов"
+    stats_text += f"📊 Показано: {len(salons)} из {leaderboard['total']} салонов"
 
     await callback.message.edit_text(
         stats_text,
@@ -172,15 +154,11 @@ async def salons_statistics(callback: CallbackQuery, db_session: AsyncSession):
 
 
 @router.callback_query(F.data == "stats_masters")
+@query_budget(3)
 async def masters_statistics(callback: CallbackQuery, db_session: AsyncSession):
     """Статистика по мастерам"""
-    from sqlalchemy.orm import selectinload
-
-    query = select(Master).options(selectinload(Master.salon)).where(
-        Master.is_active == True
-    ).order_by(Master.analyses_count.desc())
-    result = await db_session.execute(query)
-    masters = result.scalars().all()
+    leaderboard = await get_master_leaderboard(db_session, limit=15)
+    masters = leaderboard["items"]
 
     if not masters:
         await callback.message.edit_text(
@@ -194,21 +172,21 @@ async def masters_statistics(callback: CallbackQuery, db_session: AsyncSession):
 
     stats_text = "📊 *ТОП мастеров по анализам*\n\n"
 
-    total_analyses = sum(master.analyses_count for master in masters)
+    total_analyses = leaderboard["total_analyses"]
 
-    for i, master in enumerate(masters[:15], 1):  # Топ-15
-        salon_name = master.salon.name if master.salon else "Без салона"
-        percent = (master.analyses_count / total_analyses * 100) if total_analyses > 0 else 0
+    for i, master in enumerate(masters, 1):
+        salon_name = master['salon_name'] or "Без салона"
+        percent = (master['analyses_count'] / total_analyses * 100) if total_analyses > 0 else 0
 
         activity_icon = "🥇" if i <= 3 else "🥈" if i <= 8 else "🥉"
 
         stats_text += (
-            f"{i}. {activity_icon} *{master.name}*\n"
+            f"{i}. {activity_icon} *{master['name']}*\n"
             f"   🏢 {salon_name}\n"
-            f"   📸 {master.analyses_count} анализов ({percent:.1f}%)\n\n"
+            f"   📸 {master['analyses_count']} анализов ({percent:.1f}%)\n\n"
         )
 
-    stats_text += f"📊 Показано: {min(len(masters), 15)} из {len(masters)} мастеров"
+    stats_text += f"📊 Показано: {len(masters)} из {leaderboard['total']} мастеров"
 
     await callback.message.edit_text(
         stats_text,
@@ -228,26 +206,11 @@ async def period_statistics(callback: CallbackQuery, db_session: AsyncSession):
     week_ago = today - timedelta(days=7)
     month_ago = today - timedelta(days=30)
 
-    # Статистика за сегодня
-    today_analyses = await db_session.scalar(
-        select(func.count(Analysis.id)).where(
-            func.date(Analysis.created_at) == today
-        )
-    )
-
-    # Статистика за неделю
-    week_analyses = await db_session.scalar(
-        select(func.count(Analysis.id)).where(
-            func.date(Analysis.created_at) >= week_ago
-        )
-    )
-
-    # Статистика за месяц
-    month_analyses = await db_session.scalar(
-        select(func.count(Analysis.id)).where(
-            func.date(Analysis.created_at) >= month_ago
-        )
-    )
+    # Анализы за сегодня, неделю и месяц из суточных агрегатов
+    period_counts = await get_analysis_period_counts(db_session, today)
+    today_analyses = period_counts["today"]
+    week_analyses = period_counts["week"]
+    month_analyses = period_counts["month"]
 
     # Новые пользователи за неделю
     new_masters_week = await db_session.scalar(
@@ -304,6 +267,46 @@ async def cancel_action(message: Message, state: FSMContext):
     )
 
 
+# === ИНЛАЙН-ПОИСК ===
+@router.inline_query()
+async def inline_search(inline_query: InlineQuery, db_session: AsyncSession):
+    """Инлайн-поиск салонов и мастеров (@bot запрос)"""
+    query = inline_query.query.strip()
+    results = []
+
+    if not query.startswith("@"):
+        for salon in await search_salons(db_session, query, limit=10):
+            results.append(InlineQueryResultArticle(
+                id=f"s{salon['id']}",
+                title=f"🏢 {salon['name']}",
+                description=f"{salon['city']} • квоты {salon['quota_used']}/{salon['quota_limit']}",
+                input_message_content=InputTextMessageContent(
+                    message_text=(
+                        f"🏢 <b>{escape(salon['name'])}</b> ({escape(salon['city'])})\n"
+                        f"💰 Квоты: {salon['quota_used']}/{salon['quota_limit']}"
+                    )
+                )
+            ))
+
+    for master in await search_masters(db_session, query, limit=10):
+        username = f" @{master['telegram_username']}" if master['telegram_username'] else ""
+        results.append(InlineQueryResultArticle(
+            id=f"m{master['id']}",
+            title=f"👤 {master['name']}{username}",
+            description=f"{master['salon_name']} • анализов: {master['analyses_count']}",
+            input_message_content=InputTextMessageContent(
+                message_text=(
+                    f"👤 <b>{escape(master['name'])}</b>{escape(username)}\n"
+                    f"🏢 {escape(master['salon_name'])}\n"
+                    f"💬 Telegram ID: <code>{master['telegram_id']}</code>\n"
+                    f"📸 Анализов: {master['analyses_count']}"
+                )
+            )
+        ))
+
+    await inline_query.answer(results, cache_time=settings.SEARCH_CACHE_TTL, is_personal=True)
+
+
 # === СИСТЕМНАЯ ИНФОРМАЦИЯ ===
 @router.callback_query(F.data == "system_info")
 async def system_info(callback: CallbackQuery, db_session: AsyncSession):
@@ -1,3 +1,6 @@
+from datetime import date, timedelta
+from html import escape
+
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
@@ -9,7 +12,13 @@ from loguru import logger
 from app.keyboards.admin_kb import *
 from app.states.admin_states import AdminStates
 from app.database.models import Salon, Master, Analysis
-from app.utils.helpers import format_datetime, validate_telegram_username
+from app.services.rollups import count_analyses
+from app.services.listings import (
+    get_master_list_markup, get_salon_selection_markup, invalidate_listings, parse_page_callback
+)
+from app.services.search import MIN_QUERY_LENGTH, search_masters, invalidate_search
+from app.services.statistics import get_dashboard_snapshot, invalidate_dashboard
+from app.utils.helpers import format_datetime, validate_telegram_username, log_user_action
 
 master_router = Router()
 
@@ -113,12 +122,10 @@ async def process_master_telegram(message: Message, state: FSMContext, db_sessio
 
     await state.update_data(telegram_id=telegram_id)
 
-    # Получаем список активных салонов для выбора
-    query = select(Salon).where(Salon.is_active == True).order_by(Salon.name, Salon.city)
-    result = await db_session.execute(query)
-    salons = result.scalars().all()
+    # Первая страница активных салонов для выбора
+    markup = await get_salon_selection_markup(db_session, "select_salon_for_master")
 
-    if not salons:
+    if markup is None:
         await message.answer(
             "❌ Нет активных салонов для привязки мастера.",
             reply_markup=get_admin_main_menu()
@@ -126,26 +133,38 @@ async def process_master_telegram(message: Message, state: FSMContext, db_sessio
         await state.clear()
         return
 
-    salons_data = [
-        {
-            'id': salon.id,
-            'name': salon.name,
-            'city': salon.city
-        }
-        for salon in salons
-    ]
-
     data = await state.get_data()
 
     await message.answer(
         f"👤 Имя: *{data['master_name']}*\n"
         f"💬 Telegram ID: `{telegram_id}`\n\n"
         f"🏢 Выберите салон для мастера:",
-        reply_markup=get_salon_selection_keyboard(salons_data, "select_salon_for_master"),
+        reply_markup=markup,
         parse_mode="Markdown"
     )
     await state.set_state(AdminStates.waiting_for_master_salon)
 
+
+@master_router.callback_query(F.data.startswith("ssp:select_salon_for_master:"))
+@master_router.callback_query(F.data.startswith("ssp:new_salon_for_master:"))
+async def master_salon_page(callback: CallbackQuery, state: FSMContext, db_session: AsyncSession):
+    """Перелистывание списка салонов при выборе салона для мастера"""
+    action = callback.data.split(":")[1]
+    direction, cursor = parse_page_callback(callback.data)
+
+    exclude_id = None
+    if action == "new_salon_for_master":
+        exclude_id = (await state.get_data()).get("exclude_salon_id")
+
+    markup = await get_salon_selection_markup(db_session, action, direction, cursor, exclude_id)
+
+    if markup is None:
+        await callback.answer("❌ Нет доступных активных салонов", show_alert=True)
+        return
+
+    await callback.message.edit_reply_markup(reply_markup=markup)
+    await callback.answer()
+
 @master_router.callback_query(F.data.startswith("select_salon_for_master_"))
 async def process_master_salon(callback: CallbackQuery, state: FSMContext, db_session: AsyncSession):
     """Обработка выбора салона для мастера"""
@@ -173,6 +192,9 @@ async def process_master_salon(callback: CallbackQuery, state: FSMContext, db_se
     try:
         db_session.add(new_master)
         await db_session.commit()
+        invalidate_dashboard()
+        invalidate_listings()
+        invalidate_search()
         await db_session.refresh(new_master)
 
         await state.clear()
@@ -188,6 +210,10 @@ async def process_master_salon(callback: CallbackQuery, state: FSMContext, db_se
         )
 
         logger.info(f"New master created: {new_master.name} (ID: {new_master.telegram_id}) for salon {salon.name}")
+        await log_user_action(
+            callback.from_user.id, "master_created",
+            {"master_id": new_master.id, "telegram_id": new_master.telegram_id, "salon_id": salon.id}
+        )
         await callback.answer("Мастер создан!")
 
     except Exception as e:
@@ -202,15 +228,16 @@ async def process_master_salon(callback: CallbackQuery, state: FSMContext, db_se
 
 # === СПИСОК МАСТЕРОВ ===
 @master_router.callback_query(F.data == "list_masters")
+@master_router.callback_query(F.data.startswith("mpg:"))
 async def list_masters(callback: CallbackQuery, db_session: AsyncSession):
-    """Список всех мастеров"""
-    query = select(Master).options(selectinload(Master.salon)).where(
-        Master.is_active == True
-    ).order_by(Master.name)
-    result = await db_session.execute(query)
-    masters = result.scalars().all()
+    """Список мастеров (постранично)"""
+    direction, cursor = None, None
+    if callback.data.startswith("mpg:"):
+        direction, cursor = parse_page_callback(callback.data)
 
-    if not masters:
+    markup = await get_master_list_markup(db_session, direction, cursor)
+
+    if markup is None:
         await callback.message.edit_text(
             "📋 *Список мастеров*\n\n"
             "Мастера не найдены.\n"
@@ -221,24 +248,60 @@ async def list_masters(callback: CallbackQuery, db_session: AsyncSession):
         await callback.answer()
         return
 
-    masters_data = [
-        {
-            'id': master.id,
-            'name': master.name,
-            'salon_name': master.salon.name if master.salon else "Салон удален"
-        }
-        for master in masters
-    ]
+    snapshot = await get_dashboard_snapshot(db_session)
 
     await callback.message.edit_text(
-        f"📋 *Список мастеров* ({len(masters)})\n\n"
+        f"📋 *Список мастеров* ({snapshot['masters']})\n\n"
         "Выберите мастера для просмотра детальной информации:",
-        reply_markup=get_master_list_keyboard(masters_data),
+        reply_markup=markup,
+        parse_mode="Markdown"
+    )
+    await callback.answer()
+
+# === ПОИСК МАСТЕРОВ ===
+@master_router.callback_query(F.data == "search_masters")
+async def search_masters_start(callback: CallbackQuery, state: FSMContext):
+    """Начало поиска мастера"""
+    await callback.message.edit_text(
+        "🔍 *Поиск мастера*\n\n"
+        "Введите часть имени или @username:",
+        reply_markup=get_back_button("back_to_masters"),
         parse_mode="Markdown"
     )
+    await state.set_state(AdminStates.waiting_for_master_search)
     await callback.answer()
 
 
+@master_router.message(AdminStates.waiting_for_master_search)
+async def process_master_search(message: Message, state: FSMContext, db_session: AsyncSession):
+    """Обработка поискового запроса по мастерам"""
+    query = (message.text or "").strip()
+
+    if len(query.lstrip("@")) < MIN_QUERY_LENGTH:
+        await message.answer(
+            f"❌ Запрос должен содержать минимум {MIN_QUERY_LENGTH} символа. Попробуйте еще раз:",
+            reply_markup=get_cancel_keyboard()
+        )
+        return
+
+    masters = await search_masters(db_session, query)
+    await state.clear()
+
+    if not masters:
+        await message.answer(
+            f"🔍 По запросу «{escape(query)}» мастера не найдены.",
+            reply_markup=get_back_button("search_masters")
+        )
+        return
+
+    await message.answer(
+        f"🔍 *Результаты поиска* ({len(masters)})\n\n"
+        "Выберите мастера для просмотра детальной информации:",
+        reply_markup=get_master_list_keyboard(masters),
+        parse_mode="Markdown"
+    )
+
+
 # === ДЕТАЛИ МАСТЕРА ===
 @master_router.callback_query(F.data.startswith("master_"))
 async def show_master_details(callback: CallbackQuery, db_session: AsyncSession):
@@ -258,12 +321,7 @@ async def show_master_details(callback: CallbackQuery, db_session: AsyncSession)
     salon_info = f"{master.salon.name} ({master.salon.city})" if master.salon else "❌ Салон не найден"
 
     # Получаем статистику мастера
-    analyses_today = await db_session.scalar(
-        select(func.count(Analysis.id)).where(
-            Analysis.master_id == master_id,
-            func.date(Analysis.created_at) == func.current_date()
-        )
-    )
+    analyses_today = await count_analyses(db_session, since=date.today(), master_id=master_id)
 
     # Статус активности
     if master.salon and master.salon.is_active:
@@ -390,6 +448,8 @@ async def process_master_new_name(message: Message, state: FSMContext, db_sessio
     master.name = new_name
 
     await db_session.commit()
+    invalidate_listings()
+    invalidate_search()
     await state.clear()
 
     await message.answer(
@@ -400,6 +460,9 @@ async def process_master_new_name(message: Message, state: FSMContext, db_sessio
     )
 
     logger.info(f"Master name changed from '{old_name}' to '{new_name}' (ID: {master_id})")
+    await log_user_action(
+        message.from_user.id, "master_renamed", {"master_id": master_id, "old": old_name, "new": new_name}
+    )
 
 
 @master_router.callback_query(F.data.startswith("edit_master_telegram_"))
@@ -499,6 +562,10 @@ async def process_master_new_telegram(message: Message, state: FSMContext, db_se
     )
 
     logger.info(f"Master telegram_id changed from {old_telegram_id} to {new_telegram_id} (ID: {master_id})")
+    await log_user_action(
+        message.from_user.id, "master_telegram_changed",
+        {"master_id": master_id, "old": old_telegram_id, "new": new_telegram_id}
+    )
 
 
 # === СМЕНА САЛОНА МАСТЕРА ===
@@ -518,24 +585,10 @@ async def change_master_salon(callback: CallbackQuery, state: FSMContext, db_ses
         await callback.answer("❌ Мастер не найден", show_alert=True)
         return
 
-    # Получаем список активных салонов
-    query = select(Salon).where(Salon.is_active == True).order_by(Salon.name, Salon.city)
-    result = await db_session.execute(query)
-    salons = result.scalars().all()
-
-    if not salons:
-        await callback.message.edit_text(
-            "❌ Нет доступных активных салонов для перевода мастера.",
-            reply_markup=get_back_button(f"master_{master_id}"),
-            parse_mode="Markdown"
-        )
-        await callback.answer()
-        return
-
-    # Убираем текущий салон из списка, если он есть
-    available_salons = [salon for salon in salons if salon.id != master.salon_id]
+    # Первая страница активных салонов без текущего салона мастера
+    markup = await get_salon_selection_markup(db_session, "new_salon_for_master", exclude_id=master.salon_id)
 
-    if not available_salons:
+    if markup is None:
         await callback.message.edit_text(
             "❌ Нет других доступных салонов для перевода мастера.",
             reply_markup=get_back_button(f"master_{master_id}"),
@@ -544,25 +597,16 @@ async def change_master_salon(callback: CallbackQuery, state: FSMContext, db_ses
         await callback.answer()
         return
 
-    salons_data = [
-        {
-            'id': salon.id,
-            'name': salon.name,
-            'city': salon.city
-        }
-        for salon in available_salons
-    ]
-
     current_salon = f"{master.salon.name} ({master.salon.city})" if master.salon else "Не указан"
 
-    await state.update_data(master_id=master_id)
+    await state.update_data(master_id=master_id, exclude_salon_id=master.salon_id)
 
     await callback.message.edit_text(
         f"🔄 *Смена салона мастера*\n\n"
         f"👤 Мастер: {master.name}\n"
         f"🏢 Текущий салон: {current_salon}\n\n"
         f"Выберите новый салон:",
-        reply_markup=get_salon_selection_keyboard(salons_data, "new_salon_for_master"),
+        reply_markup=markup,
         parse_mode="Markdown"
     )
     await callback.answer()
@@ -597,6 +641,8 @@ async def process_new_salon_for_master(callback: CallbackQuery, state: FSMContex
     master.salon_id = salon_id
 
     await db_session.commit()
+    invalidate_listings()
+    invalidate_search()
     await state.clear()
 
     await callback.message.edit_text(
@@ -609,6 +655,10 @@ async def process_new_salon_for_master(callback: CallbackQuery, state: FSMContex
     )
 
     logger.info(f"Master {master.name} moved from salon {old_salon_info} to {new_salon.name}")
+    await log_user_action(
+        callback.from_user.id, "master_moved",
+        {"master_id": master.id, "old_salon_id": old_salon.id if old_salon else None, "new_salon_id": salon_id}
+    )
     await callback.answer("Салон изменен!")
 
 
@@ -631,14 +681,8 @@ async def confirm_delete_master(callback: CallbackQuery, db_session: AsyncSessio
     salon_info = f"{master.salon.name} ({master.salon.city})" if master.salon else "❌ Салон удален"
 
     # Получаем количество анализов за последние 30 дней
-    from datetime import datetime, timedelta
-    month_ago = datetime.now() - timedelta(days=30)
-    recent_analyses = await db_session.scalar(
-        select(func.count(Analysis.id)).where(
-            Analysis.master_id == master_id,
-            Analysis.created_at >= month_ago
-        )
-    )
+    month_ago = date.today() - timedelta(days=30)
+    recent_analyses = await count_analyses(db_session, since=month_ago, master_id=master_id)
 
     await callback.message.edit_text(
         f"🗑️ *Удаление мастера*\n\n"
@@ -682,6 +726,9 @@ async def delete_master(callback: CallbackQuery, db_session: AsyncSession):
     master.is_active = False
 
     await db_session.commit()
+    invalidate_dashboard()
+    invalidate_listings()
+    invalidate_search()
 
     await callback.message.edit_text(
         f"✅ Мастер удален\n\n"
@@ -692,6 +739,7 @@ async def delete_master(callback: CallbackQuery, db_session: AsyncSession):
     )
 
     logger.info(f"Master deactivated: {master_name} (ID: {master_id}, Telegram: {telegram_id})")
+    await log_user_action(callback.from_user.id, "master_deleted", {"master_id": master_id, "telegram_id": telegram_id})
     await callback.answer()
 
 
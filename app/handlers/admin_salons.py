@@ -1,3 +1,5 @@
+from html import escape
+
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
@@ -8,7 +10,14 @@ from loguru import logger
 from app.keyboards.admin_kb import *
 from app.states.admin_states import AdminStates
 from app.database.models import Salon, Master, Analysis
-from app.utils.helpers import format_datetime
+from app.services.outbox import enqueue_broadcast
+from app.services.rollups import count_analyses
+from app.services.listings import (
+    get_salon_list_markup, get_salon_selection_markup, invalidate_listings, parse_page_callback
+)
+from app.services.search import MIN_QUERY_LENGTH, search_salons, invalidate_search
+from app.services.statistics import get_dashboard_snapshot, invalidate_dashboard
+from app.utils.helpers import format_datetime, log_user_action
 
 salon_router = Router()
 
@@ -155,6 +164,9 @@ async def process_salon_quota(message: Message, state: FSMContext, db_session: A
 
     db_session.add(new_salon)
     await db_session.commit()
+    invalidate_dashboard()
+    invalidate_listings()
+    invalidate_search()
     await db_session.refresh(new_salon)
 
     await state.clear()
@@ -168,17 +180,23 @@ async def process_salon_quota(message: Message, state: FSMContext, db_session: A
     )
 
     logger.info(f"New salon created: {new_salon.name} in {new_salon.city} with quota {new_salon.quota_limit}")
+    await log_user_action(
+        message.from_user.id, "salon_created", {"salon_id": new_salon.id, "quota_limit": new_salon.quota_limit}
+    )
 
 
 # === СПИСОК САЛОНОВ ===
 @salon_router.callback_query(F.data == "list_salons")
+@salon_router.callback_query(F.data.startswith("spg:"))
 async def list_salons(callback: CallbackQuery, db_session: AsyncSession):
-    """Список всех салонов"""
-    query = select(Salon).where(Salon.is_active == True).order_by(Salon.name)
-    result = await db_session.execute(query)
-    salons = result.scalars().all()
+    """Список салонов (постранично)"""
+    direction, cursor = None, None
+    if callback.data.startswith("spg:"):
+        direction, cursor = parse_page_callback(callback.data)
 
-    if not salons:
+    markup = await get_salon_list_markup(db_session, direction, cursor)
+
+    if markup is None:
         await callback.message.edit_text(
             "📋 *Список салонов*\n\n"
             "Салоны не найдены.\n"
@@ -189,19 +207,12 @@ async def list_salons(callback: CallbackQuery, db_session: AsyncSession):
         await callback.answer()
         return
 
-    salons_data = [
-        {
-            'id': salon.id,
-            'name': salon.name,
-            'city': salon.city
-        }
-        for salon in salons
-    ]
+    snapshot = await get_dashboard_snapshot(db_session)
 
     await callback.message.edit_text(
-        f"📋 *Список салонов* ({len(salons)})\n\n"
+        f"📋 *Список салонов* ({snapshot['salons']})\n\n"
         "Выберите салон для просмотра детальной информации:",
-        reply_markup=get_salon_list_keyboard(salons_data),
+        reply_markup=markup,
         parse_mode="Markdown"
     )
     await callback.answer()
@@ -230,9 +241,7 @@ async def show_salon_details(callback: CallbackQuery, db_session: AsyncSession):
     )
 
     # Считаем количество анализов
-    analyses_count = await db_session.scalar(
-        select(func.count(Analysis.id)).where(Analysis.salon_id == salon_id)
-    )
+    analyses_count = await count_analyses(db_session, salon_id=salon_id)
 
     quota_percentage = (salon.quota_used / salon.quota_limit * 100) if salon.quota_limit > 0 else 0
     status_icon = "🟢" if quota_percentage < 80 else "🟡" if quota_percentage < 95 else "🔴"
@@ -370,6 +379,8 @@ async def process_salon_new_name(message: Message, state: FSMContext, db_session
     salon.name = new_name
 
     await db_session.commit()
+    invalidate_listings()
+    invalidate_search()
     await state.clear()
 
     await message.answer(
@@ -380,6 +391,9 @@ async def process_salon_new_name(message: Message, state: FSMContext, db_session
     )
 
     logger.info(f"Salon name changed from '{old_name}' to '{new_name}' (ID: {salon_id})")
+    await log_user_action(
+        message.from_user.id, "salon_renamed", {"salon_id": salon_id, "old": old_name, "new": new_name}
+    )
 
 
 @salon_router.callback_query(F.data.startswith("edit_salon_city_"))
@@ -469,6 +483,8 @@ async def process_salon_new_city(message: Message, state: FSMContext, db_session
     salon.city = new_city
 
     await db_session.commit()
+    invalidate_listings()
+    invalidate_search()
     await state.clear()
 
     await message.answer(
@@ -479,6 +495,9 @@ async def process_salon_new_city(message: Message, state: FSMContext, db_session
     )
 
     logger.info(f"Salon city changed from '{old_city}' to '{new_city}' (ID: {salon_id})")
+    await log_user_action(
+        message.from_user.id, "salon_city_changed", {"salon_id": salon_id, "old": old_city, "new": new_city}
+    )
 
 
 @salon_router.callback_query(F.data.startswith("edit_salon_quota_"))
@@ -553,7 +572,12 @@ async def process_salon_new_quota(message: Message, state: FSMContext, db_sessio
 
     salon.quota_limit = new_quota
 
+    # Мастерам салона - уведомление о пополнении, в одной транзакции с новой квотой
+    if new_quota > old_quota and salon.is_active:
+        await notify_masters_about_quota(db_session, salon, message.message_id)
+
     await db_session.commit()
+    invalidate_dashboard()
     await state.clear()
 
     status_icon = "🟢" if salon.quota_remaining > 0 else "🔴"
@@ -568,18 +592,78 @@ async def process_salon_new_quota(message: Message, state: FSMContext, db_sessio
     )
 
     logger.info(f"Salon quota changed from {old_quota} to {new_quota} (ID: {salon_id})")
+    await log_user_action(
+        message.from_user.id, "salon_quota_changed", {"salon_id": salon_id, "old": old_quota, "new": new_quota}
+    )
+
+
+async def notify_masters_about_quota(db_session: AsyncSession, salon: Salon, change_id: int):
+    """Постановка уведомлений о пополнении квоты в outbox (change_id - сообщение администратора)"""
+    masters = await db_session.scalars(
+        select(Master.telegram_id).where(Master.salon_id == salon.id, Master.is_active == True)
+    )
+    await enqueue_broadcast(
+        db_session,
+        f"salon:{salon.id}:quota:{change_id}",
+        masters.all(),
+        f"💰 *Квота салона пополнена*\n\n"
+        f"Доступно анализов: {salon.quota_remaining}",
+        parse_mode="Markdown"
+    )
+
+
+# === ПОИСК САЛОНОВ ===
+@salon_router.callback_query(F.data == "search_salons")
+async def search_salons_start(callback: CallbackQuery, state: FSMContext):
+    """Начало поиска салона"""
+    await callback.message.edit_text(
+        "🔍 *Поиск салона*\n\n"
+        "Введите часть названия или города:",
+        reply_markup=get_back_button("back_to_salons"),
+        parse_mode="Markdown"
+    )
+    await state.set_state(AdminStates.waiting_for_salon_search)
+    await callback.answer()
+
+
+@salon_router.message(AdminStates.waiting_for_salon_search)
+async def process_salon_search(message: Message, state: FSMContext, db_session: AsyncSession):
+    """Обработка поискового запроса по салонам"""
+    query = (message.text or "").strip()
+
+    if len(query) < MIN_QUERY_LENGTH:
+        await message.answer(
+            f"❌ Запрос должен содержать минимум {MIN_QUERY_LENGTH} символа. Попробуйте еще раз:",
+            reply_markup=get_cancel_keyboard()
+        )
+        return
+
+    salons = await search_salons(db_session, query)
+    await state.clear()
+
+    if not salons:
+        await message.answer(
+            f"🔍 По запросу «{escape(query)}» салоны не найдены.",
+            reply_markup=get_back_button("search_salons")
+        )
+        return
+
+    await message.answer(
+        f"🔍 *Результаты поиска* ({len(salons)})\n\n"
+        "Выберите салон для просмотра детальной информации:",
+        reply_markup=get_salon_list_keyboard(salons),
+        parse_mode="Markdown"
+    )
 
 
 # === ПОПОЛНЕНИЕ КВОТ ===
 @salon_router.message(F.text == "💰 Пополнить квоты")
 async def quota_refill_menu(message: Message, db_session: AsyncSession):
     """Меню пополнения квот"""
-    # Получаем список салонов
-    query = select(Salon).where(Salon.is_active == True).order_by(Salon.name)
-    result = await db_session.execute(query)
-    salons = result.scalars().all()
+    # Первая страница списка салонов
+    markup = await get_salon_selection_markup(db_session, "quota_salon")
 
-    if not salons:
+    if markup is None:
         await message.answer(
             "❌ Активные салоны не найдены.\n"
             "Сначала добавьте салоны для работы.",
@@ -587,23 +671,28 @@ async def quota_refill_menu(message: Message, db_session: AsyncSession):
         )
         return
 
-    salons_data = [
-        {
-            'id': salon.id,
-            'name': salon.name,
-            'city': salon.city
-        }
-        for salon in salons
-    ]
-
     await message.answer(
         "💰 *Пополнение квот*\n\n"
         "Выберите салон для пополнения квот:",
-        reply_markup=get_salon_selection_keyboard(salons_data, "quota_salon"),
+        reply_markup=markup,
         parse_mode="Markdown"
     )
 
 
+@salon_router.callback_query(F.data.startswith("ssp:quota_salon:"))
+async def quota_refill_page(callback: CallbackQuery, db_session: AsyncSession):
+    """Перелистывание списка салонов для пополнения квот"""
+    direction, cursor = parse_page_callback(callback.data)
+    markup = await get_salon_selection_markup(db_session, "quota_salon", direction, cursor)
+
+    if markup is None:
+        await callback.answer("❌ Активные салоны не найдены", show_alert=True)
+        return
+
+    await callback.message.edit_reply_markup(reply_markup=markup)
+    await callback.answer()
+
+
 @salon_router.callback_query(F.data.startswith("quota_salon_"))
 async def select_salon_for_quota(callback: CallbackQuery, state: FSMContext, db_session: AsyncSession):
     """Выбор салона для пополнения квот"""
@@ -721,6 +810,7 @@ async def process_quota_amount(message: Message, state: FSMContext, db_session:
     salon.quota_limit = new_limit
 
     await db_session.commit()
+    invalidate_dashboard()
     await db_session.refresh(salon)
 
     await state.clear()
@@ -736,6 +826,10 @@ async def process_quota_amount(message: Message, state: FSMContext, db_session:
     )
 
     logger.info(f"Quota refilled for salon {salon.name}: +{amount} (total: {salon.quota_limit})")
+    await log_user_action(
+        message.from_user.id, "salon_quota_refilled",
+        {"salon_id": salon.id, "amount": amount, "quota_limit": salon.quota_limit}
+    )
 
 
 # === УДАЛЕНИЕ САЛОНА ===
@@ -761,9 +855,7 @@ async def confirm_delete_salon(callback: CallbackQuery, db_session: AsyncSession
     )
 
     # Считаем количество анализов
-    analyses_count = await db_session.scalar(
-        select(func.count(Analysis.id)).where(Analysis.salon_id == salon_id)
-    )
+    analyses_count = await count_analyses(db_session, salon_id=salon_id)
 
     await callback.message.edit_text(
         f"🗑️ *Удаление салона*\n\n"
@@ -813,6 +905,9 @@ async def delete_salon(callback: CallbackQuery, db_session: AsyncSession):
     masters_deactivated = len(masters_result.fetchall())
 
     await db_session.commit()
+    invalidate_dashboard()
+    invalidate_listings()
+    invalidate_search()
 
     await callback.message.edit_text(
         f"✅ Салон удален\n\n"
@@ -823,6 +918,9 @@ async def delete_salon(callback: CallbackQuery, db_session: AsyncSession):
     )
 
     logger.info(f"Salon deactivated: {salon_name} (ID: {salon_id}), masters deactivated: {masters_deactivated}")
+    await log_user_action(
+        callback.from_user.id, "salon_deleted", {"salon_id": salon_id, "masters_deactivated": masters_deactivated}
+    )
     await callback.answer()
 
 
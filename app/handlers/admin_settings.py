@@ -1,15 +1,36 @@
+import asyncio
+import os
+import tempfile
+import time
+from html import escape
+from typing import Optional
+
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, FSInputFile
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, text
 from loguru import logger
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
-from app.keyboards.admin_kb import get_settings_keyboard, get_back_button, get_cancel_keyboard, get_admin_main_menu
+from app.keyboards.admin_kb import (
+    get_settings_keyboard, get_back_button, get_cancel_keyboard, get_admin_main_menu,
+    get_backup_keyboard, get_export_kind_keyboard, get_export_period_keyboard, get_export_salon_keyboard
+)
 from app.states.admin_states import AdminStates
 from app.database.models import Owner, SystemLog, Analysis, Master, Salon
-from app.utils.helpers import format_datetime, hash_password, verify_password
+from app.services.audit import drop_expired_logs
+from app.services.backup import create_backup, list_backups
+from app.services.exports import EXPORT_KINDS, export_to_files, count_export_rows
+from app.services.fsm_storage import BoundedMemoryStorage
+from app.services.outbox import count_outbox
+from app.services.listings import get_salon_selection_markup, parse_page_callback
+from app.services.scheduler import scheduler, get_recent_runs
+from app.services.statistics import get_dashboard_snapshot, invalidate_dashboard
+from app.services.send_queue import outbound_dispatcher
+from app.services.update_executor import update_executor
+from app.utils.helpers import format_datetime, hash_password, verify_password, log_user_action
+from config.settings import settings
 
 settings_router = Router()
 
@@ -211,39 +232,20 @@ async def refresh_data(callback: CallbackQuery, db_session: AsyncSession):
 
     # Подсчитываем актуальную статистику
     try:
-        salons_count = await db_session.scalar(
-            select(func.count(Salon.id)).where(Salon.is_active == True)
-        )
-        masters_count = await db_session.scalar(
-            select(func.count(Master.id)).where(Master.is_active == True)
-        )
-        analyses_count = await db_session.scalar(select(func.count(Analysis.id)))
-
-        # Статистика за сегодня
-        today_analyses = await db_session.scalar(
-            select(func.count(Analysis.id)).where(
-                func.date(Analysis.created_at) == func.current_date()
-            )
-        )
-
-        # Общие квоты
-        total_quota = await db_session.scalar(
-            select(func.sum(Salon.quota_limit)).where(Salon.is_active == True)
-        ) or 0
-        used_quota = await db_session.scalar(
-            select(func.sum(Salon.quota_used)).where(Salon.is_active == True)
-        ) or 0
-
-        # Проверяем соединение с БД
-        await db_session.execute(text("SELECT 1"))
+        # Принудительное обновление: сбрасываем кеш и считаем сводку заново
+        # (этот же запрос проверяет соединение с БД)
+        invalidate_dashboard()
+        snapshot = await get_dashboard_snapshot(db_session)
+        total_quota = snapshot["total_quota"]
+        used_quota = snapshot["used_quota"]
 
         await callback.message.edit_text(
             f"🔄 *Данные обновлены*\n\n"
             f"📊 *Текущая статистика:*\n"
-            f"🏢 Активных салонов: {salons_count}\n"
-            f"👤 Активных мастеров: {masters_count}\n"
-            f"📸 Всего анализов: {analyses_count}\n"
-            f"📅 Анализов сегодня: {today_analyses}\n\n"
+            f"🏢 Активных салонов: {snapshot['salons']}\n"
+            f"👤 Активных мастеров: {snapshot['masters']}\n"
+            f"📸 Всего анализов: {snapshot['analyses']}\n"
+            f"📅 Анализов сегодня: {snapshot['today_analyses']}\n\n"
             f"💰 *Квоты:*\n"
             f"📊 Общий лимит: {total_quota}\n"
             f"✅ Использовано: {used_quota}\n"
@@ -277,7 +279,7 @@ async def clear_logs_confirm(callback: CallbackQuery):
     await callback.message.edit_text(
         "🗑️ *Очистка системных логов*\n\n"
         "⚠️ *Внимание!*\n"
-        "Это действие удалит все записи логов старше 30 дней.\n"
+        "Это действие удалит записи логов за месяцы, целиком старше 30 дней.\n"
         "Данные нельзя будет восстановить.\n\n"
         "Продолжить?",
         reply_markup=get_confirmation_keyboard("clear_logs", 0),
@@ -290,30 +292,24 @@ async def clear_logs_confirm(callback: CallbackQuery):
 async def clear_logs_execute(callback: CallbackQuery, db_session: AsyncSession):
     """Выполнение очистки логов"""
     try:
-        # Удаляем записи логов старше 30 дней
+        # Удаляем месячные секции логов, целиком старше 30 дней (без построчного DELETE)
         cutoff_date = datetime.now() - timedelta(days=30)
-
-        result = await db_session.execute(
-            text("DELETE FROM system_logs WHERE created_at < :cutoff_date"),
-            {"cutoff_date": cutoff_date}
-        )
-
-        deleted_count = result.rowcount
-        await db_session.commit()
+        dropped = await drop_expired_logs(retention_days=30)
+        months = ", ".join(f"{name[-2:]}.{name[-7:-3]}" for name in dropped)
 
         await callback.message.edit_text(
             f"✅ *Логи очищены*\n\n"
-            f"Удалено записей: {deleted_count}\n"
+            f"Удалено месяцев: {len(dropped)}" + (f" ({months})" if months else "") + "\n"
             f"Удалены записи старше: {format_datetime(cutoff_date)}\n\n"
             f"🕐 Выполнено: {format_datetime(datetime.now())}",
             reply_markup=get_back_button("back_to_settings"),
             parse_mode="Markdown"
         )
 
-        logger.info(f"System logs cleared: {deleted_count} records deleted")
+        logger.info(f"System logs cleared: {len(dropped)} partitions dropped")
+        await log_user_action(callback.from_user.id, "system_logs_cleared", {"partitions": dropped})
 
     except Exception as e:
-        await db_session.rollback()
         logger.error(f"Error clearing logs: {e}")
 
         await callback.message.edit_text(
@@ -336,31 +332,129 @@ async def cancel_clear_logs(callback: CallbackQuery):
     await callback.answer()
 
 
+# === ФОНОВЫЕ ЗАДАЧИ ===
+JOB_STATUS_ICONS = {
+    "running": "🔵",
+    "success": "🟢",
+    "failed": "🔴",
+    "timeout": "🟠",
+    "cancelled": "⚪",
+}
+
+
+@settings_router.callback_query(F.data == "scheduler_jobs")
+async def scheduler_jobs(callback: CallbackQuery, db_session: AsyncSession):
+    """Расписание фоновых задач и история их запусков"""
+    jobs_text = "🗓 <b>Фоновые задачи</b>\n\n"
+
+    if not scheduler.jobs:
+        jobs_text += "Задачи не запланированы.\n\n"
+
+    for job in scheduler.jobs:
+        icon = JOB_STATUS_ICONS.get(job.last_status, "⏳")
+        jobs_text += f"{icon} <b>{escape(job.name)}</b> ({escape(job.schedule)})\n"
+        if job.next_run_at:
+            jobs_text += f"   Следующий запуск: {format_datetime(job.next_run_at)}\n"
+        if job.last_started_at:
+            jobs_text += (
+                f"   Последний запуск здесь: {format_datetime(job.last_started_at)}, "
+                f"{job.last_duration:.1f} с\n"
+            )
+        jobs_text += f"   Запусков: {job.runs}, ошибок: {job.failures}, пропущено: {job.skipped}\n\n"
+
+    runs = await get_recent_runs(db_session, limit=10)
+    if runs:
+        jobs_text += "📋 <b>Последние запуски (все экземпляры)</b>\n\n"
+        for run in runs:
+            icon = JOB_STATUS_ICONS.get(run.status, "❓")
+            duration = f", {run.duration_ms / 1000:.1f} с" if run.duration_ms is not None else ""
+            jobs_text += f"{icon} {format_datetime(run.started_at)} {escape(run.job_name)}{duration}\n"
+            if run.error:
+                jobs_text += f"   <i>{escape(run.error[:200])}</i>\n"
+
+    await callback.message.edit_text(jobs_text, reply_markup=get_back_button("back_to_settings"))
+    await callback.answer()
+
+
 # === БЭКАП ДАННЫХ ===
+# Флаг выполняющегося резервного копирования, запущенного из панели
+_backup_running = False
+
+
+def _format_size(size: int) -> str:
+    return f"{size / 1024 / 1024:.1f} МБ"
+
+
 @settings_router.callback_query(F.data == "backup_data")
 async def backup_data_info(callback: CallbackQuery):
-    """Информация о резервном копировании"""
-    await callback.message.edit_text(
-        "💾 *Резервное копирование*\n\n"
-        "🔧 *Для создания бэкапа базы данных:*\n\n"
-        "1. **PostgreSQL:**\n"
-        "`pg_dump -h localhost -U postgres hair_analysis_bot > backup.sql`\n\n"
-        "2. **Восстановление:**\n"
-        "`psql -h localhost -U postgres hair_analysis_bot < backup.sql`\n\n"
-        "💡 *Рекомендации:*\n"
-        "• Создавайте бэкапы регулярно\n"
-        "• Храните бэкапы в надежном месте\n"
-        "• Проверяйте целостность бэкапов\n"
-        "• Настройте автоматическое создание бэкапов",
-        reply_markup=get_back_button("back_to_settings"),
-        parse_mode="Markdown"
+    """Последние резервные копии"""
+    backups = await asyncio.to_thread(list_backups)
+
+    text_lines = ["💾 <b>Резервное копирование</b>\n"]
+    if backups:
+        text_lines.append("📦 <b>Последние копии:</b>")
+        for backup in backups[:5]:
+            rows = sum(table["rows"] for table in backup["tables"])
+            created_at = datetime.fromisoformat(backup["created_at"])
+            text_lines.append(
+                f"• {format_datetime(created_at)} - {_format_size(backup['size'])}, "
+                f"{backup.get('duration', 0)} с, строк: {rows}"
+            )
+    else:
+        text_lines.append("Резервных копий пока нет.")
+
+    schedule = f"по расписанию <code>{escape(settings.BACKUP_CRON)}</code>" if settings.BACKUP_CRON else "выключены"
+    text_lines.append(
+        f"\n🗓 Автоматические копии: {schedule}\n"
+        f"📁 Каталог: <code>{escape(settings.BACKUP_DIR)}</code>, хранится копий: {settings.BACKUP_KEEP}\n\n"
+        f"♻️ Восстановление выполняется из командной строки:\n"
+        f"<code>python -m app.services.backup restore &lt;архив&gt;</code>"
     )
+
+    await callback.message.edit_text("\n".join(text_lines), reply_markup=get_backup_keyboard())
     await callback.answer()
 
 
+@settings_router.callback_query(F.data == "backup_create")
+async def backup_create(callback: CallbackQuery):
+    """Создание резервной копии по запросу администратора"""
+    global _backup_running
+    if _backup_running:
+        await callback.answer("⏳ Резервное копирование уже выполняется", show_alert=True)
+        return
+
+    _backup_running = True
+    await callback.answer("Создание копии запущено")
+    await callback.message.edit_text("💾 <b>Резервное копирование</b>\n\n⏳ Создание копии...")
+
+    try:
+        manifest = await create_backup()
+        rows = sum(table["rows"] for table in manifest["tables"])
+        await callback.message.edit_text(
+            f"💾 <b>Резервная копия создана</b>\n\n"
+            f"📁 <code>{escape(os.path.basename(manifest['path']))}</code>\n"
+            f"📏 Размер: {_format_size(manifest['size'])}\n"
+            f"⏱ Время: {manifest['duration']} с\n"
+            f"📊 Таблиц: {len(manifest['tables'])}, строк: {rows}",
+            reply_markup=get_backup_keyboard()
+        )
+        await log_user_action(
+            callback.from_user.id, "backup_created",
+            {"file": os.path.basename(manifest["path"]), "size": manifest["size"]}
+        )
+    except Exception as e:
+        logger.error(f"Error creating backup: {e}")
+        await callback.message.edit_text(
+            f"❌ <b>Ошибка резервного копирования</b>\n\n{escape(str(e))}",
+            reply_markup=get_backup_keyboard()
+        )
+    finally:
+        _backup_running = False
+
+
 # === СИСТЕМНАЯ ИНФОРМАЦИЯ ===
 @settings_router.callback_query(F.data == "system_info")
-async def system_info(callback: CallbackQuery, db_session: AsyncSession):
+async def system_info(callback: CallbackQuery, state: FSMContext, db_session: AsyncSession):
     """Подробная системная информация"""
     import sys
     import platform
@@ -405,6 +499,20 @@ async def system_info(callback: CallbackQuery, db_session: AsyncSession):
             select(Analysis.created_at).order_by(Analysis.created_at.desc()).limit(1)
         )
 
+        # Состояния диалогов (ограниченное хранилище в памяти)
+        fsm_text = ""
+        if isinstance(state.storage, BoundedMemoryStorage):
+            fsm_text = (
+                f"🧩 *Сессии диалогов:*\n"
+                f"📦 В памяти: {len(state.storage)}/{state.storage.max_entries}\n"
+                f"⌛ Истекло: {state.storage.expirations}, вытеснено: {state.storage.evictions}\n\n"
+            )
+
+        # Очереди обработки обновлений (этот процесс)
+        executor = update_executor.stats()
+        outbound = outbound_dispatcher.stats()
+        outbox = await count_outbox(db_session)
+
         await callback.message.edit_text(
             f"ℹ️ *Подробная системная информация*\n\n"
             f"🤖 *Бот:*\n"
@@ -418,6 +526,20 @@ async def system_info(callback: CallbackQuery, db_session: AsyncSession):
             f"🗄️ *База данных:*\n"
             f"📊 PostgreSQL: {db_version_short}\n"
             f"📏 Размер БД: {db_size}\n\n"
+            f"{fsm_text}"
+            f"📨 *Обработка обновлений:*\n"
+            f"⏳ В очереди и в работе: {executor['pending']}/{update_executor.max_pending} "
+            f"(чатов: {executor['chats']}, макс. очередь чата: {executor['deepest_chat_queue']})\n"
+            f"⏱ Ожидание: среднее {executor['wait_avg_ms']} мс, макс. {executor['wait_max_ms']} мс\n"
+            f"🚫 Отброшено: {executor['dropped']}\n\n"
+            f"📤 *Отправка сообщений:*\n"
+            f"⏳ В очереди и в работе: {outbound['in_flight']} (чатов с лимитом: {outbound['chats']})\n"
+            f"⏱ Доставка: ответы {outbound['interactive']['latency_avg_ms']} мс "
+            f"(макс. {outbound['interactive']['latency_max_ms']}), "
+            f"рассылки {outbound['bulk']['latency_avg_ms']} мс\n"
+            f"🐢 Ответов 429: {outbound['rate_limited']}, повторов: {outbound['retries']}, "
+            f"ошибок: {outbound['failed']}\n"
+            f"📮 Outbox: ожидают {outbox.get('pending', 0)}, не доставлено {outbox.get('failed', 0)}\n\n"
             f"📈 *Активность:*\n"
             f"⏰ Последний анализ: {format_datetime(last_analysis) if last_analysis else 'Нет данных'}\n"
             f"🕐 Время сервера: {format_datetime(datetime.now())}",
@@ -462,20 +584,240 @@ async def notification_settings(callback: CallbackQuery):
 
 
 # === ЭКСПОРТ ДАННЫХ ===
+# Администраторы, у которых сейчас идет выгрузка (не более одной одновременно)
+_running_exports = set()
+
+EXPORT_PROGRESS_INTERVAL = 3  # секунды между обновлениями сообщения о прогрессе
+
+
+def _export_period(period: str) -> tuple:
+    """Границы периода выгрузки (включительно) по кнопке выбора"""
+    today = date.today()
+    if period == "7":
+        return today - timedelta(days=6), today
+    if period == "30":
+        return today - timedelta(days=29), today
+    if period == "month":
+        return today.replace(day=1), today
+    return None, None
+
+
+def _parse_export_date(text: str) -> Optional[date]:
+    try:
+        return datetime.strptime(text.strip(), "%d.%m.%Y").date()
+    except ValueError:
+        return None
+
+
+def _export_summary(data: dict) -> str:
+    date_from = data.get("export_date_from")
+    date_to = data.get("export_date_to")
+    if date_from or date_to:
+        period = (
+            f"{date.fromisoformat(date_from):%d.%m.%Y} - {date.fromisoformat(date_to):%d.%m.%Y}"
+        )
+    else:
+        period = "за все время"
+    return (
+        f"📦 Данные: {EXPORT_KINDS[data['export_kind']]}\n"
+        f"📅 Период: {period}\n"
+    )
+
+
 @settings_router.callback_query(F.data == "export_data")
-async def export_data_info(callback: CallbackQuery):
-    """Информация об экспорте данных"""
+async def export_data_info(callback: CallbackQuery, state: FSMContext):
+    """Выбор данных для выгрузки"""
+    await state.clear()
     await callback.message.edit_text(
-        "📤 *Экспорт данных*\n\n"
-        "🔧 Функция в разработке.\n\n"
-        "Планируемые возможности экспорта:\n"
-        "• Список салонов (CSV/Excel)\n"
-        "• Список мастеров (CSV/Excel)\n"
-        "• Статистика анализов (CSV/Excel)\n"
-        "• Отчеты по периодам\n"
-        "• Полный дамп данных\n\n"
-        "💡 Пока можете использовать SQL-запросы к базе данных для получения необходимых данных.",
-        reply_markup=get_back_button("back_to_settings"),
-        parse_mode="Markdown"
+        "📤 <b>Экспорт данных</b>\n\n"
+        "Выгрузка формируется в CSV (сжатый gzip) и приходит документом.\n"
+        "Большие выгрузки делятся на части.\n\n"
+        "Что выгрузить?",
+        reply_markup=get_export_kind_keyboard()
+    )
+    await callback.answer()
+
+
+@settings_router.callback_query(F.data.startswith("export_kind:"))
+async def export_choose_kind(callback: CallbackQuery, state: FSMContext):
+    """Выбор периода выгрузки"""
+    kind = callback.data.split(":", 1)[1]
+    if kind not in EXPORT_KINDS:
+        await callback.answer("❌ Неизвестный вид выгрузки", show_alert=True)
+        return
+
+    await state.update_data(export_kind=kind)
+    await callback.message.edit_text(
+        f"📤 <b>Экспорт: {EXPORT_KINDS[kind]}</b>\n\n"
+        f"Выберите период (по дате создания):",
+        reply_markup=get_export_period_keyboard()
     )
-    await callback.answer()
\ No newline at end of file
+    await callback.answer()
+
+
+@settings_router.callback_query(F.data.startswith("export_period:"))
+async def export_choose_period(callback: CallbackQuery, state: FSMContext):
+    """Выбор готового периода или переход к вводу дат"""
+    period = callback.data.split(":", 1)[1]
+
+    if period == "custom":
+        await state.set_state(AdminStates.waiting_for_export_period_start)
+        await callback.message.edit_text("📅 Период выгрузки задается вручную.")
+        await callback.message.answer(
+            "📅 Введите дату начала периода в формате ДД.ММ.ГГГГ:",
+            reply_markup=get_cancel_keyboard()
+        )
+        await callback.answer()
+        return
+
+    date_from, date_to = _export_period(period)
+    await state.update_data(
+        export_date_from=date_from.isoformat() if date_from else None,
+        export_date_to=date_to.isoformat() if date_to else None
+    )
+    data = await state.get_data()
+    await callback.message.edit_text(
+        f"{_export_summary(data)}\nВыгрузить по всем салонам или по одному?",
+        reply_markup=get_export_salon_keyboard()
+    )
+    await callback.answer()
+
+
+@settings_router.message(AdminStates.waiting_for_export_period_start)
+async def export_period_start(message: Message, state: FSMContext):
+    """Ввод даты начала периода"""
+    date_from = _parse_export_date(message.text or "")
+    if date_from is None:
+        await message.answer("❌ Неверный формат даты. Введите дату как ДД.ММ.ГГГГ:", reply_markup=get_cancel_keyboard())
+        return
+
+    await state.update_data(export_date_from=date_from.isoformat())
+    await state.set_state(AdminStates.waiting_for_export_period_end)
+    await message.answer("📅 Введите дату окончания периода в формате ДД.ММ.ГГГГ:", reply_markup=get_cancel_keyboard())
+
+
+@settings_router.message(AdminStates.waiting_for_export_period_end)
+async def export_period_end(message: Message, state: FSMContext):
+    """Ввод даты окончания периода"""
+    date_to = _parse_export_date(message.text or "")
+    data = await state.get_data()
+    if date_to is None or date_to < date.fromisoformat(data["export_date_from"]):
+        await message.answer(
+            "❌ Неверная дата. Введите дату окончания (не раньше даты начала) как ДД.ММ.ГГГГ:",
+            reply_markup=get_cancel_keyboard()
+        )
+        return
+
+    await state.update_data(export_date_to=date_to.isoformat())
+    await state.set_state(None)
+    data = await state.get_data()
+    await message.answer("✅ Период выбран", reply_markup=get_admin_main_menu())
+    await message.answer(
+        f"{_export_summary(data)}\nВыгрузить по всем салонам или по одному?",
+        reply_markup=get_export_salon_keyboard()
+    )
+
+
+@settings_router.callback_query(F.data == "export_pick_salon")
+async def export_pick_salon(callback: CallbackQuery, db_session: AsyncSession):
+    """Список салонов для выгрузки по одному салону"""
+    markup = await get_salon_selection_markup(db_session, "export_salon")
+    if markup is None:
+        await callback.answer("❌ Активные салоны не найдены", show_alert=True)
+        return
+
+    await callback.message.edit_text("🏢 Выберите салон для выгрузки:", reply_markup=markup)
+    await callback.answer()
+
+
+@settings_router.callback_query(F.data.startswith("ssp:export_salon:"))
+async def export_salon_page(callback: CallbackQuery, db_session: AsyncSession):
+    """Перелистывание списка салонов для выгрузки"""
+    direction, cursor = parse_page_callback(callback.data)
+    markup = await get_salon_selection_markup(db_session, "export_salon", direction, cursor)
+
+    if markup is None:
+        await callback.answer("❌ Активные салоны не найдены", show_alert=True)
+        return
+
+    await callback.message.edit_reply_markup(reply_markup=markup)
+    await callback.answer()
+
+
+@settings_router.callback_query(F.data == "export_all_salons")
+@settings_router.callback_query(F.data.startswith("export_salon_"))
+async def export_run(callback: CallbackQuery, state: FSMContext, db_session: AsyncSession):
+    """Формирование выгрузки и отправка файлов"""
+    data = await state.get_data()
+    kind = data.get("export_kind")
+    if kind not in EXPORT_KINDS:
+        await callback.answer("❌ Начните выгрузку заново", show_alert=True)
+        return
+
+    salon_id = None
+    salon_name = "все салоны"
+    if callback.data.startswith("export_salon_"):
+        salon_id = int(callback.data.rsplit("_", 1)[1])
+        salon = await db_session.get(Salon, salon_id)
+        salon_name = salon.name if salon else f"ID {salon_id}"
+
+    user_id = callback.from_user.id
+    if user_id in _running_exports:
+        await callback.answer("⏳ Предыдущая выгрузка еще выполняется", show_alert=True)
+        return
+
+    await state.clear()
+    await callback.answer("Выгрузка запущена")
+
+    date_from = date.fromisoformat(data["export_date_from"]) if data.get("export_date_from") else None
+    date_to = date.fromisoformat(data["export_date_to"]) if data.get("export_date_to") else None
+    header = f"📤 <b>Экспорт</b>\n\n{_export_summary(data)}🏢 Салон: {escape(salon_name)}\n\n"
+
+    _running_exports.add(user_id)
+    try:
+        total = await count_export_rows(db_session, kind, date_from, date_to, salon_id)
+        await callback.message.edit_text(f"{header}⏳ Выгружено: 0 из {total}")
+
+        last_update = time.monotonic()
+
+        async def on_progress(rows: int):
+            nonlocal last_update
+            if time.monotonic() - last_update < EXPORT_PROGRESS_INTERVAL:
+                return
+            last_update = time.monotonic()
+            try:
+                await callback.message.edit_text(f"{header}⏳ Выгружено: {rows} из {total}")
+            except Exception as e:
+                logger.debug(f"Export progress update skipped: {e}")
+
+        started = time.monotonic()
+        with tempfile.TemporaryDirectory(prefix="export_") as directory:
+            result = await export_to_files(
+                db_session, kind, directory,
+                date_from=date_from, date_to=date_to, salon_id=salon_id,
+                on_progress=on_progress
+            )
+            parts = len(result["files"])
+            for number, path in enumerate(result["files"], start=1):
+                caption = f"{EXPORT_KINDS[kind]}: часть {number} из {parts}" if parts > 1 else EXPORT_KINDS[kind]
+                await callback.message.answer_document(FSInputFile(path), caption=caption)
+
+        await callback.message.edit_text(
+            f"{header}✅ Выгружено строк: {result['rows']}\n"
+            f"📎 Файлов: {parts}\n"
+            f"⏱ Время: {time.monotonic() - started:.1f} с",
+            reply_markup=get_back_button("back_to_settings")
+        )
+        await log_user_action(
+            user_id, "data_exported",
+            {"kind": kind, "salon_id": salon_id, "rows": result["rows"], "files": parts}
+        )
+
+    except Exception as e:
+        logger.error(f"Error exporting {kind}: {e}")
+        await callback.message.edit_text(
+            f"{header}❌ Ошибка выгрузки: {escape(str(e))}",
+            reply_markup=get_back_button("back_to_settings")
+        )
+    finally:
+        _running_exports.discard(user_id)
@@ -3,20 +3,22 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.filters import CommandStart, Command
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
 from loguru import logger
 
 from app.keyboards.admin_kb import get_admin_main_menu
+from app.handlers.master import offer_unfinished_analysis
 from app.keyboards.master_kb import get_master_main_menu
 from app.states.admin_states import AdminStates
 from app.database.models import Salon, Master, Analysis
+from app.services.query_budget import query_budget
+from app.services.statistics import get_dashboard_snapshot
 from app.utils.helpers import format_user_info
 
 router = Router()
 
 
 @router.message(CommandStart())
+@query_budget(4)
 async def cmd_start(message: Message, state: FSMContext, db_session: AsyncSession, 
                    is_owner: bool, is_master: bool, owner=None, master=None):
     """Обработчик команды /start"""
@@ -38,27 +40,22 @@ async def cmd_start(message: Message, state: FSMContext, db_session: AsyncSessio
             reply_markup=get_admin_main_menu()
         )
     elif is_master:
-        # Получаем информацию о салоне мастера с eager loading
-        master_query = select(Master).options(selectinload(Master.salon)).where(
-            Master.telegram_id == message.from_user.id,
-            Master.is_active == True
-        )
-        result = await db_session.execute(master_query)
-        master_with_salon = result.scalar_one_or_none()
-        
-        if master_with_salon and master_with_salon.salon:
-            salon = master_with_salon.salon
+        # Мастер загружен вместе с салоном в AuthMiddleware
+        if master and master.salon:
+            salon = master.salon
             quota_remaining = salon.quota_limit - salon.quota_used
             
             logger.info(f"Master started bot: {user_info}")
             await message.answer(
-                f"👋 Добро пожаловать, {master_with_salon.name}!\n\n"
+                f"👋 Добро пожаловать, {master.name}!\n\n"
                 f"🏢 Салон: {salon.name}\n"
                 f"🏙️ Город: {salon.city}\n"
                 f"💰 Доступно анализов: {quota_remaining}\n\n"
                 f"Выберите действие:",
                 reply_markup=get_master_main_menu()
             )
+            # Анализ, прерванный перезапуском или сбросом сессии, можно продолжить
+            await offer_unfinished_analysis(message, state, master.id, db_session)
         else:
             await message.answer(
                 f"👋 Добро пожаловать!\n\n"
@@ -144,40 +141,30 @@ async def cmd_help(message: Message, is_owner: bool, is_master: bool):
 
 
 @router.message(Command("stats"))
+@query_budget(4)
 async def cmd_stats(message: Message, db_session: AsyncSession, is_owner: bool, is_master: bool, master=None):
     """Быстрая статистика"""
     if is_owner:
-        # Статистика для администратора
-        from sqlalchemy import func
-        
-        # Подсчитываем общую статистику
-        salons_count = await db_session.scalar(select(func.count(Salon.id)).where(Salon.is_active == True))
-        masters_count = await db_session.scalar(select(func.count(Master.id)).where(Master.is_active == True))
-        analyses_count = await db_session.scalar(select(func.count(Analysis.id)))
+        # Статистика для администратора из общей сводки
+        snapshot = await get_dashboard_snapshot(db_session)
         
         await message.answer(
             f"📊 *Быстрая статистика:*\n\n"
-            f"🏢 Активных салонов: {salons_count}\n"
-            f"👤 Активных мастеров: {masters_count}\n"
-            f"📸 Всего анализов: {analyses_count}",
+            f"🏢 Активных салонов: {snapshot['salons']}\n"
+            f"👤 Активных мастеров: {snapshot['masters']}\n"
+            f"📸 Всего анализов: {snapshot['analyses']}",
             parse_mode="Markdown"
         )
     elif is_master and master:
-        # Получаем мастера с салоном
-        master_query = select(Master).options(selectinload(Master.salon)).where(
-            Master.id == master.id
-        )
-        result = await db_session.execute(master_query)
-        master_with_salon = result.scalar_one_or_none()
-        
-        if master_with_salon and master_with_salon.salon:
-            salon = master_with_salon.salon
+        # Мастер загружен вместе с салоном в AuthMiddleware
+        if master.salon:
+            salon = master.salon
             quota_remaining = salon.quota_limit - salon.quota_used
             
             await message.answer(
                 f"📊 *Ваша статистика:*\n\n"
                 f"🏢 Салон: {salon.name}\n"
-                f"📸 Проведено анализов: {master_with_salon.analyses_count}\n"
+                f"📸 Проведено анализов: {master.analyses_count}\n"
                 f"💰 Доступно анализов: {quota_remaining}",
                 parse_mode="Markdown"
             )
@@ -188,21 +175,16 @@ async def cmd_stats(message: Message, db_session: AsyncSession, is_owner: bool,
 
 
 @router.message(Command("quota"))
+@query_budget(3)
 async def cmd_quota(message: Message, db_session: AsyncSession, is_master: bool, master=None):
     """Проверка остатка квот для мастера"""
     if not is_master or not master:
         await message.answer("❌ Эта команда доступна только мастерам.")
         return
     
-    # Получаем мастера с салоном
-    master_query = select(Master).options(selectinload(Master.salon)).where(
-        Master.id == master.id
-    )
-    result = await db_session.execute(master_query)
-    master_with_salon = result.scalar_one_or_none()
-    
-    if master_with_salon and master_with_salon.salon:
-        salon = master_with_salon.salon
+    # Мастер загружен вместе с салоном в AuthMiddleware
+    if master.salon:
+        salon = master.salon
         quota_remaining = salon.quota_limit - salon.quota_used
         quota_percentage = (salon.quota_used / salon.quota_limit * 100) if salon.quota_limit > 0 else 0
         
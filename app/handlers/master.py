@@ -1,9 +1,11 @@
+import asyncio
+
 from aiogram import Router, F
+from aiogram.filters import StateFilter
 from aiogram.types import Message, CallbackQuery, PhotoSize
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
-from sqlalchemy.orm import selectinload
+from sqlalchemy import select, update, delete
 from sqlalchemy.orm.attributes import flag_modified
 from loguru import logger
 from datetime import datetime
@@ -12,8 +14,19 @@ from typing import List
 from app.middlewares.auth import MasterOnlyMiddleware
 from app.keyboards.master_kb import *
 from app.states.master_states import MasterStates
-from app.database.models import Master, Salon, Analysis
-from app.utils.helpers import format_datetime
+from app.database.models import Owner, Master, Salon, Analysis, AnalysisReview, AIProcessingLog, ANALYSIS_STATUS_EMOJIS
+from app.services.analysis_drafts import analysis_drafts
+from app.services.analysis_queries import (
+    RESUMABLE_STATUSES, get_analysis, get_analysis_state, get_unfinished_analysis
+)
+from app.services.fsm_storage import session_expired
+from app.services.metrics import observe_ai_step
+from app.services.query_budget import query_budget
+from app.services.outbox import enqueue_broadcast, enqueue_notification
+from app.services.rollups import record_status_transition, set_analysis_status
+from app.services.statistics import get_master_statistics, invalidate_master_statistics, invalidate_dashboard
+from app.services.sweeper import ai_heartbeat, finish_ai_attempt
+from app.utils.helpers import format_datetime, log_user_action
 
 router = Router()
 router.message.middleware(MasterOnlyMiddleware())
@@ -68,52 +81,34 @@ async def show_instruction(message: Message):
 
 
 @router.message(F.text == "📊 Моя статистика")
+@query_budget(4)
 async def show_my_statistics(message: Message, master: Master, db_session: AsyncSession):
     """Показать статистику мастера"""
     try:
-        # Получаем мастера с салоном
-        master_query = select(Master).options(selectinload(Master.salon)).where(Master.id == master.id)
-        result = await db_session.execute(master_query)
-        master_with_salon = result.scalar_one_or_none()
-
-        if not master_with_salon:
-            await message.answer("❌ Информация о мастере не найдена.")
-            return
-
-        # Получаем статистику анализов мастера
-        analysis_query = select(Analysis).where(Analysis.master_id == master.id)
-        analyses_result = await db_session.execute(analysis_query)
-        analyses = analyses_result.scalars().all()
-
-        # Подсчитываем статистику
-        total_analyses = len(analyses)
-        completed_analyses = len([a for a in analyses if a.status == "completed"])
-        disputed_analyses = len([a for a in analyses if a.status == "disputed"])
-        in_progress = len([a for a in analyses if a.status in ["started", "ai_analyzing", "ready_for_ai"]])
-
-        # Последний анализ
-        last_analysis = None
-        if analyses:
-            last_analysis = max(analyses, key=lambda x: x.created_at if x.created_at else datetime.min)
+        # Получаем статистику анализов мастера одним агрегирующим запросом
+        stats = await get_master_statistics(db_session, master.id)
+        last_analysis = stats["last_analysis"]
 
         stats_text = f"📊 *Статистика мастера*\n\n"
-        stats_text += f"👤 Мастер: {master_with_salon.name}\n"
-        if master_with_salon.salon:
-            stats_text += f"🏢 Салон: {master_with_salon.salon.name}\n"
-            stats_text += f"🏙️ Город: {master_with_salon.salon.city}\n\n"
+        # Мастер загружен вместе с салоном в AuthMiddleware
+        stats_text += f"👤 Мастер: {master.name}\n"
+        if master.salon:
+            stats_text += f"🏢 Салон: {master.salon.name}\n"
+            stats_text += f"🏙️ Город: {master.salon.city}\n\n"
 
         stats_text += f"📈 *Общая статистика:*\n"
-        stats_text += f"• Всего анализов: {total_analyses}\n"
-        stats_text += f"• Завершенных: {completed_analyses}\n"
-        stats_text += f"• В процессе: {in_progress}\n"
-        stats_text += f"• Спорных: {disputed_analyses}\n\n"
+        stats_text += f"• Всего анализов: {stats['total']}\n"
+        stats_text += f"• Завершенных: {stats['completed']}\n"
+        stats_text += f"• В процессе: {stats['in_progress']}\n"
+        stats_text += f"• Спорных: {stats['disputed']}\n\n"
 
         if last_analysis:
+            status_emoji = ANALYSIS_STATUS_EMOJIS.get(last_analysis['status'], '❓')
             stats_text += f"📅 *Последний анализ:*\n"
-            stats_text += f"• ID: {last_analysis.id}\n"
-            stats_text += f"• Статус: {last_analysis.status_emoji} {last_analysis.status}\n"
-            if last_analysis.completed_at:
-                stats_text += f"• Дата: {format_datetime(last_analysis.completed_at)}\n"
+            stats_text += f"• ID: {last_analysis['id']}\n"
+            stats_text += f"• Статус: {status_emoji} {last_analysis['status']}\n"
+            if last_analysis['completed_at']:
+                stats_text += f"• Дата: {format_datetime(last_analysis['completed_at'])}\n"
         else:
             stats_text += f"📅 Анализы еще не проводились"
 
@@ -126,7 +121,7 @@ async def show_my_statistics(message: Message, master: Master, db_session: Async
 
 @router.callback_query(F.data == "main_menu")
 @router.callback_query(F.data == "back_to_main")
-async def back_to_main_menu(callback: CallbackQuery, state: FSMContext, master: Master):
+async def back_to_main_menu(callback: CallbackQuery, state: FSMContext, master: Master, db_session: AsyncSession):
     """Возврат в главное меню"""
     try:
         await state.clear()
@@ -149,6 +144,7 @@ async def back_to_main_menu(callback: CallbackQuery, state: FSMContext, master:
                 reply_markup=get_master_main_menu()
             )
 
+        await offer_unfinished_analysis(callback.message, state, master.id, db_session)
         await callback.answer()
 
     except Exception as e:
@@ -158,15 +154,28 @@ async def back_to_main_menu(callback: CallbackQuery, state: FSMContext, master:
 
 # === ГЛАВНОЕ МЕНЮ МАСТЕРА ===
 @router.message(F.text == "📸 Начать анализ")
+@query_budget(10)
 async def start_analysis(message: Message, state: FSMContext, master: Master, db_session: AsyncSession):
     """Начало процесса анализа маникюра"""
+    await _begin_analysis(message, message.from_user.id, state, master, db_session)
+
+
+@router.callback_query(F.data == "restart_analysis")
+@query_budget(10)
+async def restart_analysis(callback: CallbackQuery, state: FSMContext, master: Master, db_session: AsyncSession):
+    """Новый анализ после истечения сессии"""
+    await callback.answer()
+    await _begin_analysis(callback.message, callback.from_user.id, state, master, db_session)
+
+
+async def _begin_analysis(message: Message, user_id: int, state: FSMContext, master: Master, db_session: AsyncSession):
     try:
-        # Получаем свежую информацию о мастере и салоне
-        master_query = select(Master).options(selectinload(Master.salon)).where(Master.id == master.id)
-        result = await db_session.execute(master_query)
-        master_with_salon = result.scalar_one_or_none()
+        # Незавершенный анализ продолжается, а не создается новый
+        if await offer_unfinished_analysis(message, state, master.id, db_session):
+            return
 
-        if not master_with_salon or not master_with_salon.salon:
+        # Салон загружен вместе с мастером в AuthMiddleware (в этой же сессии)
+        if not master.salon:
             await message.answer(
                 "❌ *Ошибка конфигурации*\n\n"
                 "Информация о салоне не найдена.\n"
@@ -176,7 +185,7 @@ async def start_analysis(message: Message, state: FSMContext, master: Master, db
             )
             return
 
-        salon = master_with_salon.salon
+        salon = master.salon
 
         if salon.quota_remaining <= 0:
             await message.answer(
@@ -204,9 +213,20 @@ async def start_analysis(message: Message, state: FSMContext, master: Master, db
         )
 
         db_session.add(new_analysis)
+        await record_status_transition(
+            db_session, new_analysis.created_at, salon.id, master.id, None, new_analysis.status
+        )
         await db_session.commit()
         await db_session.refresh(new_analysis)
 
+        # Дальнейший сбор фото и опроса идет через черновик в памяти
+        analysis_drafts.put(new_analysis)
+        invalidate_master_statistics(master.id)
+        invalidate_dashboard()
+        await log_user_action(
+            user_id, "analysis_started", {"analysis_id": new_analysis.id, "salon_id": salon.id}
+        )
+
         # Сохраняем ID анализа в состоянии
         await state.update_data(analysis_id=new_analysis.id)
 
@@ -232,6 +252,122 @@ async def start_analysis(message: Message, state: FSMContext, master: Master, db
         await message.answer("❌ Ошибка при запуске анализа")
 
 
+# === ПРОДОЛЖЕНИЕ НЕЗАВЕРШЕННОГО АНАЛИЗА ===
+RESUME_STEP_NAMES = {
+    'started': 'фотографирование',
+    'ready_for_ai': 'запуск ИИ анализа',
+    'ai_completed': 'проверка результатов',
+}
+
+
+async def offer_unfinished_analysis(message: Message, state: FSMContext, master_id: int, db_session: AsyncSession) -> bool:
+    """Предложение продолжить последний незавершенный анализ; False - таких анализов нет"""
+    unfinished = await get_unfinished_analysis(db_session, master_id)
+    if unfinished is None:
+        return False
+
+    # Кнопка отмены берет анализ из данных состояния
+    await state.update_data(analysis_id=unfinished.id)
+    await message.answer(
+        f"⏸ *Есть незавершенный анализ*\n\n"
+        f"🆔 ID анализа: {unfinished.id}\n"
+        f"📅 Начат: {format_datetime(unfinished.created_at)}\n"
+        f"{ANALYSIS_STATUS_EMOJIS.get(unfinished.status, '❓')} Этап: {RESUME_STEP_NAMES[unfinished.status]}\n\n"
+        f"Продолжите с того же места - квота за него еще не списана.",
+        parse_mode="Markdown",
+        reply_markup=get_resume_analysis_keyboard(
+            unfinished.id, can_cancel=unfinished.status in ('started', 'ready_for_ai')
+        )
+    )
+    return True
+
+
+def _resume_step(status: str, draft) -> tuple:
+    """Шаг FSM, текст и клавиатура для продолжения анализа с сохраненного этапа"""
+    if status == 'ai_completed':
+        return (
+            MasterStates.reviewing_results,
+            "✅ *ИИ анализ завершен*\n\n📊 Результаты готовы к просмотру",
+            get_view_results_keyboard()
+        )
+
+    first_count = len(draft.first_hand_photos)
+    second_count = len(draft.second_hand_photos)
+    if status == 'ready_for_ai' and draft.survey_response:
+        return (
+            MasterStates.ready_for_ai_analysis,
+            f"▶️ *Анализ продолжен*\n\n"
+            f"📸 Фото первой руки: {first_count}\n"
+            f"📸 Фото второй руки: {second_count}\n"
+            f"📝 Ответ мастера: получен\n\n"
+            f"🤖 Запустить ИИ анализ?",
+            get_start_ai_analysis_keyboard()
+        )
+    if second_count:
+        return (
+            MasterStates.waiting_for_second_hand_photos,
+            f"▶️ *Анализ продолжен*\n\n"
+            f"📸 Фото первой руки: {first_count}\n"
+            f"📸 Фото второй руки: {second_count}\n\n"
+            f"Добавьте еще фото второй руки или переходите к опросу:",
+            get_second_hand_actions_keyboard(second_count)
+        )
+    if first_count:
+        return (
+            MasterStates.waiting_for_first_hand_photos,
+            f"▶️ *Анализ продолжен*\n\n"
+            f"📸 Фото первой руки: {first_count}\n\n"
+            f"Добавьте еще фото первой руки или переходите ко второй:",
+            get_first_hand_actions_keyboard(first_count)
+        )
+    return (
+        MasterStates.waiting_for_first_hand_photos,
+        "▶️ *Анализ продолжен*\n\nНачнем с первой руки:",
+        get_first_hand_keyboard()
+    )
+
+
+@router.callback_query(F.data.startswith("resume_analysis:"))
+async def resume_analysis(callback: CallbackQuery, state: FSMContext, master: Master, db_session: AsyncSession):
+    """Продолжение незавершенного анализа с этапа, сохраненного в БД"""
+    try:
+        analysis_id = int(callback.data.split(":")[1])
+        analysis = await get_analysis_state(db_session, analysis_id)
+
+        if not analysis or analysis.master_id != master.id or analysis.status not in RESUMABLE_STATUSES:
+            await state.clear()
+            await callback.answer("❌ Анализ уже завершен или отменен", show_alert=True)
+            return
+
+        status = analysis.status
+        draft = None
+        if status in ('started', 'ready_for_ai'):
+            # Фото и ответ на опрос берутся из черновика: в памяти они свежее, чем в БД
+            draft = await analysis_drafts.get(db_session, analysis_id)
+            if draft is not None and draft.is_open:
+                # Продолжение - активность мастера: срок до просрочки черновика отсчитывается заново
+                analysis_drafts.mark_dirty(draft)
+                await analysis_drafts.flush(db_session, analysis_id)
+
+            if draft is None or not draft.is_open:
+                await state.clear()
+                await callback.answer("❌ Анализ уже завершен или отменен", show_alert=True)
+                return
+            status = draft.status
+
+        step, text, keyboard = _resume_step(status, draft)
+        await state.set_data({'analysis_id': analysis_id})
+        await state.set_state(step)
+
+        await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=keyboard)
+        await callback.answer()
+        logger.info(f"Master {master.id} resumed analysis {analysis_id} at {step.state}")
+
+    except Exception as e:
+        logger.error(f"Error in resume_analysis: {e}")
+        await callback.answer("❌ Ошибка", show_alert=True)
+
+
 # === АНАЛИЗ ПЕРВОЙ РУКИ ===
 @router.callback_query(F.data == "add_first_hand_photo", MasterStates.waiting_for_first_hand_photos)
 async def request_first_hand_photo(callback: CallbackQuery):
@@ -272,31 +408,20 @@ async def process_first_hand_photo(message: Message, state: FSMContext, db_sessi
         photo: PhotoSize = message.photo[-1]
         photo_file_id = photo.file_id
 
-        # Получаем анализ из БД
-        analysis_query = select(Analysis).where(Analysis.id == analysis_id)
-        result = await db_session.execute(analysis_query)
-        analysis = result.scalar_one_or_none()
-
-        if analysis:
-            logger.info(f"Processing photo for analysis {analysis_id}")
-            logger.info(f"Photos before: {analysis.first_hand_photos}")
-
-            # ИСПРАВЛЕНИЕ: Правильное обновление JSON поля
-            if analysis.first_hand_photos is None:
-                analysis.first_hand_photos = []
+        # Добавляем фото в черновик анализа (запись в БД - в контрольной точке)
+        draft = await analysis_drafts.get(db_session, analysis_id)
 
-            analysis.first_hand_photos.append(photo_file_id)
-
-            # ВАЖНО: Уведомляем SQLAlchemy об изменении
-            flag_modified(analysis, 'first_hand_photos')
-            await db_session.commit()
+        if draft and not draft.is_open:
+            await state.clear()
+            await message.answer("❌ Анализ уже завершен или отменен")
+            return
 
-            # Обновляем из БД для получения актуальных данных
-            await db_session.refresh(analysis)
-            photos_count = len(analysis.first_hand_photos)
+        if draft:
+            draft.first_hand_photos.append(photo_file_id)
+            analysis_drafts.mark_dirty(draft)
+            photos_count = len(draft.first_hand_photos)
 
-            logger.info(f"Photos after commit: {analysis.first_hand_photos}")
-            logger.info(f"Final count: {photos_count}")
+            logger.debug(f"Analysis {analysis_id}: first hand photos count {photos_count}")
 
             await message.answer_photo(
                 photo=photo_file_id,
@@ -321,32 +446,30 @@ async def view_first_hand_photos(callback: CallbackQuery, state: FSMContext, db_
         data = await state.get_data()
         analysis_id = data.get('analysis_id')
 
-        analysis_query = select(Analysis).where(Analysis.id == analysis_id)
-        result = await db_session.execute(analysis_query)
-        analysis = result.scalar_one_or_none()
+        draft = await analysis_drafts.get(db_session, analysis_id)
 
-        if not analysis or not analysis.first_hand_photos:
+        if not draft or not draft.first_hand_photos:
             await callback.answer("❌ Фото не найдены", show_alert=True)
             return
 
         # Отправляем все фото как медиа группу
-        if len(analysis.first_hand_photos) == 1:
+        if len(draft.first_hand_photos) == 1:
             await callback.message.answer_photo(
-                photo=analysis.first_hand_photos[0],
+                photo=draft.first_hand_photos[0],
                 caption=f"📸 Фото первой руки (1 из 1)",
-                reply_markup=get_first_hand_actions_keyboard(len(analysis.first_hand_photos))
+                reply_markup=get_first_hand_actions_keyboard(len(draft.first_hand_photos))
             )
         else:
             # Если фото много, показываем первое с информацией
             await callback.message.answer_photo(
-                photo=analysis.first_hand_photos[0],
+                photo=draft.first_hand_photos[0],
                 caption=(
                     f"📸 *Все фото первой руки*\n\n"
-                    f"Показано фото 1 из {len(analysis.first_hand_photos)}\n"
-                    f"Всего фотографий: {len(analysis.first_hand_photos)}"
+                    f"Показано фото 1 из {len(draft.first_hand_photos)}\n"
+                    f"Всего фотографий: {len(draft.first_hand_photos)}"
                 ),
                 parse_mode="Markdown",
-                reply_markup=get_first_hand_actions_keyboard(len(analysis.first_hand_photos))
+                reply_markup=get_first_hand_actions_keyboard(len(draft.first_hand_photos))
             )
 
         await callback.answer()
@@ -363,21 +486,21 @@ async def delete_last_first_photo(callback: CallbackQuery, state: FSMContext, db
         data = await state.get_data()
         analysis_id = data.get('analysis_id')
 
-        analysis_query = select(Analysis).where(Analysis.id == analysis_id)
-        result = await db_session.execute(analysis_query)
-        analysis = result.scalar_one_or_none()
+        draft = await analysis_drafts.get(db_session, analysis_id)
+
+        if draft and not draft.is_open:
+            await state.clear()
+            await callback.answer("❌ Анализ уже завершен или отменен", show_alert=True)
+            return
 
-        if not analysis or not analysis.first_hand_photos:
+        if not draft or not draft.first_hand_photos:
             await callback.answer("❌ Нет фото для удаления", show_alert=True)
             return
 
-        # ИСПРАВЛЕНИЕ: Правильное удаление из JSON поля
-        analysis.first_hand_photos.pop()
-        flag_modified(analysis, 'first_hand_photos')
-        await db_session.commit()
-        await db_session.refresh(analysis)
+        draft.first_hand_photos.pop()
+        analysis_drafts.mark_dirty(draft)
 
-        remaining_count = len(analysis.first_hand_photos)
+        remaining_count = len(draft.first_hand_photos)
 
         if remaining_count > 0:
             try:
@@ -430,11 +553,9 @@ async def continue_to_second_hand(callback: CallbackQuery, state: FSMContext, db
         analysis_id = data.get('analysis_id')
 
         # Проверяем, что есть хотя бы одно фото первой руки
-        analysis_query = select(Analysis).where(Analysis.id == analysis_id)
-        result = await db_session.execute(analysis_query)
-        analysis = result.scalar_one_or_none()
+        draft = await analysis_drafts.get(db_session, analysis_id)
 
-        if not analysis or not analysis.first_hand_photos:
+        if not draft or not draft.first_hand_photos:
             await callback.answer("❌ Добавьте хотя бы одно фото первой руки", show_alert=True)
             return
 
@@ -446,7 +567,7 @@ async def continue_to_second_hand(callback: CallbackQuery, state: FSMContext, db
 
         await callback.message.answer(
             f"✅ *Первая рука готова*\n\n"
-            f"📸 Добавлено фото: {len(analysis.first_hand_photos)}\n\n"
+            f"📸 Добавлено фото: {len(draft.first_hand_photos)}\n\n"
             f"Теперь сфотографируйте вторую руку:",
             parse_mode="Markdown",
             reply_markup=get_second_hand_keyboard()
@@ -469,11 +590,9 @@ async def back_to_first_hand(callback: CallbackQuery, state: FSMContext, db_sess
         data = await state.get_data()
         analysis_id = data.get('analysis_id')
 
-        analysis_query = select(Analysis).where(Analysis.id == analysis_id)
-        result = await db_session.execute(analysis_query)
-        analysis = result.scalar_one_or_none()
+        draft = await analysis_drafts.get(db_session, analysis_id)
 
-        photos_count = len(analysis.first_hand_photos or []) if analysis else 0
+        photos_count = len(draft.first_hand_photos) if draft else 0
 
         await callback.message.edit_text(
             f"📸 *Редактирование первой руки*\n\n"
@@ -530,22 +649,19 @@ async def process_second_hand_photo(message: Message, state: FSMContext, db_sess
         photo: PhotoSize = message.photo[-1]
         photo_file_id = photo.file_id
 
-        # Обновляем анализ в БД
-        analysis_query = select(Analysis).where(Analysis.id == analysis_id)
-        result = await db_session.execute(analysis_query)
-        analysis = result.scalar_one_or_none()
+        # Добавляем фото в черновик анализа (запись в БД - в контрольной точке)
+        draft = await analysis_drafts.get(db_session, analysis_id)
 
-        if analysis:
-            # ИСПРАВЛЕНИЕ: Правильное обновление JSON поля
-            if analysis.second_hand_photos is None:
-                analysis.second_hand_photos = []
+        if draft and not draft.is_open:
+            await state.clear()
+            await message.answer("❌ Анализ уже завершен или отменен")
+            return
 
-            analysis.second_hand_photos.append(photo_file_id)
-            flag_modified(analysis, 'second_hand_photos')
-            await db_session.commit()
-            await db_session.refresh(analysis)
+        if draft:
+            draft.second_hand_photos.append(photo_file_id)
+            analysis_drafts.mark_dirty(draft)
 
-            photos_count = len(analysis.second_hand_photos)
+            photos_count = len(draft.second_hand_photos)
             await message.answer_photo(
                 photo=photo_file_id,
                 caption=(
@@ -569,24 +685,22 @@ async def view_second_hand_photos(callback: CallbackQuery, state: FSMContext, db
         data = await state.get_data()
         analysis_id = data.get('analysis_id')
 
-        analysis_query = select(Analysis).where(Analysis.id == analysis_id)
-        result = await db_session.execute(analysis_query)
-        analysis = result.scalar_one_or_none()
+        draft = await analysis_drafts.get(db_session, analysis_id)
 
-        if not analysis or not analysis.second_hand_photos:
+        if not draft or not draft.second_hand_photos:
             await callback.answer("❌ Фото не найдены", show_alert=True)
             return
 
         # Отправляем первое фото с информацией
         await callback.message.answer_photo(
-            photo=analysis.second_hand_photos[0],
+            photo=draft.second_hand_photos[0],
             caption=(
                 f"📸 *Все фото второй руки*\n\n"
-                f"Показано фото 1 из {len(analysis.second_hand_photos)}\n"
-                f"Всего фотографий: {len(analysis.second_hand_photos)}"
+                f"Показано фото 1 из {len(draft.second_hand_photos)}\n"
+                f"Всего фотографий: {len(draft.second_hand_photos)}"
             ),
             parse_mode="Markdown",
-            reply_markup=get_second_hand_actions_keyboard(len(analysis.second_hand_photos))
+            reply_markup=get_second_hand_actions_keyboard(len(draft.second_hand_photos))
         )
 
         await callback.answer()
@@ -603,21 +717,21 @@ async def delete_last_second_photo(callback: CallbackQuery, state: FSMContext, d
         data = await state.get_data()
         analysis_id = data.get('analysis_id')
 
-        analysis_query = select(Analysis).where(Analysis.id == analysis_id)
-        result = await db_session.execute(analysis_query)
-        analysis = result.scalar_one_or_none()
+        draft = await analysis_drafts.get(db_session, analysis_id)
 
-        if not analysis or not analysis.second_hand_photos:
+        if draft and not draft.is_open:
+            await state.clear()
+            await callback.answer("❌ Анализ уже завершен или отменен", show_alert=True)
+            return
+
+        if not draft or not draft.second_hand_photos:
             await callback.answer("❌ Нет фото для удаления", show_alert=True)
             return
 
-        # ИСПРАВЛЕНИЕ: Правильное удаление из JSON поля
-        analysis.second_hand_photos.pop()
-        flag_modified(analysis, 'second_hand_photos')
-        await db_session.commit()
-        await db_session.refresh(analysis)
+        draft.second_hand_photos.pop()
+        analysis_drafts.mark_dirty(draft)
 
-        remaining_count = len(analysis.second_hand_photos)
+        remaining_count = len(draft.second_hand_photos)
 
         if remaining_count > 0:
             try:
@@ -669,14 +783,15 @@ async def continue_to_survey(callback: CallbackQuery, state: FSMContext, db_sess
         analysis_id = data.get('analysis_id')
 
         # Проверяем, что есть хотя бы одно фото второй руки
-        analysis_query = select(Analysis).where(Analysis.id == analysis_id)
-        result = await db_session.execute(analysis_query)
-        analysis = result.scalar_one_or_none()
+        draft = await analysis_drafts.get(db_session, analysis_id)
 
-        if not analysis or not analysis.second_hand_photos:
+        if not draft or not draft.second_hand_photos:
             await callback.answer("❌ Добавьте хотя бы одно фото второй руки", show_alert=True)
             return
 
+        # Контрольная точка: фотографии сохраняются в БД перед опросом
+        await analysis_drafts.flush(db_session, analysis_id)
+
         # Удаляем старое сообщение и отправляем новое
         try:
             await callback.message.delete()
@@ -685,8 +800,8 @@ async def continue_to_survey(callback: CallbackQuery, state: FSMContext, db_sess
 
         await callback.message.answer(
             f"✅ *Фотографирование завершено*\n\n"
-            f"📸 Фото первой руки: {len(analysis.first_hand_photos)}\n"
-            f"📸 Фото второй руки: {len(analysis.second_hand_photos)}\n\n"
+            f"📸 Фото первой руки: {len(draft.first_hand_photos)}\n"
+            f"📸 Фото второй руки: {len(draft.second_hand_photos)}\n\n"
             f"📋 *Вопрос мастеру:*\n\n"
             f"Опишите состояние ногтей клиента и особенности, которые заметили:\n"
             f"(состояние кутикулы, форма ногтей, проблемы, пожелания клиента)",
@@ -722,20 +837,23 @@ async def process_survey_response(message: Message, state: FSMContext, db_sessio
             )
             return
 
-        # Обновляем анализ в БД
-        analysis_query = select(Analysis).where(Analysis.id == analysis_id)
-        result = await db_session.execute(analysis_query)
-        analysis = result.scalar_one_or_none()
+        # Обновляем черновик анализа
+        draft = await analysis_drafts.get(db_session, analysis_id)
 
-        if analysis:
-            analysis.survey_response = survey_response
-            analysis.status = "ready_for_ai"
-            await db_session.commit()
+        if draft and not draft.is_open:
+            await state.clear()
+            await message.answer("❌ Анализ уже завершен или отменен")
+            return
+
+        if draft:
+            draft.survey_response = survey_response
+            draft.status = "ready_for_ai"
+            analysis_drafts.mark_dirty(draft)
 
             await message.answer(
                 f"✅ *Данные собраны*\n\n"
-                f"📸 Фото первой руки: {len(analysis.first_hand_photos)}\n"
-                f"📸 Фото второй руки: {len(analysis.second_hand_photos)}\n"
+                f"📸 Фото первой руки: {len(draft.first_hand_photos)}\n"
+                f"📸 Фото второй руки: {len(draft.second_hand_photos)}\n"
                 f"📝 Ответ мастера: получен\n\n"
                 f"🤖 Запустить ИИ анализ?",
                 parse_mode="Markdown",
@@ -776,18 +894,34 @@ async def start_ai_analysis(callback: CallbackQuery, state: FSMContext, db_sessi
         data = await state.get_data()
         analysis_id = data.get('analysis_id')
 
-        # Получаем анализ
-        analysis_query = select(Analysis).where(Analysis.id == analysis_id)
-        result = await db_session.execute(analysis_query)
-        analysis = result.scalar_one_or_none()
+        # Контрольная точка: черновик записывается в БД перед запуском ИИ
+        # (устаревший черновик при этом удаляется без записи)
+        draft = await analysis_drafts.get(db_session, analysis_id)
+        if draft and draft.is_open:
+            await analysis_drafts.flush(db_session, analysis_id)
+        await analysis_drafts.discard(analysis_id)
+
+        # Получаем анализ (результаты ИИ не нужны - они будут записаны заново)
+        analysis = await get_analysis(db_session, analysis_id)
 
         if not analysis:
             await callback.answer("❌ Анализ не найден", show_alert=True)
             return
 
-        analysis.status = "ai_analyzing"
+        # Повторный запуск возможен после ошибки ИИ, просроченный или
+        # отмененный анализ не запускается
+        if analysis.status not in ("ready_for_ai", "ai_error"):
+            await state.clear()
+            await callback.answer("❌ Анализ уже завершен или отменен", show_alert=True)
+            return
+
+        await set_analysis_status(db_session, analysis, "ai_analyzing")
         analysis.ai_started_at = datetime.now()
+        analysis.ai_heartbeat_at = analysis.ai_started_at
+        analysis.ai_attempts = (analysis.ai_attempts or 0) + 1
+        attempt = analysis.ai_attempts
         await db_session.commit()
+        await log_user_action(callback.from_user.id, "analysis_ai_started", {"analysis_id": analysis.id})
 
         await callback.message.edit_text(
             f"🤖 *ИИ анализ запущен*\n\n"
@@ -800,52 +934,88 @@ async def start_ai_analysis(callback: CallbackQuery, state: FSMContext, db_sessi
 
         # === ЗДЕСЬ ИНТЕГРАЦИЯ С ВАШИМ ИИ ===
         try:
-            # 1. Анализ первой руки
-            first_hand_result = await analyze_first_hand_ai(
-                photos=analysis.first_hand_photos,
-                survey_data=analysis.survey_response
-            )
-            analysis.ai_first_analysis = first_hand_result
-
-            # 2. Анализ второй руки
-            second_hand_result = await analyze_second_hand_ai(
-                photos=analysis.second_hand_photos,
-                survey_data=analysis.survey_response
-            )
-            analysis.ai_second_analysis = second_hand_result
+            # Пока идет ИИ анализ, обновляем сердцебиение для уборки зависших анализов
+            async with ai_heartbeat(analysis.id, analysis.created_at):
+                # 1. Анализ первой руки
+                first_hand_result = await analyze_first_hand_ai(
+                    photos=analysis.first_hand_photos,
+                    survey_data=analysis.survey_response
+                )
 
-            # 3. Создание дневника роста
-            diary_result = await generate_growth_diary_ai(
-                first_analysis=first_hand_result,
-                second_analysis=second_hand_result,
-                survey_data=analysis.survey_response
-            )
-            analysis.ai_diary = diary_result
+                # 2. Анализ второй руки
+                second_hand_result = await analyze_second_hand_ai(
+                    photos=analysis.second_hand_photos,
+                    survey_data=analysis.survey_response
+                )
 
-            analysis.status = "ai_completed"
-            analysis.completed_at = datetime.now()
-            analysis.ai_completed_at = datetime.now()
-            await db_session.commit()
+                # 3. Создание дневника роста
+                diary_result = await generate_growth_diary_ai(
+                    first_analysis=first_hand_result,
+                    second_analysis=second_hand_result,
+                    survey_data=analysis.survey_response
+                )
 
-            await callback.message.edit_text(
+            finished_at = datetime.now()
+            if not await finish_ai_attempt(
+                    db_session, analysis, attempt, "ai_completed",
+                    ai_first_analysis=first_hand_result,
+                    ai_second_analysis=second_hand_result,
+                    ai_diary=diary_result,
+                    completed_at=finished_at,
+                    ai_completed_at=finished_at
+            ):
+                await callback.answer()
+                return
+            # Сообщение о готовности записывается вместе со статусом и будет
+            # доставлено, даже если процесс остановится сразу после коммита
+            await enqueue_notification(
+                db_session,
+                f"analysis:{analysis.id}:ai_completed",
+                callback.message.chat.id,
                 f"✅ *ИИ анализ завершен*\n\n"
                 f"📊 Результаты готовы к просмотру",
                 parse_mode="Markdown",
-                reply_markup=get_view_results_keyboard()
+                reply_markup=get_view_results_keyboard(),
+                edit_message_id=callback.message.message_id
             )
+            await db_session.commit()
             await state.set_state(MasterStates.reviewing_results)
 
-        except Exception as e:
-            logger.error(f"AI analysis error: {e}")
-            analysis.status = "ai_error"
+        except asyncio.CancelledError:
+            # Бот останавливается: анализ возвращается в очередь, попытка не засчитывается,
+            # а мастер получит кнопку повторного запуска
+            if not await finish_ai_attempt(db_session, analysis, attempt, "ready_for_ai", ai_attempts=attempt - 1):
+                raise
+            await enqueue_notification(
+                db_session,
+                f"analysis:{analysis.id}:interrupted:{analysis.ai_started_at.isoformat()}",
+                callback.message.chat.id,
+                f"⏸ *ИИ анализ прерван*\n\n"
+                f"Бот перезапускался. Данные сохранены - запустите анализ заново.",
+                parse_mode="Markdown",
+                reply_markup=get_start_ai_analysis_keyboard(),
+                edit_message_id=callback.message.message_id
+            )
             await db_session.commit()
+            logger.warning(f"AI analysis {analysis.id} interrupted by shutdown, returned to ready_for_ai")
+            raise
 
-            await callback.message.edit_text(
+        except Exception as e:
+            logger.error(f"AI analysis error: {e}")
+            if not await finish_ai_attempt(db_session, analysis, attempt, "ai_error"):
+                await callback.answer()
+                return
+            await enqueue_notification(
+                db_session,
+                f"analysis:{analysis.id}:ai_error:{attempt}",
+                callback.message.chat.id,
                 f"❌ *Ошибка ИИ анализа*\n\n"
                 f"Попробуйте еще раз или обратитесь к администратору.",
                 parse_mode="Markdown",
-                reply_markup=get_retry_analysis_keyboard()
+                reply_markup=get_retry_analysis_keyboard(),
+                edit_message_id=callback.message.message_id
             )
+            await db_session.commit()
 
         await callback.answer()
 
@@ -882,9 +1052,7 @@ async def view_analysis_results(callback: CallbackQuery, state: FSMContext, db_s
         data = await state.get_data()
         analysis_id = data.get('analysis_id')
 
-        analysis_query = select(Analysis).where(Analysis.id == analysis_id)
-        result = await db_session.execute(analysis_query)
-        analysis = result.scalar_one_or_none()
+        analysis = await get_analysis(db_session, analysis_id, with_results=True)
 
         if not analysis or analysis.status != "ai_completed":
             await callback.answer("❌ Результаты не готовы", show_alert=True)
@@ -913,12 +1081,10 @@ async def accept_results(callback: CallbackQuery, state: FSMContext, master: Mas
         analysis_id = data.get('analysis_id')
 
         # Получаем анализ и обновляем статус
-        analysis_query = select(Analysis).where(Analysis.id == analysis_id)
-        result = await db_session.execute(analysis_query)
-        analysis = result.scalar_one_or_none()
+        analysis = await get_analysis(db_session, analysis_id)
 
         if analysis:
-            analysis.status = "completed"
+            await set_analysis_status(db_session, analysis, "completed")
 
             # СПИСЫВАЕМ КВОТУ ТОЛЬКО СЕЙЧАС!
             salon_query = select(Salon).where(Salon.id == analysis.salon_id)
@@ -932,6 +1098,8 @@ async def accept_results(callback: CallbackQuery, state: FSMContext, master: Mas
             master.analyses_count += 1
 
             await db_session.commit()
+            invalidate_master_statistics(master.id)
+            invalidate_dashboard()
 
             await callback.message.edit_text(
                 f"✅ *Анализ завершен успешно!*\n\n"
@@ -945,6 +1113,9 @@ async def accept_results(callback: CallbackQuery, state: FSMContext, master: Mas
 
             await state.clear()
             logger.info(f"Analysis {analysis.id} completed successfully by master {master.name}")
+            await log_user_action(
+                callback.from_user.id, "analysis_completed", {"analysis_id": analysis.id, "salon_id": analysis.salon_id}
+            )
 
         await callback.answer("Анализ завершен!")
 
@@ -981,9 +1152,7 @@ async def cancel_dispute(callback: CallbackQuery, state: FSMContext, db_session:
         data = await state.get_data()
         analysis_id = data.get('analysis_id')
 
-        analysis_query = select(Analysis).where(Analysis.id == analysis_id)
-        result = await db_session.execute(analysis_query)
-        analysis = result.scalar_one_or_none()
+        analysis = await get_analysis(db_session, analysis_id, with_results=True)
 
         if analysis:
             results_text = format_analysis_results(analysis)
@@ -1009,18 +1178,18 @@ async def process_dispute(message: Message, state: FSMContext, db_session: Async
         dispute_reason = message.text.strip()
 
         # Обновляем анализ
-        analysis_query = select(Analysis).where(Analysis.id == analysis_id)
-        result = await db_session.execute(analysis_query)
-        analysis = result.scalar_one_or_none()
+        analysis = await get_analysis(db_session, analysis_id, with_result_data=True)
 
         if analysis:
-            analysis.status = "disputed"
+            await set_analysis_status(db_session, analysis, "disputed")
             if not analysis.result_data:
                 analysis.result_data = {}
             analysis.result_data['dispute_reason'] = dispute_reason
             analysis.result_data['dispute_date'] = datetime.now().isoformat()
             flag_modified(analysis, 'result_data')
+            await notify_owners_about_dispute(db_session, analysis.id, dispute_reason)
             await db_session.commit()
+            invalidate_master_statistics(analysis.master_id)
 
             await message.answer(
                 f"📝 *Жалоба зарегистрирована*\n\n"
@@ -1033,12 +1202,24 @@ async def process_dispute(message: Message, state: FSMContext, db_session: Async
 
             await state.clear()
             logger.info(f"Analysis {analysis.id} disputed by master")
+            await log_user_action(message.from_user.id, "analysis_disputed", {"analysis_id": analysis.id})
 
     except Exception as e:
         logger.error(f"Error in process_dispute: {e}")
         await message.answer("❌ Ошибка при регистрации жалобы")
 
 
+async def notify_owners_about_dispute(db_session: AsyncSession, analysis_id: int, reason: str):
+    """Уведомление администраторов о жалобе (в транзакции изменения статуса)"""
+    owners = await db_session.scalars(select(Owner.telegram_id).where(Owner.is_active == True))
+    await enqueue_broadcast(
+        db_session,
+        f"analysis:{analysis_id}:disputed",
+        owners.all(),
+        f"⚠️ Жалоба на результаты анализа #{analysis_id}\n\n{reason[:3000]}"
+    )
+
+
 # === ПОДЕЛИТЬСЯ И СОХРАНИТЬ РЕЗУЛЬТАТЫ ===
 @router.callback_query(F.data == "share_results")
 async def share_results(callback: CallbackQuery, state: FSMContext, db_session: AsyncSession):
@@ -1095,14 +1276,27 @@ async def cancel_analysis(callback: CallbackQuery, state: FSMContext, db_session
         analysis_id = data.get('analysis_id')
 
         if analysis_id:
-            # Удаляем незавершенный анализ
-            analysis_query = select(Analysis).where(Analysis.id == analysis_id)
-            result = await db_session.execute(analysis_query)
-            analysis = result.scalar_one_or_none()
+            await analysis_drafts.discard(analysis_id)
+
+            # Удаляем незавершенный анализ (достаточно его состояния, сам анализ не загружается)
+            analysis = await get_analysis_state(db_session, analysis_id)
 
             if analysis and analysis.status in ['started', 'ready_for_ai', 'ai_analyzing']:
-                await db_session.delete(analysis)
+                await record_status_transition(
+                    db_session, analysis.created_at, analysis.salon_id, analysis.master_id, analysis.status, None
+                )
+                await db_session.execute(
+                    delete(Analysis).where(Analysis.id == analysis.id, Analysis.created_at == analysis.created_at)
+                )
+                # Внешних ключей на секционированную analyses нет - связанные записи удаляем сами
+                await db_session.execute(delete(AnalysisReview).where(AnalysisReview.analysis_id == analysis.id))
+                await db_session.execute(delete(AIProcessingLog).where(AIProcessingLog.analysis_id == analysis.id))
                 await db_session.commit()
+                invalidate_master_statistics(analysis.master_id)
+                invalidate_dashboard()
+                await log_user_action(
+                    callback.from_user.id, "analysis_cancelled", {"analysis_id": analysis.id, "status": analysis.status}
+                )
 
         await state.clear()
 
@@ -1131,21 +1325,19 @@ async def cancel_analysis(callback: CallbackQuery, state: FSMContext, db_session
 
 # === ПРОВЕРКА ОСТАТКА КВОТ ===
 @router.message(F.text == "💰 Остаток анализов")
+@query_budget(3)
 async def check_quota(message: Message, master: Master, db_session: AsyncSession):
     """Проверка остатка анализов"""
     try:
-        master_query = select(Master).options(selectinload(Master.salon)).where(Master.id == master.id)
-        result = await db_session.execute(master_query)
-        master_with_salon = result.scalar_one_or_none()
-
-        if not master_with_salon or not master_with_salon.salon:
+        # Салон загружен вместе с мастером в AuthMiddleware
+        if not master.salon:
             await message.answer(
                 "❌ Информация о салоне не найдена.",
                 reply_markup=get_master_main_menu()
             )
             return
 
-        salon = master_with_salon.salon
+        salon = master.salon
         quota_percentage = (salon.quota_used / salon.quota_limit * 100) if salon.quota_limit > 0 else 0
 
         status_emoji = "🟢" if salon.quota_remaining > 10 else "🟡" if salon.quota_remaining > 0 else "🔴"
@@ -1157,7 +1349,7 @@ async def check_quota(message: Message, master: Master, db_session: AsyncSession
             f"💰 Доступно анализов: {salon.quota_remaining}\n"
             f"📊 Использовано: {salon.quota_used}/{salon.quota_limit}\n"
             f"📈 Процент использования: {quota_percentage:.1f}%\n\n"
-            f"👤 Ваши анализы: {master_with_salon.analyses_count}",
+            f"👤 Ваши анализы: {master.analyses_count}",
             parse_mode="Markdown"
         )
 
@@ -1167,6 +1359,7 @@ async def check_quota(message: Message, master: Master, db_session: AsyncSession
 
 
 # === ФУНКЦИИ ИИ ИНТЕГРАЦИИ (ЗАГОТОВКИ) ===
+@observe_ai_step("first_hand")
 async def analyze_first_hand_ai(photos: List[str], survey_data: str) -> dict:
     """
     ЗАГОТОВКА для анализа первой руки
@@ -1197,6 +1390,7 @@ async def analyze_first_hand_ai(photos: List[str], survey_data: str) -> dict:
     }
 
 
+@observe_ai_step("second_hand")
 async def analyze_second_hand_ai(photos: List[str], survey_data: str) -> dict:
     """
     ЗАГОТОВКА для анализа второй руки
@@ -1219,6 +1413,7 @@ async def analyze_second_hand_ai(photos: List[str], survey_data: str) -> dict:
     }
 
 
+@observe_ai_step("growth_diary")
 async def generate_growth_diary_ai(first_analysis: dict, second_analysis: dict, survey_data: str) -> dict:
     """
     ЗАГОТОВКА для создания дневника роста
@@ -1288,6 +1483,36 @@ def format_analysis_results(analysis: Analysis) -> str:
         return f"📊 *Результаты анализа*\n\n🆔 ID: {analysis.id}\n\n❌ Ошибка форматирования результатов"
 
 
+# === ИСТЕКШАЯ СЕССИЯ ===
+async def _session_expired_filter(event, state: FSMContext) -> bool:
+    return session_expired(state)
+
+
+SESSION_EXPIRED_TEXT = (
+    "⌛ *Сессия истекла*\n\n"
+    "Незавершенный анализ был сброшен из-за долгого бездействия.\n"
+    "Начните анализ заново - квота за него не списывалась."
+)
+
+
+@router.message(StateFilter(None), _session_expired_filter)
+async def session_expired_message(message: Message, state: FSMContext, master: Master, db_session: AsyncSession):
+    """Сообщение по шагу анализа, состояние которого уже сброшено"""
+    # Анализ в БД сохранился - предлагаем продолжить его
+    if not await offer_unfinished_analysis(message, state, master.id, db_session):
+        await message.answer(SESSION_EXPIRED_TEXT, parse_mode="Markdown", reply_markup=get_session_expired_keyboard())
+
+
+@router.callback_query(StateFilter(None), _session_expired_filter)
+async def session_expired_callback(callback: CallbackQuery, state: FSMContext, master: Master, db_session: AsyncSession):
+    """Нажатие кнопки шага анализа, состояние которого уже сброшено"""
+    await callback.answer("⌛ Сессия истекла")
+    if not await offer_unfinished_analysis(callback.message, state, master.id, db_session):
+        await callback.message.answer(
+            SESSION_EXPIRED_TEXT, parse_mode="Markdown", reply_markup=get_session_expired_keyboard()
+        )
+
+
 # === ОБРАБОТЧИК ПО УМОЛЧАНИЮ ===
 @router.message()
 async def handle_unknown_message(message: Message, master: Master):
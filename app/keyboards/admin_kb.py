@@ -23,6 +23,7 @@ def get_salons_menu() -> InlineKeyboardMarkup:
     builder.add(
         InlineKeyboardButton(text="➕ Добавить салон", callback_data="add_salon"),
         InlineKeyboardButton(text="📋 Список салонов", callback_data="list_salons"),
+        InlineKeyboardButton(text="🔍 Поиск салона", callback_data="search_salons"),
         InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_main")
     )
     builder.adjust(1)
@@ -35,14 +36,16 @@ def get_masters_menu() -> InlineKeyboardMarkup:
     builder.add(
         InlineKeyboardButton(text="➕ Добавить мастера", callback_data="add_master"),
         InlineKeyboardButton(text="📋 Список мастеров", callback_data="list_masters"),
+        InlineKeyboardButton(text="🔍 Поиск мастера", callback_data="search_masters"),
         InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_main")
     )
     builder.adjust(1)
     return builder.as_markup()
 
 
-def get_salon_list_keyboard(salons: List[dict]) -> InlineKeyboardMarkup:
-    """Клавиатура со списком салонов"""
+def get_salon_list_keyboard(salons: List[dict], prev_cursor: Optional[int] = None,
+                            next_cursor: Optional[int] = None) -> InlineKeyboardMarkup:
+    """Клавиатура со страницей списка салонов"""
     builder = InlineKeyboardBuilder()
 
     for salon in salons:
@@ -53,8 +56,9 @@ def get_salon_list_keyboard(salons: List[dict]) -> InlineKeyboardMarkup:
             )
         )
 
-    builder.add(InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_salons"))
     builder.adjust(1)
+    _add_page_buttons(builder, "spg", prev_cursor, next_cursor)
+    builder.row(InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_salons"))
     return builder.as_markup()
 
 
@@ -84,8 +88,9 @@ def get_salon_edit_keyboard(salon_id: int) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
-def get_master_list_keyboard(masters: List[dict]) -> InlineKeyboardMarkup:
-    """Клавиатура со списком мастеров"""
+def get_master_list_keyboard(masters: List[dict], prev_cursor: Optional[int] = None,
+                             next_cursor: Optional[int] = None) -> InlineKeyboardMarkup:
+    """Клавиатура со страницей списка мастеров"""
     builder = InlineKeyboardBuilder()
 
     for master in masters:
@@ -96,8 +101,9 @@ def get_master_list_keyboard(masters: List[dict]) -> InlineKeyboardMarkup:
             )
         )
 
-    builder.add(InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_masters"))
     builder.adjust(1)
+    _add_page_buttons(builder, "mpg", prev_cursor, next_cursor)
+    builder.row(InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_masters"))
     return builder.as_markup()
 
 
@@ -127,8 +133,10 @@ def get_master_edit_keyboard(master_id: int) -> InlineKeyboardMarkup:
 
 
 def get_salon_selection_keyboard(salons: List[dict], action: str,
-                                 master_id: Optional[int] = None) -> InlineKeyboardMarkup:
-    """Клавиатура выбора салона"""
+                                 master_id: Optional[int] = None,
+                                 prev_cursor: Optional[int] = None,
+                                 next_cursor: Optional[int] = None) -> InlineKeyboardMarkup:
+    """Клавиатура выбора салона (одна страница)"""
     builder = InlineKeyboardBuilder()
 
     for salon in salons:
@@ -143,12 +151,33 @@ def get_salon_selection_keyboard(salons: List[dict], action: str,
             )
         )
 
-    back_callback = "back_to_masters" if "master" in action else "back_to_main"
-    builder.add(InlineKeyboardButton(text="🔙 Назад", callback_data=back_callback))
     builder.adjust(1)
+    _add_page_buttons(builder, f"ssp:{action}", prev_cursor, next_cursor)
+    if action.startswith("export"):
+        back_callback = "export_data"
+    else:
+        back_callback = "back_to_masters" if "master" in action else "back_to_main"
+    builder.row(InlineKeyboardButton(text="🔙 Назад", callback_data=back_callback))
     return builder.as_markup()
 
 
+def _add_page_buttons(builder: InlineKeyboardBuilder, prefix: str,
+                      prev_cursor: Optional[int], next_cursor: Optional[int]):
+    """
+    Кнопки перелистывания страниц
+
+    Формат callback_data: "<prefix>:p:<id>" - страница перед записью id,
+    "<prefix>:n:<id>" - страница после записи id.
+    """
+    buttons = []
+    if prev_cursor is not None:
+        buttons.append(InlineKeyboardButton(text="⬅️ Предыдущие", callback_data=f"{prefix}:p:{prev_cursor}"))
+    if next_cursor is not None:
+        buttons.append(InlineKeyboardButton(text="Следующие ➡️", callback_data=f"{prefix}:n:{next_cursor}"))
+    if buttons:
+        builder.row(*buttons)
+
+
 def get_confirmation_keyboard(action: str, item_id: int) -> InlineKeyboardMarkup:
     """Клавиатура подтверждения действия"""
     builder = InlineKeyboardBuilder()
@@ -194,11 +223,63 @@ def get_settings_keyboard() -> InlineKeyboardMarkup:
         # Уведомления и информация
         InlineKeyboardButton(text="🔔 Уведомления", callback_data="notification_settings"),
         InlineKeyboardButton(text="ℹ️ О системе", callback_data="system_info"),
+        InlineKeyboardButton(text="🗓 Фоновые задачи", callback_data="scheduler_jobs"),
 
         # Назад
         InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_main")
     )
-    builder.adjust(2, 2, 2, 2, 1)
+    builder.adjust(2, 2, 2, 2, 1, 1)
+    return builder.as_markup()
+
+
+def get_backup_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура резервного копирования"""
+    builder = InlineKeyboardBuilder()
+    builder.add(
+        InlineKeyboardButton(text="💾 Создать копию", callback_data="backup_create"),
+        InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_settings")
+    )
+    builder.adjust(1)
+    return builder.as_markup()
+
+
+def get_export_kind_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура выбора данных для выгрузки"""
+    builder = InlineKeyboardBuilder()
+    builder.add(
+        InlineKeyboardButton(text="🏢 Салоны", callback_data="export_kind:salons"),
+        InlineKeyboardButton(text="👤 Мастера", callback_data="export_kind:masters"),
+        InlineKeyboardButton(text="📸 Анализы", callback_data="export_kind:analyses"),
+        InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_settings")
+    )
+    builder.adjust(3, 1)
+    return builder.as_markup()
+
+
+def get_export_period_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура выбора периода выгрузки"""
+    builder = InlineKeyboardBuilder()
+    builder.add(
+        InlineKeyboardButton(text="♾️ За все время", callback_data="export_period:all"),
+        InlineKeyboardButton(text="📅 7 дней", callback_data="export_period:7"),
+        InlineKeyboardButton(text="📅 30 дней", callback_data="export_period:30"),
+        InlineKeyboardButton(text="🗓 Текущий месяц", callback_data="export_period:month"),
+        InlineKeyboardButton(text="✏️ Указать даты", callback_data="export_period:custom"),
+        InlineKeyboardButton(text="🔙 Назад", callback_data="export_data")
+    )
+    builder.adjust(1, 2, 2, 1)
+    return builder.as_markup()
+
+
+def get_export_salon_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура выбора салона для выгрузки"""
+    builder = InlineKeyboardBuilder()
+    builder.add(
+        InlineKeyboardButton(text="🏢 Все салоны", callback_data="export_all_salons"),
+        InlineKeyboardButton(text="🔍 Выбрать салон", callback_data="export_pick_salon"),
+        InlineKeyboardButton(text="🔙 Назад", callback_data="export_data")
+    )
+    builder.adjust(2, 1)
     return builder.as_markup()
 
 
@@ -132,6 +132,27 @@ def get_cancel_analysis_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+def get_resume_analysis_keyboard(analysis_id: int, can_cancel: bool) -> InlineKeyboardMarkup:
+    """Клавиатура продолжения незавершенного анализа"""
+    builder = InlineKeyboardBuilder()
+    builder.add(InlineKeyboardButton(text="▶️ Продолжить анализ", callback_data=f"resume_analysis:{analysis_id}"))
+    if can_cancel:
+        builder.add(InlineKeyboardButton(text="❌ Отменить анализ", callback_data="cancel_analysis"))
+    builder.adjust(1)
+    return builder.as_markup()
+
+
+def get_session_expired_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура после истечения сессии анализа"""
+    builder = InlineKeyboardBuilder()
+    builder.add(
+        InlineKeyboardButton(text="📸 Начать анализ заново", callback_data="restart_analysis"),
+        InlineKeyboardButton(text="🏠 Главное меню", callback_data="back_to_main")
+    )
+    builder.adjust(1)
+    return builder.as_markup()
+
+
 def get_main_menu_button() -> InlineKeyboardMarkup:
     """Кнопка возврата в главное меню"""
     builder = InlineKeyboardBuilder()
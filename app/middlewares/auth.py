@@ -1,6 +1,7 @@
+import time
 from typing import Callable, Dict, Any, Awaitable, Optional
 from aiogram import BaseMiddleware
-from aiogram.types import TelegramObject, Message, CallbackQuery
+from aiogram.types import TelegramObject, Message, CallbackQuery, InlineQuery
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
@@ -8,6 +9,9 @@ from loguru import logger
 
 from app.database.database import get_db_session
 from app.database.models import Owner, Master
+from app.services.metrics import handler_series, track_queries
+from app.services.query_budget import query_watch
+from app.services.search import invalidate_search
 
 
 class AuthMiddleware(BaseMiddleware):
@@ -24,7 +28,7 @@ class AuthMiddleware(BaseMiddleware):
     ) -> Any:
         # Получаем user_id из события
         user_id = None
-        if isinstance(event, (Message, CallbackQuery)):
+        if isinstance(event, (Message, CallbackQuery, InlineQuery)):
             user_id = event.from_user.id
 
         if user_id is None:
@@ -55,6 +59,12 @@ class AuthMiddleware(BaseMiddleware):
             master_result = await db_session.execute(master_query)
             master = master_result.scalar_one_or_none()
 
+            # Запоминаем актуальный username мастера для поиска по @username:
+            # изменение записывается одним коммитом с обработчиком (см. DatabaseMiddleware)
+            if master and master.telegram_username != event.from_user.username:
+                master.telegram_username = event.from_user.username
+                db_session.info['search_stale'] = True
+
             # Добавляем информацию о пользователе в data
             data['user_id'] = user_id
             data['is_owner'] = owner is not None
@@ -107,6 +117,8 @@ class OwnerOnlyMiddleware(BaseMiddleware):
                     "❌ У вас нет прав для выполнения этого действия.",
                     show_alert=True
                 )
+            elif isinstance(event, InlineQuery):
+                await event.answer([], cache_time=60, is_personal=True)
             return
 
         return await handler(event, data)
@@ -158,11 +170,17 @@ class DatabaseMiddleware(BaseMiddleware):
             async for db_session in get_db_session():
                 data['db_session'] = db_session
                 try:
-                    return await handler(event, data)
+                    result = await handler(event, data)
+                    # Изменения, которые обработчик не записал сам (например, username мастера)
+                    if db_session.dirty or db_session.new or db_session.deleted:
+                        await db_session.commit()
                 except Exception as e:
                     await db_session.rollback()
                     logger.error(f"Database error in middleware: {e}")
                     raise
+                if db_session.info.pop('search_stale', False):
+                    invalidate_search()
+                return result
         else:
             return await handler(event, data)
 
@@ -181,7 +199,7 @@ class LoggingMiddleware(BaseMiddleware):
     ) -> Any:
         user_id = None
         username = None
-        if isinstance(event, (Message, CallbackQuery)):
+        if isinstance(event, (Message, CallbackQuery, InlineQuery)):
             user_id = event.from_user.id
             username = event.from_user.username
 
@@ -195,10 +213,38 @@ class LoggingMiddleware(BaseMiddleware):
                 logger.debug(f"Other message type from {user_id}: {event.content_type}")
         elif isinstance(event, CallbackQuery):
             logger.debug(f"Callback from {user_id} (@{username}): {event.data}")
+        elif isinstance(event, InlineQuery):
+            logger.debug(f"Inline query from {user_id} (@{username}): {event.query}")
 
         try:
             return await handler(event, data)
         except Exception as e:
             logger.error(f"Handler error for user {user_id}: {e}")
             # Не подавляем исключение, пусть обрабатывается дальше
-            raise
\ No newline at end of file
+            raise
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Middleware для метрик обработчиков: время, ошибки, запросы к БД за обновление и их бюджет"""
+
+    def __init__(self):
+        super().__init__()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get('handler')
+        series = handler_series(handler_object)
+        started = time.perf_counter()
+        with track_queries() as queries:
+            try:
+                return await handler(event, data)
+            except Exception:
+                series.errors.inc()
+                raise
+            finally:
+                series.observe(time.perf_counter() - started, queries)
+                query_watch.record(series.name, getattr(handler_object, 'callback', None), queries)
@@ -0,0 +1,341 @@
+"""
+Хранилище черновиков анализов
+
+Пока мастер фотографирует руки и отвечает на опрос, данные анализа
+(списки фото, ответ на опрос, статус) живут в памяти процесса.
+В таблицу analyses они записываются только в контрольных точках:
+переход к опросу, запуск ИИ анализа и периодический сброс для защиты от падения.
+
+Черновик, который мастер не изменял дольше ANALYSIS_DRAFT_EXPIRE_HOURS или
+созданный раньше ANALYSIS_RESUME_DAYS назад, считается брошенным: продолжить
+его нельзя, и уборка переводит его в статус expired.
+
+Запись выполняется только если статус и last_activity_at анализа в БД
+совпадают с прочитанными или последними записанными черновиком. Если анализ
+уже запущен, отменен или просрочен другим процессом или другой процесс
+записал свой черновик того же анализа (передача чата другому воркеру,
+перезапуск), черновик устарел: он удаляется без записи, а следующий шаг
+мастера загружает анализ из БД заново. Так устаревший черновик не затирает
+фотографии, записанные другим процессом. Сброс одного черновика
+сериализуется его блокировкой, поэтому контрольная точка и удаление
+дожидаются уже начатой периодической записи.
+"""
+
+import asyncio
+from collections import OrderedDict
+from contextlib import AsyncExitStack
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from loguru import logger
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.database import db_manager
+from app.database.models import Analysis
+from app.services.rollups import record_status_transition
+from config.settings import settings
+
+# Статусы анализа, в которых мастер еще собирает данные
+DRAFT_STATUSES = ("started", "ready_for_ai")
+
+
+def abandoned_drafts(now: Optional[datetime] = None):
+    """Условие выборки брошенных черновиков: давно без активности или старше срока продолжения"""
+    now = now or datetime.now()
+    last_activity = func.coalesce(Analysis.last_activity_at, Analysis.created_at)
+    return Analysis.status.in_(DRAFT_STATUSES) & (
+        (last_activity < now - timedelta(hours=settings.ANALYSIS_DRAFT_EXPIRE_HOURS))
+        | (Analysis.created_at < now - timedelta(days=settings.ANALYSIS_RESUME_DAYS))
+    )
+
+
+class AnalysisDraft:
+    """Черновик анализа в процессе сбора данных"""
+
+    __slots__ = (
+        "analysis_id", "salon_id", "master_id", "created_at",
+        "first_hand_photos", "second_hand_photos", "survey_response",
+        "status", "persisted_status", "persisted_activity", "dirty", "dropped", "touched_at", "lock"
+    )
+
+    def __init__(
+            self,
+            analysis_id: int,
+            salon_id: int,
+            master_id: int,
+            created_at: Optional[datetime],
+            first_hand_photos: Optional[List[str]] = None,
+            second_hand_photos: Optional[List[str]] = None,
+            survey_response: Optional[str] = None,
+            status: str = "started",
+            last_activity_at: Optional[datetime] = None
+    ):
+        self.analysis_id = analysis_id
+        self.salon_id = salon_id
+        self.master_id = master_id
+        self.created_at = created_at
+        self.first_hand_photos = list(first_hand_photos or [])
+        self.second_hand_photos = list(second_hand_photos or [])
+        self.survey_response = survey_response
+        self.status = status
+        # Статус, который уже записан в БД (для учета переходов в агрегатах)
+        self.persisted_status = status
+        # last_activity_at в БД: меняется при каждой записи черновика (версия черновика)
+        self.persisted_activity = last_activity_at
+        self.dirty = False
+        # Черновик устарел и удален из хранилища (анализ изменен другим процессом)
+        self.dropped = False
+        # Последнее изменение мастером (записывается в last_activity_at)
+        self.touched_at: Optional[datetime] = None
+        # Запись черновика в БД (контрольная точка, периодический сброс, удаление)
+        self.lock = asyncio.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        """Черновик еще можно изменять (анализ не запущен, не отменен и не просрочен)"""
+        return not self.dropped and self.status in DRAFT_STATUSES
+
+    def snapshot(self) -> dict:
+        """Копия данных черновика для записи в БД"""
+        values = {
+            "first_hand_photos": list(self.first_hand_photos),
+            "second_hand_photos": list(self.second_hand_photos),
+            "survey_response": self.survey_response,
+            "status": self.status,
+        }
+        if self.touched_at is not None:
+            values["last_activity_at"] = self.touched_at
+        return values
+
+
+class AnalysisDraftStore:
+    """Ограниченное по размеру LRU-хранилище черновиков с отложенной записью в БД"""
+
+    def __init__(self, max_entries: int, flush_interval: int):
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self._drafts: "OrderedDict[int, AnalysisDraft]" = OrderedDict()
+        # Вытесненные, но еще не записанные черновики
+        self._evicted: Dict[int, AnalysisDraft] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._drafts)
+
+    def put(self, analysis: Analysis) -> AnalysisDraft:
+        """Создание черновика для только что созданного анализа"""
+        draft = AnalysisDraft(
+            analysis_id=analysis.id,
+            salon_id=analysis.salon_id,
+            master_id=analysis.master_id,
+            created_at=analysis.created_at,
+            first_hand_photos=analysis.first_hand_photos,
+            second_hand_photos=analysis.second_hand_photos,
+            survey_response=analysis.survey_response,
+            status=analysis.status,
+            last_activity_at=analysis.last_activity_at
+        )
+        self._remember(draft)
+        return draft
+
+    async def get(self, db_session: AsyncSession, analysis_id: Optional[int]) -> Optional[AnalysisDraft]:
+        """Получение черновика; при промахе данные подгружаются из БД одним легким запросом"""
+        if not analysis_id:
+            return None
+
+        draft = self._drafts.get(analysis_id)
+        if draft is not None:
+            self._drafts.move_to_end(analysis_id)
+            return draft
+
+        draft = self._evicted.pop(analysis_id, None)
+        if draft is None:
+            result = await db_session.execute(
+                select(
+                    Analysis.salon_id,
+                    Analysis.master_id,
+                    Analysis.created_at,
+                    Analysis.first_hand_photos,
+                    Analysis.second_hand_photos,
+                    Analysis.survey_response,
+                    Analysis.status,
+                    Analysis.last_activity_at
+                ).where(Analysis.id == analysis_id)
+            )
+            row = result.one_or_none()
+            if row is None:
+                return None
+            draft = AnalysisDraft(analysis_id, *row)
+
+        self._remember(draft)
+        return draft
+
+    def mark_dirty(self, draft: AnalysisDraft):
+        """Пометить черновик как измененный мастером"""
+        draft.dirty = True
+        draft.touched_at = datetime.now()
+
+    async def discard(self, analysis_id: Optional[int]):
+        """Удаление черновика без записи в БД (после завершения уже начатой записи)"""
+        if not analysis_id:
+            return
+        draft = self._drafts.pop(analysis_id, None)
+        evicted = self._evicted.pop(analysis_id, None)
+        draft = draft or evicted
+        if draft is None:
+            return
+
+        async with draft.lock:
+            draft.dirty = False
+
+    async def flush(self, db_session: AsyncSession, analysis_id: Optional[int]) -> bool:
+        """
+        Контрольная точка: запись черновика в БД в сессии обработчика
+
+        False - записывать нечего или черновик устарел и удален из хранилища.
+        """
+        draft = self._drafts.get(analysis_id) or self._evicted.get(analysis_id)
+        if draft is None:
+            return False
+
+        async with draft.lock:
+            if not draft.dirty:
+                return False
+
+            draft.dirty = False
+            values = draft.snapshot()
+            try:
+                written = await self._write(db_session, draft, values)
+                await db_session.commit()
+            except Exception:
+                draft.dirty = True
+                raise
+
+            if not written:
+                logger.warning(f"Analysis {analysis_id} changed by another process, draft dropped")
+                self._drop(draft)
+                return False
+
+            self._persisted(draft, values)
+            return True
+
+    async def flush_all(self) -> int:
+        """Запись всех измененных черновиков в отдельной сессии"""
+        pending = [draft for draft in self._drafts.values() if draft.dirty]
+        pending.extend(self._evicted.values())
+        if not pending:
+            return 0
+
+        async with AsyncExitStack() as locks:
+            # Блокировки берутся в порядке id; пока блокировка ожидается,
+            # черновик может успеть записать контрольная точка
+            snapshots = []
+            for draft in sorted(pending, key=lambda item: item.analysis_id):
+                await locks.enter_async_context(draft.lock)
+                if draft.dirty:
+                    draft.dirty = False
+                    snapshots.append((draft, draft.snapshot()))
+            if not snapshots:
+                return 0
+
+            stale = []
+            try:
+                async for db_session in db_manager.get_session():
+                    for draft, values in snapshots:
+                        if not await self._write(db_session, draft, values):
+                            stale.append(draft)
+                    await db_session.commit()
+            except Exception as e:
+                for draft, _ in snapshots:
+                    draft.dirty = True
+                logger.error(f"Error flushing analysis drafts: {e}")
+                return 0
+
+            for draft, values in snapshots:
+                if draft in stale:
+                    self._drop(draft)
+                    continue
+                self._persisted(draft, values)
+
+        if stale:
+            logger.warning(f"Dropped {len(stale)} analysis drafts changed by another process")
+        logger.debug(f"Flushed {len(snapshots) - len(stale)} analysis drafts")
+        return len(snapshots) - len(stale)
+
+    async def _write(self, db_session: AsyncSession, draft: AnalysisDraft, values: dict) -> bool:
+        """Запись черновика, если анализ в БД не изменился с прошлого чтения или записи"""
+        query = update(Analysis).where(
+            Analysis.id == draft.analysis_id,
+            Analysis.status == draft.persisted_status,
+            Analysis.last_activity_at.is_not_distinct_from(draft.persisted_activity)
+        )
+        if draft.created_at is not None:
+            # Ключ секционирования: запрос затрагивает только секцию месяца создания
+            query = query.where(Analysis.created_at == draft.created_at)
+        result = await db_session.execute(query.values(**values))
+        if not result.rowcount:
+            return False
+
+        await record_status_transition(
+            db_session,
+            draft.created_at,
+            draft.salon_id,
+            draft.master_id,
+            draft.persisted_status,
+            values["status"]
+        )
+        return True
+
+    def _persisted(self, draft: AnalysisDraft, values: dict):
+        """Черновик записан: запомнить записанные статус и версию"""
+        draft.persisted_status = values["status"]
+        draft.persisted_activity = values.get("last_activity_at", draft.persisted_activity)
+        self._evicted.pop(draft.analysis_id, None)
+
+    def _drop(self, draft: AnalysisDraft):
+        """Удаление устаревшего черновика (если его место не занял новый)"""
+        draft.dirty = False
+        draft.dropped = True
+        if self._drafts.get(draft.analysis_id) is draft:
+            del self._drafts[draft.analysis_id]
+        if self._evicted.get(draft.analysis_id) is draft:
+            del self._evicted[draft.analysis_id]
+
+    def _remember(self, draft: AnalysisDraft):
+        self._drafts[draft.analysis_id] = draft
+        self._drafts.move_to_end(draft.analysis_id)
+
+        while len(self._drafts) > self.max_entries:
+            _, evicted = self._drafts.popitem(last=False)
+            if evicted.dirty:
+                self._evicted[evicted.analysis_id] = evicted
+
+    # === ПЕРИОДИЧЕСКИЙ СБРОС ===
+    def start(self):
+        """Запуск фонового периодического сброса"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Остановка фонового сброса с финальной записью черновиков"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush_all()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush_all()
+
+
+# Глобальный экземпляр хранилища черновиков
+analysis_drafts = AnalysisDraftStore(
+    max_entries=settings.ANALYSIS_DRAFT_MAX_ENTRIES,
+    flush_interval=settings.ANALYSIS_DRAFT_FLUSH_INTERVAL
+)
@@ -0,0 +1,97 @@
+"""
+Выборки анализов под конкретные сценарии
+
+Большие JSON поля анализа (результаты ИИ и result_data) отложены в модели
+и запрещены к ленивой загрузке. Каждый сценарий явно указывает, что ему
+нужно: только состояние, анализ без результатов или анализ с результатами.
+Результаты, перенесенные в холодный архив, подставляются прозрачно.
+Запросы и объем данных за сбор фото и опрос: benchmarks/draft_flow.py.
+"""
+
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer, undefer_group
+
+from app.database.models import Analysis
+from app.services.analysis_drafts import abandoned_drafts
+from app.services.archive import load_archived_payload
+from config.settings import settings
+
+AI_PAYLOAD_GROUP = "ai_payload"
+
+# Статусы, с которых мастер может продолжить анализ
+RESUMABLE_STATUSES = ("started", "ready_for_ai", "ai_completed")
+
+
+async def get_analysis_state(db_session: AsyncSession, analysis_id: Optional[int]) -> Optional[Row]:
+    """Ключевые поля анализа (id, status, salon_id, master_id, created_at) без фото и результатов"""
+    if not analysis_id:
+        return None
+
+    result = await db_session.execute(
+        select(
+            Analysis.id,
+            Analysis.status,
+            Analysis.salon_id,
+            Analysis.master_id,
+            Analysis.created_at
+        ).where(Analysis.id == analysis_id)
+    )
+    return result.one_or_none()
+
+
+async def get_analysis(
+        db_session: AsyncSession,
+        analysis_id: Optional[int],
+        with_results: bool = False,
+        with_result_data: bool = False
+) -> Optional[Analysis]:
+    """
+    Анализ для изменения в обработчике
+
+    with_results - подгрузить результаты ИИ (показ результатов),
+    with_result_data - подгрузить result_data (оспаривание).
+    """
+    if not analysis_id:
+        return None
+
+    query = select(Analysis).where(Analysis.id == analysis_id)
+    if with_results:
+        query = query.options(undefer_group(AI_PAYLOAD_GROUP))
+    if with_result_data:
+        query = query.options(undefer(Analysis.result_data))
+
+    result = await db_session.execute(query)
+    analysis = result.scalar_one_or_none()
+
+    if analysis is not None and with_results and analysis.payload_archived_at is not None:
+        await load_archived_payload(db_session, analysis)
+    return analysis
+
+
+async def get_unfinished_analysis(db_session: AsyncSession, master_id: int) -> Optional[Row]:
+    """
+    Последний незавершенный анализ мастера (id, status, created_at)
+
+    Поиск по индексу (master_id, created_at) в пределах ANALYSIS_RESUME_DAYS:
+    граница по created_at отсекает старые секции analyses. Брошенные черновики,
+    которые уборка еще не успела просрочить, не предлагаются.
+    """
+    now = datetime.now()
+    result = await db_session.execute(
+        select(Analysis.id, Analysis.status, Analysis.created_at)
+        .where(
+            Analysis.master_id == master_id,
+            Analysis.created_at >= now - timedelta(days=settings.ANALYSIS_RESUME_DAYS),
+            Analysis.status.in_(RESUMABLE_STATUSES),
+            ~abandoned_drafts(now)
+        )
+        .order_by(Analysis.created_at.desc())
+        .limit(1)
+    )
+    return result.one_or_none()
+
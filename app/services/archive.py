@@ -0,0 +1,124 @@
+"""
+Обслуживание секционированной таблицы analyses
+
+- заранее создает месячные секции analyses_YYYY_MM;
+- переносит результаты ИИ завершенных анализов старше ANALYSIS_ARCHIVE_AFTER_DAYS
+  в таблицу analysis_payload_archive (JSON, сжатый zlib) и очищает их в горячей таблице;
+- прозрачно возвращает архивные результаты при редком просмотре истории.
+"""
+
+import asyncio
+import json
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+from sqlalchemy import select, update, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.database.database import db_manager
+from app.database.models import Analysis, AnalysisPayloadArchive
+from app.services.partitions import ensure_monthly_partitions
+from config.settings import settings
+
+AI_PAYLOAD_FIELDS = ("ai_first_analysis", "ai_second_analysis", "ai_diary")
+
+
+async def ensure_analysis_partitions(months_ahead: Optional[int] = None) -> int:
+    """Создание секций analyses на текущий и следующие months_ahead месяцев"""
+    months_ahead = months_ahead if months_ahead is not None else settings.ANALYSIS_PARTITIONS_AHEAD
+    created = 0
+
+    async for db_session in db_manager.get_session():
+        created = await ensure_monthly_partitions(db_session, "analyses", months_ahead)
+        await db_session.commit()
+
+    return created
+
+
+def _compress(payload: Dict[str, Any]) -> bytes:
+    return zlib.compress(json.dumps(payload, ensure_ascii=False).encode("utf-8"), 6)
+
+
+def _decompress(data: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+async def _archive_batch(db_session: AsyncSession, cutoff: datetime, batch_size: int) -> int:
+    rows = (await db_session.execute(
+        select(
+            Analysis.id,
+            Analysis.created_at,
+            Analysis.ai_first_analysis,
+            Analysis.ai_second_analysis,
+            Analysis.ai_diary
+        )
+        .where(
+            Analysis.status == "completed",
+            Analysis.created_at < cutoff,
+            Analysis.payload_archived_at.is_(None)
+        )
+        .order_by(Analysis.created_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )).all()
+    if not rows:
+        return 0
+
+    # Сжатие пачки выполняется вне цикла событий
+    payloads: List[bytes] = await asyncio.to_thread(
+        lambda: [_compress({field: getattr(row, field) for field in AI_PAYLOAD_FIELDS}) for row in rows]
+    )
+
+    await db_session.execute(
+        insert(AnalysisPayloadArchive)
+        .values([
+            {"analysis_id": row.id, "analysis_created_at": row.created_at, "payload": payload}
+            for row, payload in zip(rows, payloads)
+        ])
+        .on_conflict_do_nothing(index_elements=[AnalysisPayloadArchive.analysis_id])
+    )
+    await db_session.execute(
+        update(Analysis)
+        .where(tuple_(Analysis.id, Analysis.created_at).in_([(row.id, row.created_at) for row in rows]))
+        .values(
+            ai_first_analysis=None,
+            ai_second_analysis=None,
+            ai_diary=None,
+            payload_archived_at=datetime.now()
+        )
+    )
+    await db_session.commit()
+    return len(rows)
+
+
+async def archive_ai_payloads(older_than_days: Optional[int] = None, batch_size: Optional[int] = None) -> int:
+    """Перенос результатов ИИ завершенных анализов старше older_than_days дней в холодный архив"""
+    older_than_days = older_than_days if older_than_days is not None else settings.ANALYSIS_ARCHIVE_AFTER_DAYS
+    batch_size = batch_size or settings.ANALYSIS_ARCHIVE_BATCH_SIZE
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+    archived = 0
+
+    async for db_session in db_manager.get_session():
+        while True:
+            count = await _archive_batch(db_session, cutoff, batch_size)
+            archived += count
+            if count < batch_size:
+                break
+
+    if archived:
+        logger.info(f"Archived AI payloads of {archived} analyses older than {cutoff:%Y-%m-%d}")
+    return archived
+
+
+async def load_archived_payload(db_session: AsyncSession, analysis: Analysis):
+    """Подстановка архивных результатов ИИ в загруженный анализ (без пометки об изменении)"""
+    data = await db_session.scalar(
+        select(AnalysisPayloadArchive.payload).where(AnalysisPayloadArchive.analysis_id == analysis.id)
+    )
+    payload = _decompress(data) if data is not None else {}
+    for field in AI_PAYLOAD_FIELDS:
+        set_committed_value(analysis, field, payload.get(field))
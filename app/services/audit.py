@@ -0,0 +1,199 @@
+"""
+Журнал действий пользователей (таблица system_logs)
+
+События складываются в ограниченный буфер в памяти и записываются в БД
+пачками одним многострочным INSERT: по достижении AUDIT_BATCH_SIZE событий
+или раз в AUDIT_FLUSH_INTERVAL секунд. Обработчики не ждут записи в БД.
+
+Пачка, которую БД не приняла из-за данных (несериализуемые детали, слишком
+длинное поле), делится пополам до отдельных событий: плохие события
+отбрасываются с записью в лог, остальные записываются. В буфер для повтора
+возвращаются только пачки, не записанные из-за недоступности БД.
+
+Таблица секционирована по месяцам created_at; хранение ограничивается
+удалением целых секций старше SYSTEM_LOG_RETENTION_DAYS вместо DELETE.
+"""
+
+import asyncio
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, List, Optional
+
+from loguru import logger
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+
+from app.database.database import db_manager
+from app.database.models import SystemLog
+from app.services.partitions import drop_monthly_partitions_before, ensure_monthly_partitions
+from config.settings import settings
+
+SYSTEM_LOGS_TABLE = "system_logs"
+
+
+def _is_transient(error: Exception) -> bool:
+    """Ошибка соединения с БД (повторить позже), а не ошибка в данных пачки"""
+    if isinstance(error, (OperationalError, InterfaceError, OSError, asyncio.TimeoutError)):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
+class AuditWriter:
+    """Буферизованная запись событий журнала пачками"""
+
+    def __init__(self, batch_size: int, flush_interval: int, max_pending: int):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Deque[Dict[str, Any]] = deque()
+        self._dropped = 0
+        self._rejected = 0
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def record(self, user_id: Optional[int], action: str, details: Optional[Dict[str, Any]] = None):
+        """Постановка события в буфер без ожидания записи в БД"""
+        if len(self._pending) >= self.max_pending:
+            # БД не успевает: теряем событие, но не блокируем обработчики и не растем в памяти
+            self._dropped += 1
+            if self._dropped == 1 or self._dropped % 1000 == 0:
+                logger.warning(f"Audit buffer is full, dropped {self._dropped} events")
+            return
+
+        self._pending.append({
+            "user_id": user_id,
+            "action": action[:255],
+            "details": details,
+            "created_at": datetime.now(),
+        })
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        """Запись всех накопленных событий пачками по batch_size"""
+        written = 0
+        async with self._flush_lock:
+            while self._pending:
+                batch: List[Dict[str, Any]] = [
+                    self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))
+                ]
+                try:
+                    written += await self._write(batch)
+                except Exception as e:
+                    # Незаписанные события уже возвращены в начало буфера, повторим при следующем сбросе
+                    logger.error(f"Error writing audit events: {e}")
+                    break
+
+        if written:
+            logger.debug(f"Written {written} audit events")
+        return written
+
+    async def _write(self, batch: List[Dict[str, Any]]) -> int:
+        """
+        Запись пачки; пачка, отвергнутая из-за данных, делится пополам
+
+        При ошибке соединения незаписанные части возвращаются в начало буфера,
+        а ошибка пробрасывается. Возвращает число записанных событий.
+        """
+        written = 0
+        # Части в порядке записи: следующая - в конце списка
+        parts = [batch]
+        while parts:
+            part = parts.pop()
+            try:
+                async for db_session in db_manager.get_session():
+                    await db_session.execute(insert(SystemLog), part)
+                    await db_session.commit()
+            except Exception as e:
+                if _is_transient(e):
+                    unwritten = [event for rest in [part] + parts[::-1] for event in rest]
+                    self._pending.extendleft(reversed(unwritten))
+                    raise
+                if len(part) == 1:
+                    self._rejected += 1
+                    event = part[0]
+                    logger.error(
+                        f"Dropped audit event {event['action']} of user {event['user_id']} "
+                        f"rejected by the database: {e}"
+                    )
+                    continue
+                middle = len(part) // 2
+                parts.append(part[middle:])
+                parts.append(part[:middle])
+                continue
+            written += len(part)
+        return written
+
+    # === ФОНОВЫЙ СБРОС ===
+    def start(self):
+        """Запуск фоновой записи событий"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Остановка фоновой записи с финальным сбросом буфера"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+
+async def ensure_log_partitions(months_ahead: Optional[int] = None) -> int:
+    """Создание секций system_logs на текущий и следующие months_ahead месяцев"""
+    months_ahead = months_ahead if months_ahead is not None else settings.ANALYSIS_PARTITIONS_AHEAD
+    created = 0
+
+    async for db_session in db_manager.get_session():
+        created = await ensure_monthly_partitions(db_session, SYSTEM_LOGS_TABLE, months_ahead)
+        await db_session.commit()
+
+    return created
+
+
+async def drop_expired_logs(retention_days: Optional[int] = None) -> List[str]:
+    """
+    Удаление месячных секций system_logs, целиком старше retention_days дней
+
+    Секция текущего месяца не удаляется, поэтому фактический срок хранения
+    округляется вверх до границы месяца. Возвращает имена удаленных секций.
+    """
+    retention_days = retention_days if retention_days is not None else settings.SYSTEM_LOG_RETENTION_DAYS
+    cutoff = (datetime.now() - timedelta(days=retention_days)).date()
+    dropped: List[str] = []
+
+    async for db_session in db_manager.get_session():
+        dropped = await drop_monthly_partitions_before(db_session, SYSTEM_LOGS_TABLE, cutoff)
+        await db_session.commit()
+
+    return dropped
+
+
+async def maintain_system_logs():
+    """Периодическое обслуживание журнала: новые секции и удаление устаревших"""
+    await ensure_log_partitions()
+    await drop_expired_logs()
+
+
+# Глобальный экземпляр записи журнала
+audit_writer = AuditWriter(
+    batch_size=settings.AUDIT_BATCH_SIZE,
+    flush_interval=settings.AUDIT_FLUSH_INTERVAL,
+    max_pending=settings.AUDIT_MAX_PENDING
+)
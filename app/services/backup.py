@@ -0,0 +1,294 @@
+"""
+Логическое резервное копирование и восстановление через COPY
+
+Каждая таблица выгружается командой COPY ... TO STDOUT (binary) в одной
+транзакции REPEATABLE READ, поэтому копия согласована. Поток данных сразу
+сжимается gzip в отдельный файл таблицы и не накапливается в памяти.
+Итоговый архив backup_YYYYmmdd_HHMMSS.tar содержит manifest.json
+(версия схемы, столбцы, число строк, sha256 несжатых данных) и файлы
+tables/<таблица>.copy.gz.
+
+Восстановление (в пустую или существующую БД той же версии схемы):
+    python -m app.services.backup restore backups/backup_20260101_030000.tar
+Создание копии из командной строки:
+    python -m app.services.backup create
+"""
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from loguru import logger
+from sqlalchemy import Table
+
+from app.database import models  # noqa: F401 - регистрирует таблицы в Base.metadata
+from app.database.database import Base, db_manager
+from config.settings import settings
+
+BACKUP_FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def _backup_tables() -> List[Table]:
+    """Таблицы в порядке зависимостей внешних ключей"""
+    return list(Base.metadata.sorted_tables)
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class _CopySink:
+    """Приемник потока COPY: сжатие в файл и подсчет sha256 несжатых данных"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self._file = gzip.open(path, "wb", compresslevel=6)
+
+    def write(self, chunk: bytes):
+        self.sha256.update(chunk)
+        self.size += len(chunk)
+        self._file.write(chunk)
+
+    def close(self):
+        self._file.close()
+
+
+async def _driver_connection(connection):
+    raw = await connection.get_raw_connection()
+    return raw.driver_connection
+
+
+async def _schema_version(pg) -> Optional[str]:
+    exists = await pg.fetchval("SELECT to_regclass('alembic_version') IS NOT NULL")
+    if not exists:
+        return None
+    return await pg.fetchval("SELECT version_num FROM alembic_version LIMIT 1")
+
+
+def _write_archive(path: str, work_dir: str, manifest: Dict[str, Any]):
+    manifest_path = os.path.join(work_dir, MANIFEST_NAME)
+    with open(manifest_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=2)
+
+    tmp_path = path + ".part"
+    with tarfile.open(tmp_path, "w") as archive:
+        # Манифест первым: список копий читает его без просмотра всего архива
+        archive.add(manifest_path, arcname=MANIFEST_NAME)
+        for table in manifest["tables"]:
+            archive.add(os.path.join(work_dir, table["file"]), arcname=table["file"])
+    os.replace(tmp_path, path)
+
+
+def _prune_backups(directory: str, keep: int) -> List[str]:
+    archives = sorted(name for name in os.listdir(directory) if name.startswith("backup_") and name.endswith(".tar"))
+    removed = archives[:-keep] if keep > 0 else []
+    for name in removed:
+        os.remove(os.path.join(directory, name))
+    return removed
+
+
+async def create_backup(directory: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Создание резервной копии всех таблиц
+
+    Возвращает манифест с путем к архиву, размером и длительностью.
+    """
+    directory = directory or settings.BACKUP_DIR
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = os.path.join(directory, f"backup_{stamp}.tar")
+    work_dir = os.path.join(directory, f".backup_{stamp}")
+    os.makedirs(os.path.join(work_dir, "tables"))
+    started = time.monotonic()
+
+    manifest: Dict[str, Any] = {
+        "format_version": BACKUP_FORMAT_VERSION,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "tables": [],
+    }
+
+    try:
+        async with db_manager.engine.connect() as connection:
+            pg = await _driver_connection(connection)
+            async with pg.transaction(isolation="repeatable_read", readonly=True):
+                manifest["schema_version"] = await _schema_version(pg)
+
+                for table in _backup_tables():
+                    columns = [column.name for column in table.columns]
+                    file_name = f"tables/{table.name}.copy.gz"
+                    sink = _CopySink(os.path.join(work_dir, file_name))
+
+                    async def write_chunk(chunk: bytes, sink=sink):
+                        await asyncio.to_thread(sink.write, chunk)
+
+                    try:
+                        # COPY из запроса работает и для секционированных таблиц
+                        status = await pg.copy_from_query(
+                            f"SELECT {', '.join(_quote(c) for c in columns)} FROM {_quote(table.name)}",
+                            output=write_chunk,
+                            format="binary"
+                        )
+                    finally:
+                        await asyncio.to_thread(sink.close)
+
+                    manifest["tables"].append({
+                        "name": table.name,
+                        "columns": columns,
+                        "rows": int(status.split()[-1]),
+                        "file": file_name,
+                        "sha256": sink.sha256.hexdigest(),
+                        "bytes": sink.size,
+                    })
+
+        # Длительность выгрузки и сжатия (сборка tar - только склейка файлов)
+        manifest["duration"] = round(time.monotonic() - started, 1)
+        await asyncio.to_thread(_write_archive, path, work_dir, manifest)
+    finally:
+        await asyncio.to_thread(shutil.rmtree, work_dir, True)
+
+    manifest["path"] = path
+    manifest["size"] = os.path.getsize(path)
+    removed = await asyncio.to_thread(_prune_backups, directory, settings.BACKUP_KEEP)
+
+    logger.info(
+        f"Backup created: {path}, {manifest['size']} bytes in {manifest['duration']}s"
+        + (f", removed old: {', '.join(removed)}" if removed else "")
+    )
+    return manifest
+
+
+def _read_manifest(path: str) -> Dict[str, Any]:
+    with tarfile.open(path, "r") as archive:
+        member = archive.extractfile(MANIFEST_NAME)
+        return json.load(member)
+
+
+def list_backups(directory: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Список архивов (новые первыми) с размером и данными манифеста"""
+    directory = directory or settings.BACKUP_DIR
+    if not os.path.isdir(directory):
+        return []
+
+    backups = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if not (name.startswith("backup_") and name.endswith(".tar")):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            manifest = _read_manifest(path)
+        except (tarfile.TarError, KeyError, ValueError) as e:
+            logger.warning(f"Unreadable backup {path}: {e}")
+            continue
+        manifest["path"] = path
+        manifest["size"] = os.path.getsize(path)
+        backups.append(manifest)
+    return backups
+
+
+async def _read_chunks(stream, digest) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await asyncio.to_thread(stream.read, READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+        yield chunk
+
+
+async def restore_backup(path: str, force: bool = False) -> Dict[str, int]:
+    """
+    Восстановление из архива: все таблицы очищаются и заполняются через COPY FROM
+
+    Выполняется в одной транзакции; при несовпадении контрольной суммы
+    или версии схемы (без force) изменения откатываются.
+    """
+    manifest = await asyncio.to_thread(_read_manifest, path)
+    if manifest.get("format_version") != BACKUP_FORMAT_VERSION:
+        raise ValueError(f"Unsupported backup format: {manifest.get('format_version')}")
+
+    restored: Dict[str, int] = {}
+    archive = await asyncio.to_thread(tarfile.open, path, "r")
+    try:
+        async with db_manager.engine.connect() as connection:
+            pg = await _driver_connection(connection)
+            async with pg.transaction():
+                schema_version = await _schema_version(pg)
+                if schema_version != manifest.get("schema_version") and not force:
+                    raise ValueError(
+                        f"Schema version mismatch: database {schema_version}, "
+                        f"backup {manifest.get('schema_version')} (use --force to ignore)"
+                    )
+
+                tables = ", ".join(_quote(table["name"]) for table in manifest["tables"])
+                await pg.execute(f"TRUNCATE {tables} RESTART IDENTITY CASCADE")
+
+                for table in manifest["tables"]:
+                    member = archive.extractfile(table["file"])
+                    digest = hashlib.sha256()
+                    with gzip.GzipFile(fileobj=member) as stream:
+                        status = await pg.copy_to_table(
+                            table["name"],
+                            source=_read_chunks(stream, digest),
+                            columns=table["columns"],
+                            format="binary"
+                        )
+                    if digest.hexdigest() != table["sha256"]:
+                        raise ValueError(f"Checksum mismatch for table {table['name']}")
+                    restored[table["name"]] = int(status.split()[-1])
+
+                # Последовательности id продолжаются после восстановленных записей
+                for table in manifest["tables"]:
+                    if "id" in table["columns"]:
+                        await pg.execute(
+                            f"SELECT setval(pg_get_serial_sequence($1, 'id'), "
+                            f"coalesce((SELECT max(id) FROM {_quote(table['name'])}), 0) + 1, false) "
+                            f"WHERE pg_get_serial_sequence($1, 'id') IS NOT NULL",
+                            table["name"]
+                        )
+    finally:
+        archive.close()
+
+    logger.info(f"Backup restored from {path}: {sum(restored.values())} rows in {len(restored)} tables")
+    return restored
+
+
+async def _cli(args: argparse.Namespace):
+    try:
+        if args.command == "create":
+            manifest = await create_backup(args.dir)
+            print(f"Created {manifest['path']} ({manifest['size']} bytes, {manifest['duration']}s)")
+        else:
+            restored = await restore_backup(args.path, force=args.force)
+            for name, rows in restored.items():
+                print(f"{name}: {rows}")
+    finally:
+        await db_manager.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Резервное копирование базы данных бота")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    create = commands.add_parser("create", help="создать резервную копию")
+    create.add_argument("--dir", default=None, help="каталог для архива (по умолчанию BACKUP_DIR)")
+
+    restore = commands.add_parser("restore", help="восстановить базу из архива")
+    restore.add_argument("path", help="путь к архиву backup_*.tar")
+    restore.add_argument("--force", action="store_true", help="игнорировать несовпадение версии схемы")
+
+    asyncio.run(_cli(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+HTTP-сессия клиента Bot API
+
+Один экземпляр бота на процесс использует одну сессию aiohttp с настроенным
+пулом соединений: размер пула, кэш DNS, время жизни keep-alive соединений и
+таймаут запроса задаются в настройках BOT_API_*. Ответы Bot API и вложенные
+поля запросов (клавиатуры, entities) сериализуются через orjson, если он
+установлен. Цикл событий - uvloop, если он установлен и USE_UVLOOP включен.
+Замер пропускной способности: benchmarks/bot_session.py.
+"""
+
+import asyncio
+import json
+from typing import Any, Callable, Dict, Optional
+
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from config.settings import settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - необязательная зависимость
+    orjson = None
+
+try:
+    import uvloop
+except ImportError:  # pragma: no cover - необязательная зависимость
+    uvloop = None
+
+
+def _orjson_dumps(value: Any) -> str:
+    return orjson.dumps(value).decode()
+
+
+def json_codec() -> Dict[str, Callable]:
+    """Функции json_loads/json_dumps для сессии бота"""
+    if orjson is None:
+        return {"json_loads": json.loads, "json_dumps": json.dumps}
+    return {"json_loads": orjson.loads, "json_dumps": _orjson_dumps}
+
+
+class TunedAiohttpSession(AiohttpSession):
+    """Сессия aiogram с настраиваемым пулом соединений"""
+
+    def __init__(self, pool_size: int, dns_cache_ttl: int, keepalive_timeout: float, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._connector_init.update(
+            limit=pool_size,
+            ttl_dns_cache=dns_cache_ttl,
+            keepalive_timeout=keepalive_timeout
+        )
+
+
+def create_bot_session(api_url: Optional[str] = None) -> TunedAiohttpSession:
+    """Сессия бота по настройкам BOT_API_* (api_url - свой Bot API сервер)"""
+    api_url = settings.TELEGRAM_API_URL if api_url is None else api_url
+    kwargs: Dict[str, Any] = json_codec()
+    if api_url:
+        kwargs["api"] = TelegramAPIServer.from_base(api_url)
+    return TunedAiohttpSession(
+        pool_size=settings.BOT_API_POOL_SIZE,
+        dns_cache_ttl=settings.BOT_API_DNS_CACHE_TTL,
+        keepalive_timeout=settings.BOT_API_KEEPALIVE_TIMEOUT,
+        timeout=settings.BOT_API_TIMEOUT,
+        **kwargs
+    )
+
+
+def install_event_loop_policy():
+    """uvloop в качестве цикла событий, если доступен"""
+    if settings.USE_UVLOOP and uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
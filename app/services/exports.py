@@ -0,0 +1,206 @@
+"""
+Выгрузка салонов, мастеров и анализов в CSV (gzip)
+
+Строки читаются серверным курсором пачками по EXPORT_BATCH_SIZE и сразу
+дописываются в сжатый файл, поэтому память не растет с размером выгрузки.
+Когда сжатый файл приближается к EXPORT_PART_SIZE_MB (лимит документа
+в Telegram - 50 МБ), выгрузка продолжается в следующую часть; каждая часть -
+самостоятельный CSV с заголовком.
+"""
+
+import asyncio
+import csv
+import gzip
+import io
+import os
+from datetime import date, datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import Salon, Master, Analysis
+from config.settings import settings
+
+EXPORT_KINDS = {
+    "salons": "Салоны",
+    "masters": "Мастера",
+    "analyses": "Анализы",
+}
+
+ProgressCallback = Callable[[int], Awaitable[None]]
+
+
+def _build_query(kind: str, date_from: Optional[date], date_to: Optional[date], salon_id: Optional[int]):
+    if kind == "salons":
+        created_at = Salon.created_at
+        query = select(
+            Salon.id.label("ID"),
+            Salon.name.label("Название"),
+            Salon.city.label("Город"),
+            Salon.quota_limit.label("Лимит квот"),
+            Salon.quota_used.label("Использовано квот"),
+            Salon.is_active.label("Активен"),
+            Salon.created_at.label("Создан"),
+        ).order_by(Salon.id)
+        if salon_id is not None:
+            query = query.where(Salon.id == salon_id)
+    elif kind == "masters":
+        created_at = Master.created_at
+        query = (
+            select(
+                Master.id.label("ID"),
+                Master.name.label("Имя"),
+                Master.telegram_id.label("Telegram ID"),
+                Master.telegram_username.label("Username"),
+                Master.salon_id.label("ID салона"),
+                Salon.name.label("Салон"),
+                Master.analyses_count.label("Анализов"),
+                Master.is_active.label("Активен"),
+                Master.created_at.label("Создан"),
+            )
+            .outerjoin(Salon, Master.salon_id == Salon.id)
+            .order_by(Master.id)
+        )
+        if salon_id is not None:
+            query = query.where(Master.salon_id == salon_id)
+    elif kind == "analyses":
+        created_at = Analysis.created_at
+        # Фото и результаты ИИ не выгружаются: только учетные поля анализа
+        query = (
+            select(
+                Analysis.id.label("ID"),
+                Analysis.created_at.label("Создан"),
+                Analysis.status.label("Статус"),
+                Analysis.salon_id.label("ID салона"),
+                Salon.name.label("Салон"),
+                Analysis.master_id.label("ID мастера"),
+                Master.name.label("Мастер"),
+                Analysis.ai_started_at.label("ИИ запущен"),
+                Analysis.ai_completed_at.label("ИИ завершен"),
+                Analysis.completed_at.label("Завершен"),
+            )
+            .outerjoin(Salon, Analysis.salon_id == Salon.id)
+            .outerjoin(Master, Analysis.master_id == Master.id)
+            .order_by(Analysis.created_at, Analysis.id)
+        )
+        if salon_id is not None:
+            query = query.where(Analysis.salon_id == salon_id)
+    else:
+        raise ValueError(f"Unknown export kind: {kind}")
+
+    if date_from is not None:
+        query = query.where(created_at >= date_from)
+    if date_to is not None:
+        query = query.where(created_at < date_to + timedelta(days=1))
+    return query
+
+
+def _format_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "да" if value else "нет"
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return value
+
+
+class _CsvGzipParts:
+    """Запись CSV в последовательность gzip-файлов ограниченного размера"""
+
+    def __init__(self, directory: str, base_name: str, header: Sequence[str], part_size: int):
+        self.directory = directory
+        self.base_name = base_name
+        self.header = list(header)
+        self.part_size = part_size
+        self.paths: List[str] = []
+        self._raw = None
+        self._gzip = None
+
+    def _open_part(self):
+        path = os.path.join(self.directory, f"{self.base_name}_part{len(self.paths) + 1}.csv.gz")
+        self.paths.append(path)
+        self._raw = open(path, "wb")
+        self._gzip = gzip.GzipFile(fileobj=self._raw, mode="wb", compresslevel=6)
+        # BOM, чтобы Excel открыл кириллицу в UTF-8
+        self._gzip.write(self._encode([self.header], bom=True))
+
+    def _close_part(self):
+        if self._gzip is not None:
+            self._gzip.close()
+            self._raw.close()
+            self._gzip = self._raw = None
+
+    @staticmethod
+    def _encode(rows: Sequence[Sequence[Any]], bom: bool = False) -> bytes:
+        buffer = io.StringIO()
+        if bom:
+            buffer.write("\ufeff")
+        writer = csv.writer(buffer)
+        writer.writerows(rows)
+        return buffer.getvalue().encode("utf-8")
+
+    def write(self, rows: Sequence[Sequence[Any]]):
+        if self._gzip is None:
+            self._open_part()
+        self._gzip.write(self._encode(rows))
+        # Размер сжатых данных на диске отстает на буфер компрессора - запас заложен в part_size
+        if self._raw.tell() >= self.part_size:
+            self._close_part()
+
+    def close(self):
+        if not self.paths:
+            # Пустая выгрузка - файл только с заголовком
+            self._open_part()
+        self._close_part()
+
+
+async def export_to_files(
+        db_session: AsyncSession,
+        kind: str,
+        directory: str,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        salon_id: Optional[int] = None,
+        on_progress: Optional[ProgressCallback] = None
+) -> Dict[str, Any]:
+    """
+    Потоковая выгрузка в CSV.gz в каталог directory
+
+    Возвращает {"files": [пути частей], "rows": число строк}.
+    on_progress вызывается после каждой пачки с числом выгруженных строк.
+    """
+    query = _build_query(kind, date_from, date_to, salon_id)
+    batch_size = settings.EXPORT_BATCH_SIZE
+    base_name = f"{kind}_{datetime.now():%Y%m%d_%H%M%S}"
+
+    result = await db_session.stream(query.execution_options(yield_per=batch_size))
+    parts = _CsvGzipParts(directory, base_name, list(result.keys()), settings.EXPORT_PART_SIZE_MB * 1024 * 1024)
+    rows_written = 0
+
+    try:
+        async for batch in result.partitions(batch_size):
+            rows = [[_format_value(value) for value in row] for row in batch]
+            # Сжатие и запись на диск - вне цикла событий
+            await asyncio.to_thread(parts.write, rows)
+            rows_written += len(rows)
+            if on_progress is not None:
+                await on_progress(rows_written)
+    finally:
+        await result.close()
+        await asyncio.to_thread(parts.close)
+
+    return {"files": parts.paths, "rows": rows_written}
+
+
+async def count_export_rows(
+        db_session: AsyncSession,
+        kind: str,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        salon_id: Optional[int] = None
+) -> int:
+    """Число строк выгрузки (для отображения прогресса)"""
+    query = _build_query(kind, date_from, date_to, salon_id).order_by(None)
+    return await db_session.scalar(select(func.count()).select_from(query.subquery()))
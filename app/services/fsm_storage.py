@@ -0,0 +1,299 @@
+"""
+Хранилище состояний FSM в Postgres
+
+Состояние и данные диалога хранятся в таблице fsm_states с ключом
+(chat, user, bot, thread, destiny), поэтому переживают перезапуск и доступны
+любому экземпляру бота. В границах обновления (UpdateIsolation) состояние
+и данные читаются из БД одним запросом при первом обращении, а изменения
+записываются одним upsert/delete до завершения обработки обновления:
+следующее обновление чата на любом экземпляре видит записанное состояние,
+а падение процесса не теряет завершенные шаги диалога. Вне обновления
+(например, в фоновых задачах) чтение и запись идут в БД сразу.
+
+Для одного экземпляра без общей БД состояний (FSM_STORAGE=memory) есть
+BoundedMemoryStorage: ограниченное число записей и срок простоя вместо
+бесконечно растущего MemoryStorage.
+Замер задержки чтения и записи состояния: benchmarks/fsm_storage.py.
+"""
+
+import json
+import sys
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseEventIsolation, BaseStorage, StateType, StorageKey
+from sqlalchemy import select, delete, func, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from app.database.database import db_manager
+from app.database.models import FsmState
+from config.settings import settings
+
+KEY_COLUMNS = (FsmState.chat_id, FsmState.user_id, FsmState.bot_id, FsmState.thread_id, FsmState.destiny)
+
+
+def _key_values(key: StorageKey) -> Tuple[int, int, int, int, str]:
+    return key.chat_id, key.user_id, key.bot_id, key.thread_id or 0, key.destiny
+
+
+# Состояния, прочитанные в текущем обновлении (см. UpdateIsolation)
+_update_records: ContextVar[Optional[Dict[StorageKey, "_Record"]]] = ContextVar("fsm_update_records", default=None)
+
+
+class _Record:
+    """Состояние диалога, прочитанное из БД"""
+
+    __slots__ = ("state", "data", "dirty")
+
+    def __init__(self, state: Optional[str], data: Optional[Dict[str, Any]]):
+        self.state = state
+        self.data = dict(data or {})
+        self.dirty = False
+
+
+class PostgresStorage(BaseStorage):
+    """FSM-хранилище aiogram в Postgres с чтением и записью в границах обновления"""
+
+    def create_isolation(self) -> "UpdateIsolation":
+        """Границы обновления для Dispatcher(events_isolation=...)"""
+        return UpdateIsolation(self)
+
+    async def _record(self, key: StorageKey) -> _Record:
+        records = _update_records.get()
+        record = records.get(key) if records is not None else None
+        if record is None:
+            record = await self._load(key)
+            if records is not None:
+                records[key] = record
+        return record
+
+    async def _load(self, key: StorageKey) -> _Record:
+        async for db_session in db_manager.get_session():
+            result = await db_session.execute(
+                select(FsmState.state, FsmState.data).where(tuple_(*KEY_COLUMNS) == _key_values(key))
+            )
+            row = result.one_or_none()
+            return _Record(row.state, row.data) if row else _Record(None, None)
+
+    async def _changed(self, key: StorageKey, record: _Record):
+        """Изменение внутри обновления записывается при его завершении, вне обновления - сразу"""
+        record.dirty = True
+        if _update_records.get() is None:
+            await self.write({key: record})
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._record(key)
+        record.state = state.state if isinstance(state, State) else state
+        await self._changed(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = await self._record(key)
+        record.data = data.copy()
+        await self._changed(key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._record(key)).data.copy()
+
+    async def write(self, records: Dict[StorageKey, _Record]) -> int:
+        """Запись измененных состояний одной транзакцией"""
+        upserts, deletes = [], []
+        for key, record in records.items():
+            if not record.dirty:
+                continue
+            chat_id, user_id, bot_id, thread_id, destiny = _key_values(key)
+            if record.state is None and not record.data:
+                # Очищенный диалог - строка не нужна
+                deletes.append((chat_id, user_id, bot_id, thread_id, destiny))
+            else:
+                upserts.append({
+                    "chat_id": chat_id,
+                    "user_id": user_id,
+                    "bot_id": bot_id,
+                    "thread_id": thread_id,
+                    "destiny": destiny,
+                    "state": record.state,
+                    "data": dict(record.data),
+                })
+        if not upserts and not deletes:
+            return 0
+
+        async for db_session in db_manager.get_session():
+            if upserts:
+                query = insert(FsmState)
+                await db_session.execute(
+                    query.on_conflict_do_update(
+                        index_elements=[column.name for column in KEY_COLUMNS],
+                        set_={
+                            "state": query.excluded.state,
+                            "data": query.excluded.data,
+                            "updated_at": func.now(),
+                        }
+                    ),
+                    upserts
+                )
+            if deletes:
+                await db_session.execute(delete(FsmState).where(tuple_(*KEY_COLUMNS).in_(deletes)))
+            await db_session.commit()
+
+        for record in records.values():
+            record.dirty = False
+        return len(upserts) + len(deletes)
+
+    async def close(self) -> None:
+        pass
+
+
+class UpdateIsolation(BaseEventIsolation):
+    """
+    Границы обработки одного обновления для PostgresStorage
+
+    FSMContextMiddleware входит в lock() до чтения состояния: состояние
+    читается из БД один раз за обновление, а изменения записываются одной
+    транзакцией до завершения обработки (в том числе после ошибки обработчика).
+    Обновления одного чата по очереди передает OrderedDispatcher.
+    """
+
+    def __init__(self, storage: PostgresStorage):
+        self.storage = storage
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncIterator[None]:
+        records: Dict[StorageKey, _Record] = {}
+        token = _update_records.set(records)
+        try:
+            yield
+        finally:
+            _update_records.reset(token)
+            await self.storage.write(records)
+
+    async def close(self) -> None:
+        pass
+
+
+class BoundedMemoryStorage(BaseStorage):
+    """
+    FSM-хранилище в памяти с ограничением числа записей (LRU) и сроком простоя
+
+    Данные хранятся компактно: состояние - интернированная строка, данные -
+    JSON в bytes. Для вытесненных и истекших диалогов с активным шагом
+    запоминается отметка, чтобы обработчик мог сообщить, что сессия истекла.
+    """
+
+    def __init__(self, max_entries: int, idle_ttl: int):
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        # ключ -> (состояние, данные в JSON, время последнего обращения); порядок - по обращениям
+        self._records: "OrderedDict[StorageKey, Tuple[Optional[str], Optional[bytes], float]]" = OrderedDict()
+        self._expired: "OrderedDict[StorageKey, None]" = OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def _drop(self, key: StorageKey, state: Optional[str], expired: bool):
+        if expired:
+            self.expirations += 1
+        else:
+            self.evictions += 1
+        if state is not None:
+            self._expired[key] = None
+            while len(self._expired) > self.max_entries:
+                self._expired.popitem(last=False)
+
+    def _purge(self, now: float):
+        # Записи упорядочены по последнему обращению: истекшие всегда в начале
+        while self._records:
+            key, (state, _, touched_at) = next(iter(self._records.items()))
+            if now - touched_at < self.idle_ttl:
+                break
+            del self._records[key]
+            self._drop(key, state, expired=True)
+
+    def _get(self, key: StorageKey) -> Tuple[Optional[str], Optional[bytes]]:
+        now = time.monotonic()
+        self._purge(now)
+        record = self._records.get(key)
+        if record is None:
+            return None, None
+        self._records[key] = (record[0], record[1], now)
+        self._records.move_to_end(key)
+        return record[0], record[1]
+
+    def _put(self, key: StorageKey, state: Optional[str], data: Optional[bytes]):
+        if state is None and data is None:
+            self._records.pop(key, None)
+            return
+
+        self._records[key] = (sys.intern(state) if state else None, data, time.monotonic())
+        self._records.move_to_end(key)
+        self._expired.pop(key, None)
+
+        while len(self._records) > self.max_entries:
+            evicted_key, (evicted_state, _, _) = self._records.popitem(last=False)
+            self._drop(evicted_key, evicted_state, expired=False)
+
+    def pop_expired(self, key: StorageKey) -> bool:
+        """Был ли диалог с активным шагом сброшен по сроку или вытеснен (отметка снимается)"""
+        self._purge(time.monotonic())
+        if key not in self._expired:
+            return False
+        del self._expired[key]
+        return True
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        _, data = self._get(key)
+        self._put(key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return self._get(key)[0]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        state, _ = self._get(key)
+        encoded = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode() if data else None
+        self._put(key, state, encoded)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        data = self._get(key)[1]
+        return json.loads(data) if data else {}
+
+    async def close(self) -> None:
+        pass
+
+
+async def prune_fsm_states(days: Optional[int] = None) -> int:
+    """Удаление состояний диалогов, не менявшихся дольше days дней"""
+    days = days if days is not None else settings.FSM_STATE_RETENTION_DAYS
+    cutoff = datetime.now() - timedelta(days=days)
+
+    async for db_session in db_manager.get_session():
+        result = await db_session.execute(delete(FsmState).where(FsmState.updated_at < cutoff))
+        await db_session.commit()
+        return result.rowcount
+    return 0
+
+
+def create_fsm_storage() -> BaseStorage:
+    """Хранилище состояний FSM по настройке FSM_STORAGE"""
+    if settings.FSM_STORAGE == "memory":
+        return BoundedMemoryStorage(max_entries=settings.FSM_MEMORY_MAX_ENTRIES, idle_ttl=settings.FSM_MEMORY_IDLE_TTL)
+    return PostgresStorage()
+
+
+def session_expired(state: FSMContext) -> bool:
+    """Диалог пользователя был сброшен хранилищем из-за бездействия или нехватки места"""
+    return isinstance(state.storage, BoundedMemoryStorage) and state.storage.pop_expired(state.key)
+
+
+# Глобальный экземпляр хранилища
+fsm_storage = create_fsm_storage()
+
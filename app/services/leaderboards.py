@@ -0,0 +1,90 @@
+"""
+Сервис рейтингов салонов и мастеров
+
+Каждый рейтинг - один запрос: LIMIT/OFFSET выполняются в SQL,
+а общие итоги считаются оконными функциями по всей выборке до LIMIT.
+Используется экранами статистики и может переиспользоваться отчетами и экспортом.
+"""
+
+from typing import Any, Dict
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import Salon, Master
+
+
+async def get_salon_leaderboard(db_session: AsyncSession, limit: int = 10, offset: int = 0) -> Dict[str, Any]:
+    """ТОП активных салонов по использованным квотам с количеством активных мастеров"""
+    masters_count = (
+        select(func.count(Master.id))
+        .where(Master.salon_id == Salon.id, Master.is_active == True)
+        .correlate(Salon)
+        .scalar_subquery()
+    )
+
+    query = (
+        select(
+            Salon.id,
+            Salon.name,
+            Salon.city,
+            Salon.quota_limit,
+            Salon.quota_used,
+            masters_count.label("masters_count"),
+            func.count().over().label("total_salons"),
+        )
+        .where(Salon.is_active == True)
+        .order_by(Salon.quota_used.desc(), Salon.id)
+        .limit(limit)
+        .offset(offset)
+    )
+    rows = (await db_session.execute(query)).all()
+
+    return {
+        "items": [
+            {
+                "id": row.id,
+                "name": row.name,
+                "city": row.city,
+                "quota_limit": row.quota_limit,
+                "quota_used": row.quota_used,
+                "masters_count": row.masters_count,
+            }
+            for row in rows
+        ],
+        "total": rows[0].total_salons if rows else 0,
+    }
+
+
+async def get_master_leaderboard(db_session: AsyncSession, limit: int = 15, offset: int = 0) -> Dict[str, Any]:
+    """ТОП активных мастеров по количеству анализов с общим итогом анализов"""
+    query = (
+        select(
+            Master.id,
+            Master.name,
+            Master.analyses_count,
+            Salon.name.label("salon_name"),
+            func.count().over().label("total_masters"),
+            func.sum(Master.analyses_count).over().label("total_analyses"),
+        )
+        .outerjoin(Salon, Master.salon_id == Salon.id)
+        .where(Master.is_active == True)
+        .order_by(Master.analyses_count.desc(), Master.id)
+        .limit(limit)
+        .offset(offset)
+    )
+    rows = (await db_session.execute(query)).all()
+
+    return {
+        "items": [
+            {
+                "id": row.id,
+                "name": row.name,
+                "analyses_count": row.analyses_count,
+                "salon_name": row.salon_name,
+            }
+            for row in rows
+        ],
+        "total": rows[0].total_masters if rows else 0,
+        "total_analyses": (rows[0].total_analyses or 0) if rows else 0,
+    }
@@ -0,0 +1,161 @@
+"""
+Постраничные списки салонов и мастеров для панели администратора
+
+Страницы выбираются по ключу (name, id) без OFFSET: курсор - id первой
+или последней записи текущей страницы, а сравнение идет с парой (name, id)
+этой записи. Готовые клавиатуры страниц кешируются и сбрасываются
+при изменении салонов и мастеров.
+"""
+
+from typing import Any, Dict, Optional
+
+from aiogram.types import InlineKeyboardMarkup
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import Salon, Master
+from app.keyboards.admin_kb import get_salon_list_keyboard, get_master_list_keyboard, get_salon_selection_keyboard
+from app.utils.cache import TTLCache
+from config.settings import settings
+
+# Кеш отрисованных клавиатур страниц (ключ - вид списка, направление и курсор)
+listing_cache = TTLCache(ttl=settings.ADMIN_LIST_CACHE_TTL, max_entries=512)
+
+
+def parse_page_callback(data: str) -> tuple:
+    """Разбор callback_data кнопки перелистывания: (направление, id курсора)"""
+    direction, cursor = data.rsplit(":", 2)[-2:]
+    return direction, int(cursor)
+
+
+async def _fetch_page(
+        db_session: AsyncSession,
+        query,
+        model,
+        direction: Optional[str],
+        cursor: Optional[int]
+) -> Dict[str, Any]:
+    page_size = settings.ADMIN_LIST_PAGE_SIZE
+    key = tuple_(model.name, model.id)
+
+    if cursor is not None:
+        cursor_key = tuple_(
+            select(model.name).where(model.id == cursor).correlate(None).scalar_subquery(),
+            cursor
+        )
+        query = query.where(key < cursor_key if direction == "p" else key > cursor_key)
+
+    backwards = cursor is not None and direction == "p"
+    if backwards:
+        query = query.order_by(model.name.desc(), model.id.desc())
+    else:
+        query = query.order_by(model.name, model.id)
+
+    rows = (await db_session.execute(query.limit(page_size + 1))).all()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    if backwards:
+        rows.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = cursor is not None, has_more
+
+    return {
+        "items": [row._asdict() for row in rows],
+        "prev_cursor": rows[0].id if rows and has_prev else None,
+        "next_cursor": rows[-1].id if rows and has_next else None,
+    }
+
+
+async def get_salon_page(
+        db_session: AsyncSession,
+        direction: Optional[str] = None,
+        cursor: Optional[int] = None,
+        exclude_id: Optional[int] = None
+) -> Dict[str, Any]:
+    """Страница активных салонов, упорядоченных по названию"""
+    query = select(Salon.id, Salon.name, Salon.city).where(Salon.is_active == True)
+    if exclude_id is not None:
+        query = query.where(Salon.id != exclude_id)
+
+    page = await _fetch_page(db_session, query, Salon, direction, cursor)
+    if not page["items"] and cursor is not None:
+        # Записи курсора больше нет на этом месте - начинаем с первой страницы
+        page = await _fetch_page(db_session, query, Salon, None, None)
+    return page
+
+
+async def get_master_page(
+        db_session: AsyncSession,
+        direction: Optional[str] = None,
+        cursor: Optional[int] = None
+) -> Dict[str, Any]:
+    """Страница активных мастеров, упорядоченных по имени, с названием салона"""
+    query = (
+        select(Master.id, Master.name, Salon.name.label("salon_name"))
+        .outerjoin(Salon, Master.salon_id == Salon.id)
+        .where(Master.is_active == True)
+    )
+
+    page = await _fetch_page(db_session, query, Master, direction, cursor)
+    if not page["items"] and cursor is not None:
+        page = await _fetch_page(db_session, query, Master, None, None)
+
+    for item in page["items"]:
+        item["salon_name"] = item["salon_name"] or "Салон удален"
+    return page
+
+
+async def get_salon_list_markup(
+        db_session: AsyncSession,
+        direction: Optional[str] = None,
+        cursor: Optional[int] = None
+) -> Optional[InlineKeyboardMarkup]:
+    """Клавиатура страницы списка салонов; None, если салонов нет"""
+    async def render():
+        page = await get_salon_page(db_session, direction, cursor)
+        if not page["items"]:
+            return None
+        return get_salon_list_keyboard(page["items"], page["prev_cursor"], page["next_cursor"])
+
+    return await listing_cache.get_or_load(("salons", direction, cursor), render)
+
+
+async def get_master_list_markup(
+        db_session: AsyncSession,
+        direction: Optional[str] = None,
+        cursor: Optional[int] = None
+) -> Optional[InlineKeyboardMarkup]:
+    """Клавиатура страницы списка мастеров; None, если мастеров нет"""
+    async def render():
+        page = await get_master_page(db_session, direction, cursor)
+        if not page["items"]:
+            return None
+        return get_master_list_keyboard(page["items"], page["prev_cursor"], page["next_cursor"])
+
+    return await listing_cache.get_or_load(("masters", direction, cursor), render)
+
+
+async def get_salon_selection_markup(
+        db_session: AsyncSession,
+        action: str,
+        direction: Optional[str] = None,
+        cursor: Optional[int] = None,
+        exclude_id: Optional[int] = None
+) -> Optional[InlineKeyboardMarkup]:
+    """Клавиатура страницы выбора салона; None, если выбирать не из чего"""
+    async def render():
+        page = await get_salon_page(db_session, direction, cursor, exclude_id)
+        if not page["items"]:
+            return None
+        return get_salon_selection_keyboard(
+            page["items"], action, prev_cursor=page["prev_cursor"], next_cursor=page["next_cursor"]
+        )
+
+    return await listing_cache.get_or_load(("salon_select", action, exclude_id, direction, cursor), render)
+
+
+def invalidate_listings():
+    """Сброс кеша страниц после изменения салонов или мастеров"""
+    listing_cache.invalidate()
@@ -0,0 +1,328 @@
+"""
+Метрики Prometheus
+
+HTTP-сервер на METRICS_HOST:METRICS_PORT отдает /metrics в текстовом формате
+Prometheus (воркеры супервизора - на METRICS_PORT + номер воркера):
+
+- bot_handler_seconds - время обработчика по router (модулю обработчиков) и handler,
+  bot_handler_errors_total - исключения обработчиков; частота обновлений -
+  rate(bot_handler_seconds_count) и bot_updates_total;
+- bot_update_db_queries / bot_update_db_seconds - число и время запросов к БД
+  за одно обновление, bot_db_query_seconds - время отдельного запроса,
+  bot_db_pool_checkout_wait_seconds - ожидание соединения из пула;
+- bot_ai_step_seconds / bot_ai_step_errors_total - шаги ИИ анализа;
+- очереди исполнителя обновлений, исходящей отправки (в том числе ответы 429),
+  outbox и размер FSM-хранилища.
+
+Счетчики в обработке обновлений - только увеличение значений; показатели
+очередей и хранилищ считываются из их stats() при запросе /metrics.
+"""
+
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from aiohttp import web
+from loguru import logger
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, SummaryMetricFamily
+from prometheus_client.registry import Collector
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.database.database import db_manager
+from app.services.fsm_storage import BoundedMemoryStorage, fsm_storage
+from app.services.outbox import outbox_dispatcher
+from app.services.send_queue import PRIORITY_NAMES, outbound_dispatcher
+from app.services.update_executor import update_executor
+from config.settings import settings
+
+HANDLER_SECONDS = Histogram(
+    "bot_handler_seconds",
+    "Время обработки обновления",
+    ["router", "handler"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 180, 300)
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors",
+    "Исключения обработчиков",
+    ["router", "handler"]
+)
+UPDATE_DB_QUERIES = Histogram(
+    "bot_update_db_queries",
+    "Запросов к БД за одно обновление",
+    ["router", "handler"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+)
+UPDATE_DB_SECONDS = Histogram(
+    "bot_update_db_seconds",
+    "Время запросов к БД за одно обновление",
+    ["router", "handler"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+DB_QUERY_SECONDS = Histogram(
+    "bot_db_query_seconds",
+    "Время запроса к БД",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+)
+AI_STEP_SECONDS = Histogram(
+    "bot_ai_step_seconds",
+    "Время шага ИИ анализа",
+    ["step"],
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+AI_STEP_ERRORS = Counter(
+    "bot_ai_step_errors",
+    "Ошибки шагов ИИ анализа",
+    ["step"]
+)
+
+
+# === ЗАПРОСЫ К БД ЗА ОБНОВЛЕНИЕ ===
+class QueryCounter:
+    """Число, суммарное время и тексты запросов к БД в пределах track_queries()"""
+
+    __slots__ = ("count", "seconds", "statements", "parent")
+
+    def __init__(self, parent: Optional["QueryCounter"] = None):
+        self.count = 0
+        self.seconds = 0.0
+        # Текст запроса -> сколько раз выполнен (повторы одного запроса - признак N+1)
+        self.statements: Dict[str, int] = {}
+        # Внешний track_queries (например, проверка бюджета в тесте вокруг всего обновления)
+        self.parent = parent
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """Запросы, выполненные не меньше threshold раз, по убыванию числа повторов"""
+        return sorted(
+            ((statement, count) for statement, count in self.statements.items() if count >= threshold),
+            key=lambda item: item[1],
+            reverse=True
+        )
+
+
+_current_queries: ContextVar[Optional[QueryCounter]] = ContextVar("current_queries", default=None)
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryCounter]:
+    """Подсчет запросов к БД, выполненных внутри блока (в том числе во вложенных вызовах)"""
+    counter = QueryCounter(_current_queries.get())
+    token = _current_queries.set(counter)
+    try:
+        yield counter
+    finally:
+        _current_queries.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+    counter = _current_queries.get()
+    while counter is not None:
+        counter.statements[statement] = counter.statements.get(statement, 0) + 1
+        counter = counter.parent
+
+
+def _finish_query(conn):
+    started = conn.info.get("query_started")
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    DB_QUERY_SECONDS.observe(elapsed)
+    counter = _current_queries.get()
+    while counter is not None:
+        counter.count += 1
+        counter.seconds += elapsed
+        counter = counter.parent
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _finish_query(conn)
+
+
+def _handle_error(exception_context):
+    if exception_context.connection is not None:
+        _finish_query(exception_context.connection)
+
+
+def instrument_engine(engine: AsyncEngine):
+    """Учет времени запросов движка (контекст обновления передается в greenlet SQLAlchemy)"""
+    sync_engine = engine.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+# === ОБРАБОТЧИКИ ===
+class HandlerSeries:
+    """Метрики одного обработчика (дочерние серии создаются один раз)"""
+
+    __slots__ = ("name", "seconds", "errors", "db_queries", "db_seconds")
+
+    def __init__(self, router: str, handler: str):
+        self.name = f"{router}.{handler}"
+        self.seconds = HANDLER_SECONDS.labels(router, handler)
+        self.errors = HANDLER_ERRORS.labels(router, handler)
+        self.db_queries = UPDATE_DB_QUERIES.labels(router, handler)
+        self.db_seconds = UPDATE_DB_SECONDS.labels(router, handler)
+
+    def observe(self, seconds: float, queries: QueryCounter):
+        self.seconds.observe(seconds)
+        self.db_queries.observe(queries.count)
+        self.db_seconds.observe(queries.seconds)
+
+
+_handler_series: Dict[Any, HandlerSeries] = {}
+
+
+def handler_series(handler: Any) -> HandlerSeries:
+    """Метрики обработчика aiogram (data['handler'] в middleware)"""
+    callback = getattr(handler, "callback", None)
+    series = _handler_series.get(callback)
+    if series is None:
+        if callback is None:
+            router, name = "unknown", "unknown"
+        else:
+            # У каждого модуля app/handlers свой роутер - модуль и есть метка роутера
+            router = getattr(callback, "__module__", "unknown").rsplit(".", 1)[-1]
+            name = getattr(callback, "__name__", type(callback).__name__)
+        series = _handler_series[callback] = HandlerSeries(router, name)
+    return series
+
+
+# === ИИ АНАЛИЗ ===
+def observe_ai_step(step: str) -> Callable:
+    """Декоратор шага ИИ анализа: время и ошибки (исключение или результат со status=error)"""
+    seconds = AI_STEP_SECONDS.labels(step)
+    errors = AI_STEP_ERRORS.labels(step)
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                seconds.observe(time.perf_counter() - started)
+            if isinstance(result, dict) and result.get("status") == "error":
+                errors.inc()
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+# === ПОКАЗАТЕЛИ КОМПОНЕНТОВ ===
+def _gauge(name: str, documentation: str, value: float) -> GaugeMetricFamily:
+    return GaugeMetricFamily(name, documentation, value=value)
+
+
+def _counter(name: str, documentation: str, value: float) -> CounterMetricFamily:
+    return CounterMetricFamily(name, documentation, value=value)
+
+
+class _StatsCollector(Collector):
+    """Очереди и счетчики компонентов на момент запроса /metrics"""
+
+    def collect(self):
+        # Исполнитель обновлений
+        executor = update_executor.stats()
+        yield _counter("bot_updates", "Обработанные обновления", executor["processed"])
+        yield _counter("bot_updates_dropped", "Отброшенные при переполнении очереди обновления", executor["dropped"])
+        yield _gauge("bot_updates_pending", "Обновления в очередях и в работе", executor["pending"])
+        yield _gauge("bot_updates_running", "Обновления в работе", executor["running"])
+        yield _gauge("bot_update_chats", "Чаты с обновлениями в очереди", executor["chats"])
+        yield _gauge("bot_update_deepest_chat_queue", "Самая длинная очередь чата", executor["deepest_chat_queue"])
+        yield SummaryMetricFamily(
+            "bot_update_queue_wait_seconds",
+            "Ожидание обновления в очереди",
+            count_value=update_executor.processed,
+            sum_value=update_executor.wait_seconds_sum
+        )
+
+        # Исходящая отправка
+        outbound = outbound_dispatcher.stats()
+        yield _gauge("bot_send_in_flight", "Запросы к Bot API в очереди и в работе", outbound["in_flight"])
+        depth = GaugeMetricFamily("bot_send_queue_depth", "Ожидающие лимита отправки", labels=["queue"])
+        depth.add_metric(["global"], outbound["global_waiting"])
+        depth.add_metric(["chat"], outbound["chat_waiting"])
+        yield depth
+        yield _gauge("bot_send_chats", "Чаты с активным лимитом отправки", outbound["chats"])
+        yield _counter("bot_send_rate_limited", "Ответы 429 от Bot API", outbound["rate_limited"])
+        yield _counter("bot_send_retries", "Повторы отправки после 429", outbound["retries"])
+        yield _counter("bot_send_failed", "Отправки, не прошедшие после 429", outbound["failed"])
+        latency = SummaryMetricFamily(
+            "bot_send_latency_seconds", "Время от постановки в очередь до ответа Bot API", labels=["priority"]
+        )
+        for priority, name in PRIORITY_NAMES.items():
+            stats = outbound_dispatcher.latency[priority]
+            latency.add_metric([name], count_value=stats.count, sum_value=stats.seconds_sum)
+        yield latency
+
+        # Outbox
+        outbox = outbox_dispatcher.stats()
+        yield _counter("bot_outbox_sent", "Отправленные уведомления outbox", outbox["sent"])
+        yield _counter("bot_outbox_retried", "Отложенные на повтор уведомления outbox", outbox["retried"])
+        yield _counter("bot_outbox_failed", "Окончательно не отправленные уведомления outbox", outbox["failed"])
+
+        # FSM-хранилище
+        if isinstance(fsm_storage, BoundedMemoryStorage):
+            yield _gauge("bot_fsm_entries", "Диалоги в FSM-хранилище (в памяти процесса)", len(fsm_storage))
+            yield _counter("bot_fsm_evictions", "Вытесненные из FSM-хранилища диалоги", fsm_storage.evictions)
+            yield _counter("bot_fsm_expirations", "Истекшие диалоги FSM-хранилища", fsm_storage.expirations)
+
+        # Пул соединений с БД
+        pool = db_manager.engine.pool
+        yield _gauge("bot_db_pool_size", "Соединения в пуле", pool.size())
+        yield _gauge("bot_db_pool_checked_out", "Выданные соединения", pool.checkedout())
+        yield _gauge("bot_db_pool_overflow", "Соединения сверх размера пула", max(pool.overflow(), 0))
+        if hasattr(pool, "checkouts"):
+            yield SummaryMetricFamily(
+                "bot_db_pool_checkout_wait_seconds",
+                "Ожидание соединения из пула",
+                count_value=pool.checkouts,
+                sum_value=pool.checkout_seconds_sum
+            )
+
+
+# === HTTP-СЕРВЕР ===
+class MetricsServer:
+    """HTTP-сервер /metrics"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(body=generate_latest(REGISTRY), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+    async def start(self, port_offset: int = 0):
+        """Запуск на METRICS_PORT + port_offset (номер воркера); METRICS_PORT=0 - выключено"""
+        if not self.port or self._runner is not None:
+            return
+        REGISTRY.register(_StatsCollector())
+
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        port = self.port + port_offset
+        await web.TCPSite(runner, self.host, port).start()
+        self._runner = runner
+        logger.info(f"Metrics server listening on {self.host}:{port}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+# Глобальный сервер метрик
+metrics_server = MetricsServer(host=settings.METRICS_HOST, port=settings.METRICS_PORT)
@@ -0,0 +1,358 @@
+"""
+Надежная доставка уведомлений Telegram через outbox
+
+Обработчик не отправляет уведомление сам после коммита: он записывает его
+в таблицу outbox той же транзакцией, что и изменение данных (завершение ИИ
+анализа, пополнение квоты, жалоба на результаты). Если коммит прошел, а
+процесс упал или Telegram не ответил, уведомление все равно будет доставлено.
+
+Диспетчер забирает пачку ожидающих уведомлений (FOR UPDATE SKIP LOCKED с
+арендой на OUTBOX_LEASE секунд, поэтому несколько экземпляров не отправляют
+одно и то же), фиксирует аренду и освобождает соединение с БД до отправки.
+Неудачные отправки повторяются с экспоненциальной задержкой до
+OUTBOX_MAX_ATTEMPTS попыток; заблокировавший бота пользователь и прочие
+постоянные ошибки помечаются failed сразу. Повторная постановка с тем же
+dedup_key игнорируется, пока запись хранится (OUTBOX_RETENTION_DAYS).
+
+Доставка - как минимум один раз: если процесс упадет между отправкой и
+отметкой sent, уведомление будет отправлено повторно после истечения аренды.
+"""
+
+import asyncio
+from collections import defaultdict
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.types import InlineKeyboardMarkup
+from loguru import logger
+from sqlalchemy import delete, event, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.database import db_manager
+from app.database.models import OutboxMessage
+from app.services.send_queue import PRIORITY_BULK, PRIORITY_INTERACTIVE, bulk_sends
+from config.settings import settings
+
+
+def _outbox_row(
+        dedup_key: str,
+        chat_id: int,
+        text: str,
+        parse_mode: Optional[str],
+        reply_markup: Optional[InlineKeyboardMarkup],
+        edit_message_id: Optional[int],
+        bulk: bool
+) -> Dict[str, Any]:
+    return {
+        "dedup_key": dedup_key[:255],
+        "chat_id": chat_id,
+        "body": text,
+        "parse_mode": parse_mode,
+        "reply_markup": reply_markup.model_dump(exclude_none=True) if reply_markup else None,
+        "edit_message_id": edit_message_id,
+        "priority": PRIORITY_BULK if bulk else PRIORITY_INTERACTIVE,
+    }
+
+
+async def _insert(db_session: AsyncSession, rows: List[Dict[str, Any]]):
+    if not rows:
+        return
+    await db_session.execute(
+        insert(OutboxMessage).values(rows).on_conflict_do_nothing(index_elements=["dedup_key"])
+    )
+    # Диспетчер забирает уведомления сразу после коммита, не дожидаясь опроса
+    event.listen(db_session.sync_session, "after_commit", _wake_dispatcher, once=True)
+
+
+async def enqueue_notification(
+        db_session: AsyncSession,
+        dedup_key: str,
+        chat_id: int,
+        text: str,
+        parse_mode: Optional[str] = None,
+        reply_markup: Optional[InlineKeyboardMarkup] = None,
+        edit_message_id: Optional[int] = None,
+        bulk: bool = False
+):
+    """
+    Запись уведомления в outbox в текущей транзакции (коммит - за вызывающим)
+
+    edit_message_id - сообщение, которое нужно изменить; если изменить нельзя,
+    отправляется новое. bulk - низкий приоритет массовой рассылки.
+    """
+    await _insert(db_session, [
+        _outbox_row(dedup_key, chat_id, text, parse_mode, reply_markup, edit_message_id, bulk)
+    ])
+
+
+async def enqueue_broadcast(
+        db_session: AsyncSession,
+        dedup_key: str,
+        chat_ids: Iterable[int],
+        text: str,
+        parse_mode: Optional[str] = None,
+        reply_markup: Optional[InlineKeyboardMarkup] = None
+):
+    """Одно уведомление нескольким получателям одним INSERT (ключ - dedup_key:chat_id)"""
+    await _insert(db_session, [
+        _outbox_row(f"{dedup_key}:{chat_id}", chat_id, text, parse_mode, reply_markup, None, True)
+        for chat_id in chat_ids
+    ])
+
+
+def _wake_dispatcher(_session):
+    outbox_dispatcher.wake()
+
+
+class OutboxDispatcher:
+    """Отправка уведомлений из outbox пачками с повторами"""
+
+    def __init__(
+            self,
+            batch_size: int,
+            poll_interval: int,
+            max_attempts: int,
+            retry_base: int,
+            retry_max: int,
+            lease: int
+    ):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.lease = lease
+        self._bot: Optional[Bot] = None
+        self._wakeup = asyncio.Event()
+        self._drain_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        # Счетчики для /health и метрик
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _backoff(self, attempts: int) -> int:
+        return min(self.retry_base * 2 ** (attempts - 1), self.retry_max)
+
+    async def _claim(self) -> Sequence[Row]:
+        """Аренда пачки ожидающих уведомлений; соединение освобождается до отправки"""
+        async for db_session in db_manager.get_session():
+            now = datetime.now()
+            result = await db_session.execute(
+                select(
+                    OutboxMessage.id,
+                    OutboxMessage.chat_id,
+                    OutboxMessage.body,
+                    OutboxMessage.parse_mode,
+                    OutboxMessage.reply_markup,
+                    OutboxMessage.edit_message_id,
+                    OutboxMessage.priority,
+                    OutboxMessage.attempts
+                )
+                .where(OutboxMessage.status == "pending", OutboxMessage.next_attempt_at <= now)
+                .order_by(OutboxMessage.next_attempt_at, OutboxMessage.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            rows = result.all()
+            if rows:
+                # Пока аренда не истекла, другие экземпляры эти записи не возьмут
+                await db_session.execute(
+                    update(OutboxMessage)
+                    .where(OutboxMessage.id.in_([row.id for row in rows]))
+                    .values(next_attempt_at=now + timedelta(seconds=self.lease))
+                )
+            await db_session.commit()
+            return rows
+        return []
+
+    async def _send(self, message: Row):
+        markup = InlineKeyboardMarkup.model_validate(message.reply_markup) if message.reply_markup else None
+        with bulk_sends() if message.priority == PRIORITY_BULK else nullcontext():
+            if message.edit_message_id:
+                try:
+                    await self._bot.edit_message_text(
+                        message.body,
+                        chat_id=message.chat_id,
+                        message_id=message.edit_message_id,
+                        parse_mode=message.parse_mode,
+                        reply_markup=markup
+                    )
+                    return
+                except TelegramBadRequest as e:
+                    # Повтор после уже выполненного изменения
+                    if "message is not modified" in str(e):
+                        return
+                    # Сообщение удалено или уже не редактируется - отправляем новое
+                    logger.debug(f"Outbox message {message.id}: edit failed ({e}), sending new message")
+            await self._bot.send_message(
+                message.chat_id,
+                message.body,
+                parse_mode=message.parse_mode,
+                reply_markup=markup
+            )
+
+    async def _send_chat(self, messages: List[Row], results: Dict[int, Optional[Exception]]):
+        # Уведомления одного чата - по порядку
+        for message in messages:
+            try:
+                await self._send(message)
+                results[message.id] = None
+            except Exception as e:
+                results[message.id] = e
+
+    async def _record(self, rows: Sequence[Row], results: Dict[int, Optional[Exception]]):
+        now = datetime.now()
+        sent_ids = [row.id for row in rows if results.get(row.id) is None]
+
+        async for db_session in db_manager.get_session():
+            if sent_ids:
+                await db_session.execute(
+                    update(OutboxMessage)
+                    .where(OutboxMessage.id.in_(sent_ids))
+                    .values(
+                        status="sent",
+                        sent_at=now,
+                        attempts=OutboxMessage.attempts + 1,
+                        last_error=None
+                    )
+                )
+
+            for row in rows:
+                error = results.get(row.id)
+                if error is None:
+                    continue
+                attempts = row.attempts + 1
+                # Бот заблокирован, чат не найден и т.п. - повтор не поможет
+                permanent = isinstance(error, (TelegramForbiddenError, TelegramBadRequest))
+                if permanent or attempts >= self.max_attempts:
+                    self.failed += 1
+                    status = "failed"
+                    logger.warning(f"Outbox message {row.id} to chat {row.chat_id} failed: {error}")
+                else:
+                    self.retried += 1
+                    status = "pending"
+                await db_session.execute(
+                    update(OutboxMessage)
+                    .where(OutboxMessage.id == row.id)
+                    .values(
+                        status=status,
+                        attempts=attempts,
+                        next_attempt_at=now + timedelta(seconds=self._backoff(attempts)),
+                        last_error=str(error)[:1000]
+                    )
+                )
+            await db_session.commit()
+
+        self.sent += len(sent_ids)
+
+    async def drain(self) -> int:
+        """Отправка всех уведомлений, срок которых наступил; возвращает число отправленных"""
+        if self._bot is None:
+            return 0
+
+        sent = 0
+        async with self._drain_lock:
+            while True:
+                rows = await self._claim()
+                if not rows:
+                    break
+
+                by_chat: Dict[int, List[Row]] = defaultdict(list)
+                for row in rows:
+                    by_chat[row.chat_id].append(row)
+                results: Dict[int, Optional[Exception]] = {}
+                # Лимиты скорости соблюдает очередь отправки сессии бота
+                await asyncio.gather(*(self._send_chat(messages, results) for messages in by_chat.values()))
+
+                await self._record(rows, results)
+                sent += sum(1 for error in results.values() if error is None)
+                if len(rows) < self.batch_size:
+                    break
+        return sent
+
+    # === ФОНОВАЯ ОТПРАВКА ===
+    def start(self, bot: Bot):
+        """Запуск фоновой отправки уведомлений ботом bot"""
+        self._bot = bot
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self, timeout: float = 0):
+        """
+        Остановка фоновой отправки с последней отправкой накопленного (до timeout секунд)
+
+        Арендованные, но не отправленные уведомления будут отправлены
+        после истечения аренды этим или другим экземпляром.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if timeout > 0:
+            try:
+                await asyncio.wait_for(self.drain(), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Outbox not drained in {timeout}s, the rest will be sent after restart")
+            except Exception as e:
+                logger.error(f"Error draining outbox: {e}")
+
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.drain()
+            except Exception as e:
+                logger.error(f"Error draining outbox: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"sent": self.sent, "retried": self.retried, "failed": self.failed}
+
+
+async def count_outbox(db_session: AsyncSession) -> Dict[str, int]:
+    """Число уведомлений в outbox по статусам"""
+    result = await db_session.execute(
+        select(OutboxMessage.status, func.count()).group_by(OutboxMessage.status)
+    )
+    return dict(result.all())
+
+
+async def prune_outbox(days: Optional[int] = None) -> int:
+    """Удаление отправленных и окончательно неудачных уведомлений старше days дней"""
+    days = days if days is not None else settings.OUTBOX_RETENTION_DAYS
+    cutoff = datetime.now() - timedelta(days=days)
+
+    async for db_session in db_manager.get_session():
+        result = await db_session.execute(
+            delete(OutboxMessage).where(OutboxMessage.status != "pending", OutboxMessage.created_at < cutoff)
+        )
+        await db_session.commit()
+        return result.rowcount
+    return 0
+
+
+# Глобальный диспетчер outbox
+outbox_dispatcher = OutboxDispatcher(
+    batch_size=settings.OUTBOX_BATCH_SIZE,
+    poll_interval=settings.OUTBOX_POLL_INTERVAL,
+    max_attempts=settings.OUTBOX_MAX_ATTEMPTS,
+    retry_base=settings.OUTBOX_RETRY_BASE,
+    retry_max=settings.OUTBOX_RETRY_MAX,
+    lease=settings.OUTBOX_LEASE
+)
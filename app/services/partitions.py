@@ -0,0 +1,128 @@
+"""
+Месячные секции таблиц, секционированных по created_at
+
+Секции называются <table>_YYYY_MM и покрывают [1-е число месяца, 1-е число следующего).
+Секция <table>_default принимает строки вне созданных месяцев; при создании
+секции месяца его строки переносятся из нее в новую секцию.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import List
+
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def next_month(day: date) -> date:
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_{month:%Y_%m}"
+
+
+async def _create_partition(db_session: AsyncSession, table: str, month: date):
+    """
+    Создание секции месяца
+
+    Если секция по умолчанию уже содержит строки этого месяца, CREATE TABLE ...
+    PARTITION OF завершился бы ошибкой: секция по умолчанию отсоединяется,
+    ее строки месяца переносятся в новую секцию, и она присоединяется обратно.
+    Все шаги выполняются в транзакции вызывающего кода.
+    """
+    following = next_month(month)
+    partition = partition_name(table, month)
+    default = f"{table}_default"
+    bounds = {
+        "start": datetime.combine(month, datetime.min.time()),
+        "end": datetime.combine(following, datetime.min.time())
+    }
+    create = (
+        f"CREATE TABLE {partition} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{following.isoformat()}')"
+    )
+
+    has_default = await db_session.scalar(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": default})
+    in_default = has_default and await db_session.scalar(
+        text(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE created_at >= :start AND created_at < :end)"),
+        bounds
+    )
+    if not in_default:
+        await db_session.execute(text(create))
+        return
+
+    await db_session.execute(text(f"ALTER TABLE {table} DETACH PARTITION {default}"))
+    await db_session.execute(text(create))
+    moved = await db_session.execute(
+        text(f"INSERT INTO {partition} SELECT * FROM {default} WHERE created_at >= :start AND created_at < :end"),
+        bounds
+    )
+    await db_session.execute(
+        text(f"DELETE FROM {default} WHERE created_at >= :start AND created_at < :end"),
+        bounds
+    )
+    await db_session.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT"))
+    logger.info(f"Moved {moved.rowcount} rows from {default} to {partition}")
+
+
+async def ensure_monthly_partitions(db_session: AsyncSession, table: str, months_ahead: int) -> int:
+    """Создание секций на текущий и следующие months_ahead месяцев; коммит - за вызывающим кодом"""
+    month = month_start(date.today())
+    created = 0
+
+    for _ in range(months_ahead + 1):
+        partition = partition_name(table, month)
+        exists = await db_session.scalar(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": partition})
+        if not exists:
+            await _create_partition(db_session, table, month)
+            created += 1
+            logger.info(f"Created partition {partition}")
+        month = next_month(month)
+
+    return created
+
+
+async def list_monthly_partitions(db_session: AsyncSession, table: str) -> List[date]:
+    """Месяцы существующих секций таблицы (без секции по умолчанию)"""
+    result = await db_session.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = CAST(:table AS regclass)"
+        ),
+        {"table": table}
+    )
+
+    months = []
+    prefix = f"{table}_"
+    for (name,) in result.all():
+        suffix = name[len(prefix):] if name.startswith(prefix) else ""
+        try:
+            year, month = suffix.split("_")
+            months.append(date(int(year), int(month), 1))
+        except ValueError:
+            continue
+    return sorted(months)
+
+
+async def drop_monthly_partitions_before(db_session: AsyncSession, table: str, cutoff: date) -> List[str]:
+    """
+    Удаление секций, все строки которых старше cutoff (DROP TABLE вместо построчного DELETE)
+
+    Коммит - за вызывающим кодом. Возвращает имена удаленных секций.
+    """
+    dropped = []
+    for month in await list_monthly_partitions(db_session, table):
+        if next_month(month) > cutoff:
+            continue
+        partition = partition_name(table, month)
+        await db_session.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition}"))
+        await db_session.execute(text(f"DROP TABLE {partition}"))
+        dropped.append(partition)
+        logger.info(f"Dropped partition {partition}")
+    return dropped
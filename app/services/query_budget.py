@@ -0,0 +1,210 @@
+"""
+Бюджет запросов к БД на обновление и поиск N+1
+
+Запросы каждого обновления считаются событиями движка SQLAlchemy
+(track_queries в app.services.metrics) с меткой обработчика, включая запросы
+middleware (AuthMiddleware и т.п.). По итогам обновления:
+
+- превышение бюджета обработчика (@query_budget(N), для остальных -
+  QUERY_BUDGET_DEFAULT) - предупреждение в лог;
+- один и тот же запрос QUERY_REPEAT_THRESHOLD раз и больше за обновление -
+  предупреждение о возможном N+1 с текстом запроса;
+- раз в QUERY_REPORT_INTERVAL секунд - сводка обработчиков с наибольшим
+  числом запросов на обновление.
+
+Бюджет объявляется под декоратором роутера:
+
+    @router.message(F.text == "💰 Остаток анализов")
+    @query_budget(3)
+    async def check_quota(...):
+
+В тестах превышение бюджета проверяется assert_query_budget:
+
+    with assert_query_budget(check_quota):
+        await check_quota(message, master, db_session)
+"""
+
+import asyncio
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+
+from loguru import logger
+
+from app.services.metrics import QueryCounter, track_queries
+from config.settings import settings
+
+# Предупреждения одного обработчика - не чаще раза в N секунд
+WARN_EVERY = 60
+
+
+def query_budget(limit: int) -> Callable:
+    """Объявление бюджета запросов к БД на одно обновление для обработчика"""
+
+    def decorator(func: Callable) -> Callable:
+        # Функция возвращается как есть: aiogram разбирает ее параметры
+        func.query_budget = limit
+        return func
+
+    return decorator
+
+
+def declared_budget(callback: Any) -> int:
+    """Бюджет обработчика (0 - без ограничения)"""
+    return getattr(callback, "query_budget", settings.QUERY_BUDGET_DEFAULT)
+
+
+def _shorten(statement: str, length: int = 300) -> str:
+    statement = " ".join(statement.split())
+    return statement if len(statement) <= length else statement[:length] + "..."
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Обработчик выполнил больше запросов к БД, чем объявлено"""
+
+
+@contextmanager
+def assert_query_budget(
+        handler_or_limit: Union[Callable, int],
+        max_repeats: Optional[int] = None
+) -> Iterator[QueryCounter]:
+    """
+    Для тестов: ошибка, если внутри блока выполнено больше запросов, чем
+    объявлено обработчиком (или передано числом), либо один запрос
+    повторен больше max_repeats раз
+    """
+    if isinstance(handler_or_limit, int):
+        limit = handler_or_limit
+    else:
+        limit = declared_budget(handler_or_limit)
+
+    with track_queries() as queries:
+        yield queries
+
+    repeated = queries.repeated(max_repeats + 1) if max_repeats is not None else []
+    if (limit and queries.count > limit) or repeated:
+        details = "\n".join(
+            f"  {count}x {_shorten(statement)}"
+            for statement, count in (repeated or queries.repeated(2) or list(queries.statements.items()))
+        )
+        raise QueryBudgetExceeded(f"{queries.count} queries, budget {limit}:\n{details}")
+
+
+class _HandlerQueries:
+    """Накопленные запросы одного обработчика"""
+
+    __slots__ = ("updates", "queries", "seconds", "max_queries", "over_budget", "repeats", "warned_at")
+
+    def __init__(self):
+        self.updates = 0
+        self.queries = 0
+        self.seconds = 0.0
+        self.max_queries = 0
+        self.over_budget = 0
+        self.repeats = 0
+        self.warned_at = 0.0
+
+
+class QueryWatch:
+    """Проверка бюджета запросов и повторов по обновлениям, сводка по обработчикам"""
+
+    def __init__(self, repeat_threshold: int, report_interval: int, report_size: int = 10):
+        self.repeat_threshold = repeat_threshold
+        self.report_interval = report_interval
+        self.report_size = report_size
+        self._handlers: Dict[str, _HandlerQueries] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, handler: str, callback: Any, queries: QueryCounter):
+        """Итоги одного обновления обработчика handler"""
+        stats = self._handlers.get(handler)
+        if stats is None:
+            stats = self._handlers[handler] = _HandlerQueries()
+        stats.updates += 1
+        stats.queries += queries.count
+        stats.seconds += queries.seconds
+        stats.max_queries = max(stats.max_queries, queries.count)
+
+        budget = declared_budget(callback)
+        over_budget = bool(budget) and queries.count > budget
+        repeated = queries.repeated(self.repeat_threshold) if self.repeat_threshold else []
+        if over_budget:
+            stats.over_budget += 1
+        if repeated:
+            stats.repeats += 1
+        if not (over_budget or repeated):
+            return
+
+        now = time.monotonic()
+        if now - stats.warned_at < WARN_EVERY:
+            return
+        stats.warned_at = now
+        if over_budget:
+            logger.warning(
+                f"Handler {handler} exceeded query budget: {queries.count} queries "
+                f"({queries.seconds * 1000:.1f} ms), budget {budget}"
+            )
+        for statement, count in repeated:
+            logger.warning(f"Possible N+1 in {handler}: {count}x {_shorten(statement)}")
+
+    def top(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Обработчики по убыванию среднего числа запросов на обновление"""
+        items = [
+            {
+                "handler": handler,
+                "updates": stats.updates,
+                "queries_avg": round(stats.queries / stats.updates, 1),
+                "queries_max": stats.max_queries,
+                "db_ms_avg": round(stats.seconds / stats.updates * 1000, 1),
+                "over_budget": stats.over_budget,
+                "repeats": stats.repeats,
+            }
+            for handler, stats in self._handlers.items()
+        ]
+        items.sort(key=lambda item: (item["queries_avg"], item["db_ms_avg"]), reverse=True)
+        return items[:limit or self.report_size]
+
+    def report(self):
+        """Сводка самых затратных обработчиков в лог"""
+        items = self.top()
+        if not items:
+            return
+        lines = [
+            f"  {item['handler']}: {item['updates']} updates, {item['queries_avg']} queries avg "
+            f"(max {item['queries_max']}), {item['db_ms_avg']} ms avg, "
+            f"over budget {item['over_budget']}, repeated statements {item['repeats']}"
+            for item in items
+        ]
+        logger.info("Top handlers by DB queries per update:\n" + "\n".join(lines))
+
+    # === ПЕРИОДИЧЕСКАЯ СВОДКА ===
+    def start(self):
+        """Запуск периодической сводки (QUERY_REPORT_INTERVAL=0 - выключена)"""
+        if self.report_interval and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Остановка с последней сводкой"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self.report()
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            try:
+                self.report()
+            except Exception as e:
+                logger.error(f"Error reporting query stats: {e}")
+
+
+# Глобальный учет запросов по обработчикам
+query_watch = QueryWatch(
+    repeat_threshold=settings.QUERY_REPEAT_THRESHOLD,
+    report_interval=settings.QUERY_REPORT_INTERVAL
+)
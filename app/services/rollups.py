@@ -0,0 +1,176 @@
+"""
+Суточные агрегаты анализов
+
+Таблица analysis_daily_stats хранит количество анализов по ключу
+(день создания, салон, мастер, статус). Она обновляется инкрементально
+при каждом переходе статуса в той же транзакции, что и сам анализ,
+а периодическая сверка пересчитывает последние дни из таблицы analyses.
+
+Переходы берут разделяемую транзакционную advisory-блокировку, сверка -
+исключительную: пересчет видит все завершенные переходы и не затирает
+приращения транзакций, которые еще не закоммичены.
+"""
+
+import hashlib
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from loguru import logger
+from sqlalchemy import select, delete, func, literal, text, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.database import db_manager
+from app.database.models import Analysis, AnalysisDailyStat
+from config.settings import settings
+
+
+# Ключ advisory lock агрегатов, одинаковый на всех экземплярах
+STATS_LOCK_KEY = int.from_bytes(
+    hashlib.blake2b(b"rollups:analysis_daily_stats", digest_size=8).digest(), "big", signed=True
+)
+
+
+def _day_of(created_at: Optional[datetime]) -> date:
+    return created_at.date() if created_at else date.today()
+
+
+async def _apply_delta(db_session: AsyncSession, day: date, salon_id: int, master_id: int, status: str, delta: int):
+    stmt = insert(AnalysisDailyStat).values(
+        day=day,
+        salon_id=salon_id,
+        master_id=master_id,
+        status=status,
+        count=delta
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[
+            AnalysisDailyStat.day,
+            AnalysisDailyStat.salon_id,
+            AnalysisDailyStat.master_id,
+            AnalysisDailyStat.status
+        ],
+        set_={"count": AnalysisDailyStat.count + stmt.excluded.count}
+    )
+    await db_session.execute(stmt)
+
+
+async def record_status_transition(
+        db_session: AsyncSession,
+        created_at: Optional[datetime],
+        salon_id: int,
+        master_id: int,
+        old_status: Optional[str],
+        new_status: Optional[str]
+):
+    """
+    Учет перехода статуса анализа в агрегатах
+
+    old_status=None - анализ создан, new_status=None - анализ удален.
+    Коммит выполняет вызывающий код вместе с изменением анализа.
+    """
+    if old_status == new_status:
+        return
+
+    # Освобождается вместе с транзакцией; переходы друг друга не ждут
+    await db_session.execute(text("SELECT pg_advisory_xact_lock_shared(:key)"), {"key": STATS_LOCK_KEY})
+
+    day = _day_of(created_at)
+    if old_status:
+        await _apply_delta(db_session, day, salon_id, master_id, old_status, -1)
+    if new_status:
+        await _apply_delta(db_session, day, salon_id, master_id, new_status, 1)
+
+
+async def set_analysis_status(db_session: AsyncSession, analysis: Analysis, new_status: str):
+    """Смена статуса анализа с учетом в суточных агрегатах"""
+    await record_status_transition(
+        db_session,
+        analysis.created_at,
+        analysis.salon_id,
+        analysis.master_id,
+        analysis.status,
+        new_status
+    )
+    analysis.status = new_status
+
+
+async def reconcile_daily_stats(days: Optional[int] = None) -> int:
+    """Пересчет агрегатов за последние дни из таблицы analyses"""
+    days = days if days is not None else settings.STATS_RECONCILE_DAYS
+    since = date.today() - timedelta(days=days)
+    analysis_day = func.date(Analysis.created_at)
+
+    source = (
+        select(
+            analysis_day,
+            Analysis.salon_id,
+            Analysis.master_id,
+            Analysis.status,
+            func.count(Analysis.id)
+        )
+        .where(Analysis.created_at >= since)
+        .group_by(analysis_day, Analysis.salon_id, Analysis.master_id, Analysis.status)
+    )
+
+    stmt = insert(AnalysisDailyStat).from_select(
+        ["day", "salon_id", "master_id", "status", "count"],
+        source
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[
+            AnalysisDailyStat.day,
+            AnalysisDailyStat.salon_id,
+            AnalysisDailyStat.master_id,
+            AnalysisDailyStat.status
+        ],
+        set_={"count": stmt.excluded.count},
+        where=AnalysisDailyStat.count != stmt.excluded.count
+    )
+    stat_key = tuple_(
+        AnalysisDailyStat.day,
+        AnalysisDailyStat.salon_id,
+        AnalysisDailyStat.master_id,
+        AnalysisDailyStat.status
+    )
+    recomputed_keys = (
+        select(analysis_day, Analysis.salon_id, Analysis.master_id, Analysis.status)
+        .where(Analysis.created_at >= since)
+        .distinct()
+    )
+
+    async for db_session in db_manager.get_session():
+        # Новые переходы ждут окончания сверки, начатые - успевают закоммититься
+        await db_session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": STATS_LOCK_KEY})
+
+        result = await db_session.execute(stmt)
+        # Ключи, по которым анализов больше нет
+        await db_session.execute(
+            delete(AnalysisDailyStat).where(
+                AnalysisDailyStat.day >= since,
+                stat_key.notin_(recomputed_keys)
+            )
+        )
+        await db_session.commit()
+
+        logger.info(f"Daily analysis stats reconciled since {since}: {result.rowcount} rows updated")
+        return result.rowcount
+
+    return 0
+
+
+async def count_analyses(
+        db_session: AsyncSession,
+        since: Optional[date] = None,
+        salon_id: Optional[int] = None,
+        master_id: Optional[int] = None
+) -> int:
+    """Количество анализов по агрегатам с фильтрами по дате создания, салону и мастеру"""
+    query = select(func.coalesce(func.sum(AnalysisDailyStat.count), literal(0)))
+    if since is not None:
+        query = query.where(AnalysisDailyStat.day >= since)
+    if salon_id is not None:
+        query = query.where(AnalysisDailyStat.salon_id == salon_id)
+    if master_id is not None:
+        query = query.where(AnalysisDailyStat.master_id == master_id)
+    return await db_session.scalar(query)
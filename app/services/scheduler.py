@@ -0,0 +1,350 @@
+"""
+Планировщик фоновых задач
+
+Поддерживает задачи по интервалу и по cron-выражению (5 полей: минута, час,
+день месяца, месяц, день недели), случайную задержку запуска (jitter)
+и ограничение времени выполнения.
+
+Если запущено несколько экземпляров бота, каждую задачу выполняет ровно один:
+время запуска вычисляется одинаково на всех экземплярах (интервалы выровнены
+по эпохе), запуск закрепляется строкой (job_name, scheduled_at) в таблице
+scheduler_job_runs, а на время выполнения берется pg_try_advisory_lock,
+чтобы долгий запуск не пересекался со следующим.
+"""
+
+import asyncio
+import hashlib
+import os
+import random
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from loguru import logger
+from sqlalchemy import select, update, delete, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.database import db_manager
+from app.database.models import SchedulerJobRun
+from config.settings import settings
+
+JobFunc = Callable[[], Awaitable]
+
+INSTANCE_NAME = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class CronSchedule:
+    """Расписание в формате cron: "минута час день месяц день_недели" (0 - воскресенье)"""
+
+    RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression must have 5 fields: '{expression}'")
+
+        self.expression = expression
+        parsed = [self._parse_field(field, low, high) for field, (low, high) in zip(fields, self.RANGES)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        self.weekdays = {day % 7 for day in weekdays}
+        # Как в cron: если ограничены и день месяца, и день недели, подходит любой из них
+        self.days_restricted = fields[2] != "*"
+        self.weekdays_restricted = fields[4] != "*"
+
+    @staticmethod
+    def _parse_field(field: str, low: int, high: int) -> Set[int]:
+        values: Set[int] = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, step_text = part.split("/", 1)
+                step = int(step_text)
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start_text, end_text = part.split("-", 1)
+                start, end = int(start_text), int(end_text)
+            else:
+                start = int(part)
+                end = high if step > 1 else start
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError(f"Invalid cron field '{field}'")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.days_restricted and self.weekdays_restricted:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_after(self, moment: datetime) -> datetime:
+        """Ближайшее время запуска строго после moment"""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 4)
+
+        while candidate < limit:
+            if candidate.month not in self.months or not self._day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            if candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+                continue
+            if candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+                continue
+            return candidate
+
+        raise ValueError(f"Cron expression never fires: '{self.expression}'")
+
+
+class ScheduledJob:
+    """Задача планировщика и счетчики ее запусков в этом процессе"""
+
+    def __init__(
+            self,
+            name: str,
+            func: JobFunc,
+            interval: Optional[int] = None,
+            cron: Optional[str] = None,
+            jitter: int = 0,
+            timeout: Optional[int] = None
+    ):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.cron = CronSchedule(cron) if cron else None
+        self.jitter = jitter
+        self.timeout = timeout
+
+        self.next_run_at: Optional[datetime] = None
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_status: Optional[str] = None
+        self.last_started_at: Optional[datetime] = None
+        self.last_duration: Optional[float] = None
+
+    @property
+    def schedule(self) -> str:
+        return f"cron {self.cron.expression}" if self.cron else f"каждые {self.interval} с"
+
+    @property
+    def lock_key(self) -> int:
+        """Ключ advisory lock, одинаковый на всех экземплярах"""
+        digest = hashlib.blake2b(f"scheduler:{self.name}".encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big", signed=True)
+
+    def next_after(self, moment: datetime) -> datetime:
+        if self.cron:
+            return self.cron.next_after(moment)
+        timestamp = moment.timestamp()
+        return datetime.fromtimestamp((int(timestamp) // self.interval + 1) * self.interval)
+
+
+class Scheduler:
+    """Планировщик задач с выбором исполнителя через Postgres"""
+
+    def __init__(self):
+        self._jobs: Dict[str, ScheduledJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._stopping = False
+
+    @property
+    def jobs(self) -> List[ScheduledJob]:
+        return list(self._jobs.values())
+
+    def add_interval_job(
+            self,
+            name: str,
+            interval: int,
+            func: JobFunc,
+            jitter: Optional[int] = None,
+            timeout: Optional[int] = None
+    ) -> ScheduledJob:
+        """Задача, выполняемая раз в interval секунд"""
+        return self._add(ScheduledJob(
+            name, func, interval=interval,
+            jitter=settings.SCHEDULER_JITTER if jitter is None else jitter,
+            timeout=timeout or settings.SCHEDULER_JOB_TIMEOUT
+        ))
+
+    def add_cron_job(
+            self,
+            name: str,
+            expression: str,
+            func: JobFunc,
+            jitter: Optional[int] = None,
+            timeout: Optional[int] = None
+    ) -> ScheduledJob:
+        """Задача по cron-выражению (локальное время сервера)"""
+        return self._add(ScheduledJob(
+            name, func, cron=expression,
+            jitter=settings.SCHEDULER_JITTER if jitter is None else jitter,
+            timeout=timeout or settings.SCHEDULER_JOB_TIMEOUT
+        ))
+
+    def _add(self, job: ScheduledJob) -> ScheduledJob:
+        if job.name in self._jobs:
+            raise ValueError(f"Job '{job.name}' is already registered")
+        self._jobs[job.name] = job
+        return job
+
+    def start(self):
+        """Запуск всех зарегистрированных задач"""
+        for job in self._jobs.values():
+            self._tasks[job.name] = asyncio.create_task(self._job_loop(job), name=f"scheduler:{job.name}")
+            logger.info(f"Scheduled job '{job.name}': {job.schedule}")
+
+    async def stop(self, timeout: float = 0):
+        """
+        Остановка планировщика
+
+        Ожидающие запуска задачи снимаются сразу, выполняющимся дается до
+        timeout секунд на завершение, после чего они прерываются (статус cancelled).
+        """
+        self._stopping = True
+        running = [self._tasks[name] for name, job in self._jobs.items() if job.running and name in self._tasks]
+        for name, task in self._tasks.items():
+            if not self._jobs[name].running:
+                task.cancel()
+        if running and timeout > 0:
+            logger.info(f"Waiting up to {timeout}s for {len(running)} running scheduler jobs")
+            _, pending = await asyncio.wait(running, timeout=timeout)
+            for task in pending:
+                task.cancel()
+        else:
+            for task in running:
+                task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+
+    async def _job_loop(self, job: ScheduledJob):
+        while True:
+            scheduled_at = job.next_after(datetime.now())
+            job.next_run_at = scheduled_at
+            delay = (scheduled_at - datetime.now()).total_seconds()
+            if job.jitter:
+                delay += random.uniform(0, job.jitter)
+            await asyncio.sleep(max(delay, 0))
+
+            job.running = True
+            try:
+                await self._run_exclusive(job, scheduled_at)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Scheduler failed to run job '{job.name}': {e}")
+            finally:
+                job.running = False
+            if self._stopping:
+                return
+
+    async def _run_exclusive(self, job: ScheduledJob, scheduled_at: datetime):
+        # Отдельное соединение держит сессионную advisory-блокировку на время выполнения
+        async with db_manager.engine.connect() as connection:
+            connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+            locked = await connection.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": job.lock_key})
+            if not locked:
+                job.skipped += 1
+                return
+            try:
+                run_id = await self._claim_run(job, scheduled_at)
+                if run_id is None:
+                    # Этот запуск уже выполнил другой экземпляр
+                    job.skipped += 1
+                    return
+                await self._execute(job, run_id)
+            finally:
+                await connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": job.lock_key})
+
+    async def _claim_run(self, job: ScheduledJob, scheduled_at: datetime) -> Optional[int]:
+        async for db_session in db_manager.get_session():
+            run_id = await db_session.scalar(
+                insert(SchedulerJobRun)
+                .values(
+                    job_name=job.name,
+                    scheduled_at=scheduled_at,
+                    started_at=datetime.now(),
+                    status="running",
+                    instance=INSTANCE_NAME
+                )
+                .on_conflict_do_nothing(index_elements=[SchedulerJobRun.job_name, SchedulerJobRun.scheduled_at])
+                .returning(SchedulerJobRun.id)
+            )
+            await db_session.commit()
+            return run_id
+        return None
+
+    async def _execute(self, job: ScheduledJob, run_id: int):
+        job.last_started_at = datetime.now()
+        started = time.monotonic()
+        error = None
+
+        try:
+            await asyncio.wait_for(job.func(), timeout=job.timeout)
+            status = "success"
+        except asyncio.TimeoutError:
+            status = "timeout"
+            error = f"Timed out after {job.timeout}s"
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        except Exception as e:
+            status = "failed"
+            error = str(e)
+        finally:
+            duration = time.monotonic() - started
+            job.runs += 1
+            job.last_status = status
+            job.last_duration = duration
+            if status != "success":
+                job.failures += 1
+                logger.error(f"Job '{job.name}' {status}: {error}")
+            await asyncio.shield(self._finish_run(run_id, status, duration, error))
+
+    @staticmethod
+    async def _finish_run(run_id: int, status: str, duration: float, error: Optional[str]):
+        try:
+            async for db_session in db_manager.get_session():
+                await db_session.execute(
+                    update(SchedulerJobRun)
+                    .where(SchedulerJobRun.id == run_id)
+                    .values(
+                        status=status,
+                        finished_at=datetime.now(),
+                        duration_ms=int(duration * 1000),
+                        error=error[:1000] if error else None
+                    )
+                )
+                await db_session.commit()
+        except Exception as e:
+            logger.error(f"Error saving scheduler run {run_id}: {e}")
+
+
+async def get_recent_runs(db_session: AsyncSession, limit: int = 10) -> List[SchedulerJobRun]:
+    """Последние запуски задач на всех экземплярах"""
+    result = await db_session.execute(
+        select(SchedulerJobRun).order_by(SchedulerJobRun.started_at.desc()).limit(limit)
+    )
+    return list(result.scalars().all())
+
+
+async def prune_job_runs(days: Optional[int] = None) -> int:
+    """Удаление истории запусков старше days дней"""
+    days = days if days is not None else settings.SCHEDULER_HISTORY_DAYS
+    cutoff = datetime.now() - timedelta(days=days)
+
+    async for db_session in db_manager.get_session():
+        result = await db_session.execute(delete(SchedulerJobRun).where(SchedulerJobRun.started_at < cutoff))
+        await db_session.commit()
+        return result.rowcount
+    return 0
+
+
+# Глобальный экземпляр планировщика
+scheduler = Scheduler()
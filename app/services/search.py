@@ -0,0 +1,104 @@
+"""
+Поиск салонов и мастеров по части названия, города, имени или @username
+
+Используются триграммные GIN индексы pg_trgm: ILIKE '%...%' и оператор
+похожести % обслуживаются индексом, а результаты ранжируются по similarity().
+"""
+
+from typing import Any, Dict, List
+
+from sqlalchemy import select, func, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import Salon, Master
+from app.utils.cache import TTLCache
+from config.settings import settings
+
+MIN_QUERY_LENGTH = 2
+
+# Кеш результатов поиска (ключ - вид поиска, нормализованный запрос и лимит)
+search_cache = TTLCache(ttl=settings.SEARCH_CACHE_TTL, max_entries=2048)
+
+
+def normalize_query(query: str) -> str:
+    """Приведение запроса к виду, по которому кешируются результаты"""
+    return " ".join(query.split()).lower()
+
+
+def _like_pattern(query: str) -> str:
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _matches(column, query: str):
+    return or_(column.ilike(_like_pattern(query)), column.op("%")(query))
+
+
+async def _search_salons(db_session: AsyncSession, query: str, limit: int) -> List[Dict[str, Any]]:
+    rank = func.greatest(func.similarity(Salon.name, query), func.similarity(Salon.city, query))
+    rows = (await db_session.execute(
+        select(Salon.id, Salon.name, Salon.city, Salon.quota_limit, Salon.quota_used)
+        .where(Salon.is_active == True, or_(_matches(Salon.name, query), _matches(Salon.city, query)))
+        .order_by(rank.desc(), Salon.name, Salon.id)
+        .limit(limit)
+    )).all()
+    return [row._asdict() for row in rows]
+
+
+async def _search_masters(db_session: AsyncSession, query: str, limit: int) -> List[Dict[str, Any]]:
+    if query.startswith("@"):
+        # Поиск только по username
+        username = query.lstrip("@")
+        condition = _matches(Master.telegram_username, username)
+        rank = func.similarity(Master.telegram_username, username)
+    else:
+        condition = or_(_matches(Master.name, query), _matches(Master.telegram_username, query))
+        rank = func.greatest(
+            func.similarity(Master.name, query),
+            func.coalesce(func.similarity(Master.telegram_username, query), 0)
+        )
+
+    rows = (await db_session.execute(
+        select(
+            Master.id,
+            Master.name,
+            Master.telegram_id,
+            Master.telegram_username,
+            Master.analyses_count,
+            Salon.name.label("salon_name"),
+        )
+        .outerjoin(Salon, Master.salon_id == Salon.id)
+        .where(Master.is_active == True, condition)
+        .order_by(rank.desc(), Master.name, Master.id)
+        .limit(limit)
+    )).all()
+
+    items = [row._asdict() for row in rows]
+    for item in items:
+        item["salon_name"] = item["salon_name"] or "Салон удален"
+    return items
+
+
+async def search_salons(db_session: AsyncSession, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """Активные салоны, похожие на запрос по названию или городу, лучшие совпадения первыми"""
+    query = normalize_query(query)
+    if len(query) < MIN_QUERY_LENGTH:
+        return []
+    return await search_cache.get_or_load(
+        ("salons", query, limit), lambda: _search_salons(db_session, query, limit)
+    )
+
+
+async def search_masters(db_session: AsyncSession, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """Активные мастера, похожие на запрос по имени или username ("@..." - только username)"""
+    query = normalize_query(query)
+    if len(query.lstrip("@")) < MIN_QUERY_LENGTH:
+        return []
+    return await search_cache.get_or_load(
+        ("masters", query, limit), lambda: _search_masters(db_session, query, limit)
+    )
+
+
+def invalidate_search():
+    """Сброс кеша поиска после изменения салонов или мастеров"""
+    search_cache.invalidate()
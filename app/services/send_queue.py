@@ -0,0 +1,268 @@
+"""
+Исходящая очередь запросов к Bot API с ограничением скорости
+
+Подключается к сессии бота как request middleware, поэтому через нее проходят
+все message.answer/edit_text/answer_photo и любые другие отправки.
+Ограничиваются только запросы с chat_id (отправка и изменение сообщений):
+
+- общий лимит бота - SEND_GLOBAL_RATE сообщений в секунду;
+- личный чат - SEND_CHAT_RATE в секунду с запасом SEND_CHAT_BURST,
+  группа - SEND_GROUP_RATE в секунду;
+- ответ 429 приостанавливает чат на retry_after секунд, после чего запрос
+  повторяется (до SEND_MAX_RETRIES раз, если retry_after не больше SEND_MAX_RETRY_AFTER).
+
+Ответы пользователю в обработчиках идут с интерактивным приоритетом и
+обгоняют массовые рассылки. Массовые отправки помечаются bulk_sends():
+
+    with bulk_sends():
+        for master in masters:
+            await bot.send_message(master.telegram_id, text)
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from loguru import logger
+
+from config.settings import settings
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BULK: "bulk"}
+
+# Очистка неиспользуемых лимитов чатов после каждых N отправок
+CHAT_BUCKETS_CLEANUP_EVERY = 1000
+
+_send_priority: ContextVar[int] = ContextVar("send_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def bulk_sends():
+    """Отправки внутри блока идут с низким приоритетом массовой рассылки"""
+    token = _send_priority.set(PRIORITY_BULK)
+    try:
+        yield
+    finally:
+        _send_priority.reset(token)
+
+
+class _TokenBucket:
+    """
+    Маркерная корзина с очередью ожидающих по приоритету
+
+    Ожидающие с меньшим приоритетом (числом) получают маркер первыми,
+    при равном приоритете - в порядке поступления.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._pump_task: Optional[asyncio.Task] = None
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def idle(self) -> bool:
+        self._refill()
+        return not self._waiters and self.tokens >= self.burst and self.paused_until <= time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def _delay(self) -> float:
+        """Секунды до появления маркера (0 - маркер есть)"""
+        now = time.monotonic()
+        if self.paused_until > now:
+            return self.paused_until - now
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def pause(self, seconds: float):
+        """Приостановка выдачи маркеров (ответ 429)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+        self.updated = self.paused_until
+
+    async def acquire(self, priority: int):
+        if not self._waiters and self._delay() == 0:
+            self.tokens -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        # Отмененное ожидание остается в очереди и пропускается при выдаче
+        await future
+
+    async def _pump(self):
+        while self._waiters:
+            if self._waiters[0][2].done():
+                heapq.heappop(self._waiters)
+                continue
+            delay = self._delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            self.tokens -= 1
+            future.set_result(None)
+
+
+class _LatencyStats:
+    """Время от постановки в очередь до ответа Bot API"""
+
+    __slots__ = ("count", "seconds_sum", "seconds_max")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds_sum = 0.0
+        self.seconds_max = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.seconds_sum += seconds
+        self.seconds_max = max(self.seconds_max, seconds)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "sent": self.count,
+            "latency_avg_ms": round(self.seconds_sum / self.count * 1000, 1) if self.count else 0,
+            "latency_max_ms": round(self.seconds_max * 1000, 1),
+        }
+
+
+class OutboundDispatcher(BaseRequestMiddleware):
+    """Request middleware сессии бота: лимиты отправки, приоритеты и повтор после 429"""
+
+    def __init__(
+            self,
+            global_rate: float,
+            chat_rate: float,
+            chat_burst: float,
+            group_rate: float,
+            max_retries: int,
+            max_retry_after: float
+    ):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self._global = _TokenBucket(global_rate, global_rate)
+        self._chats: Dict[Any, _TokenBucket] = {}
+        self._sends = 0
+
+        # Счетчики для /health и метрик
+        self.in_flight = 0
+        self.rate_limited = 0
+        self.retries = 0
+        self.failed = 0
+        self.latency = {priority: _LatencyStats() for priority in PRIORITY_NAMES}
+
+    def share_global_rate(self, workers: int):
+        """Доля общего лимита бота для одного из workers процессов"""
+        rate = self.global_rate / workers
+        self._global = _TokenBucket(rate, rate)
+
+    def _chat_bucket(self, chat_id: Any) -> _TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # Отрицательный id и @username - группы и каналы
+            group = isinstance(chat_id, str) or chat_id < 0
+            bucket = _TokenBucket(self.group_rate, 1) if group else _TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _cleanup(self):
+        for chat_id in [chat_id for chat_id, bucket in self._chats.items() if bucket.idle()]:
+            del self._chats[chat_id]
+
+    async def __call__(
+            self,
+            make_request: NextRequestMiddlewareType[TelegramType],
+            bot: Bot,
+            method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            # getMe, getFile, answerCallbackQuery и т.п. - без ограничений
+            return await make_request(bot, method)
+
+        priority = _send_priority.get()
+        chat_bucket = self._chat_bucket(chat_id)
+        queued_at = time.monotonic()
+        self.in_flight += 1
+        self._sends += 1
+        if self._sends % CHAT_BUCKETS_CLEANUP_EVERY == 0:
+            self._cleanup()
+
+        try:
+            attempt = 0
+            while True:
+                await chat_bucket.acquire(priority)
+                await self._global.acquire(priority)
+                try:
+                    response = await make_request(bot, method)
+                except TelegramRetryAfter as e:
+                    self.rate_limited += 1
+                    chat_bucket.pause(e.retry_after)
+                    if attempt >= self.max_retries or e.retry_after > self.max_retry_after:
+                        self.failed += 1
+                        logger.warning(f"Send to chat {chat_id} failed: flood control, retry after {e.retry_after}s")
+                        raise
+                    attempt += 1
+                    self.retries += 1
+                    logger.info(f"Flood control for chat {chat_id}: retry {attempt} after {e.retry_after}s")
+                    continue
+                self.latency[priority].add(time.monotonic() - queued_at)
+                return response
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Очереди отправки, 429 и задержка доставки по приоритетам"""
+        return {
+            "in_flight": self.in_flight,
+            "global_waiting": self._global.waiting,
+            "chat_waiting": sum(bucket.waiting for bucket in self._chats.values()),
+            "chats": len(self._chats),
+            "rate_limited": self.rate_limited,
+            "retries": self.retries,
+            "failed": self.failed,
+            **{
+                name: self.latency[priority].as_dict()
+                for priority, name in PRIORITY_NAMES.items()
+            },
+        }
+
+
+# Глобальная очередь исходящих запросов
+outbound_dispatcher = OutboundDispatcher(
+    global_rate=settings.SEND_GLOBAL_RATE,
+    chat_rate=settings.SEND_CHAT_RATE,
+    chat_burst=settings.SEND_CHAT_BURST,
+    group_rate=settings.SEND_GROUP_RATE,
+    max_retries=settings.SEND_MAX_RETRIES,
+    max_retry_after=settings.SEND_MAX_RETRY_AFTER
+)
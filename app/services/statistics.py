@@ -0,0 +1,159 @@
+"""
+Сервис статистики
+
+Агрегаты считаются на стороне PostgreSQL, в Python попадают только итоговые числа.
+Регрессионный замер памяти и числа запросов: benchmarks/master_statistics.py.
+"""
+
+from datetime import date, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import select, func, true
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import Salon, Master, Analysis, AnalysisDailyStat
+from app.utils.cache import TTLCache
+from config.settings import settings
+
+IN_PROGRESS_STATUSES = ("started", "ready_for_ai", "ai_analyzing")
+
+# Короткий кеш статистики мастеров (ключ - master_id)
+master_stats_cache = TTLCache(ttl=settings.MASTER_STATS_CACHE_TTL, max_entries=10000)
+
+# Кеш сводки для панели администратора (ключ - дата, чтобы "сегодня" не переходило через полночь)
+dashboard_cache = TTLCache(ttl=settings.DASHBOARD_CACHE_TTL, max_entries=4)
+
+
+async def get_master_statistics(db_session: AsyncSession, master_id: int) -> Dict[str, Any]:
+    """Статистика анализов мастера одним запросом: счетчики по статусам и последний анализ"""
+    cached = master_stats_cache.get(master_id)
+    if cached is not None:
+        return cached
+
+    counters = select(
+        func.count(Analysis.id).label("total"),
+        func.count(Analysis.id).filter(Analysis.status == "completed").label("completed"),
+        func.count(Analysis.id).filter(Analysis.status == "disputed").label("disputed"),
+        func.count(Analysis.id).filter(Analysis.status.in_(IN_PROGRESS_STATUSES)).label("in_progress"),
+    ).where(Analysis.master_id == master_id).subquery("counters")
+
+    last_analysis = (
+        select(Analysis.id, Analysis.status, Analysis.completed_at)
+        .where(Analysis.master_id == master_id)
+        .order_by(Analysis.created_at.desc(), Analysis.id.desc())
+        .limit(1)
+        .lateral("last_analysis")
+    )
+
+    query = select(
+        counters.c.total,
+        counters.c.completed,
+        counters.c.disputed,
+        counters.c.in_progress,
+        last_analysis.c.id,
+        last_analysis.c.status,
+        last_analysis.c.completed_at,
+    ).select_from(counters.outerjoin(last_analysis, true()))
+
+    row = (await db_session.execute(query)).one()
+
+    stats = {
+        "total": row.total,
+        "completed": row.completed,
+        "disputed": row.disputed,
+        "in_progress": row.in_progress,
+        "last_analysis": None,
+    }
+    if row.id is not None:
+        stats["last_analysis"] = {
+            "id": row.id,
+            "status": row.status,
+            "completed_at": row.completed_at,
+        }
+
+    master_stats_cache.set(master_id, stats)
+    return stats
+
+
+def invalidate_master_statistics(master_id: int):
+    """Сброс кеша статистики мастера после изменения его анализов"""
+    master_stats_cache.invalidate(master_id)
+
+
+async def get_analysis_period_counts(db_session: AsyncSession, today: Optional[date] = None) -> Dict[str, int]:
+    """Количество анализов за сегодня, 7 и 30 дней по суточным агрегатам (один диапазонный запрос)"""
+    today = today or date.today()
+    week_ago = today - timedelta(days=7)
+    month_ago = today - timedelta(days=30)
+
+    def period_sum(since: date):
+        return func.coalesce(func.sum(AnalysisDailyStat.count).filter(AnalysisDailyStat.day >= since), 0)
+
+    query = select(
+        period_sum(today).label("today"),
+        period_sum(week_ago).label("week"),
+        period_sum(month_ago).label("month"),
+    ).where(AnalysisDailyStat.day >= month_ago)
+
+    row = (await db_session.execute(query)).one()
+    return {"today": row.today, "week": row.week, "month": row.month}
+
+
+async def _load_dashboard_snapshot(db_session: AsyncSession, today: date) -> Dict[str, Any]:
+    salon_totals = select(
+        func.count(Salon.id).label("salons"),
+        func.coalesce(func.sum(Salon.quota_limit), 0).label("total_quota"),
+        func.coalesce(func.sum(Salon.quota_used), 0).label("used_quota"),
+    ).where(Salon.is_active == True).subquery("salon_totals")
+
+    analysis_totals = select(
+        func.coalesce(func.sum(AnalysisDailyStat.count), 0).label("analyses"),
+        func.coalesce(
+            func.sum(AnalysisDailyStat.count).filter(AnalysisDailyStat.day >= today), 0
+        ).label("today_analyses"),
+    ).subquery("analysis_totals")
+
+    masters_count = (
+        select(func.count(Master.id))
+        .where(Master.is_active == True)
+        .scalar_subquery()
+    )
+
+    query = select(
+        salon_totals.c.salons,
+        masters_count.label("masters"),
+        analysis_totals.c.analyses,
+        analysis_totals.c.today_analyses,
+        salon_totals.c.total_quota,
+        salon_totals.c.used_quota,
+    ).select_from(salon_totals.join(analysis_totals, true()))
+
+    row = (await db_session.execute(query)).one()
+    return {
+        "salons": row.salons,
+        "masters": row.masters,
+        "analyses": row.analyses,
+        "today_analyses": row.today_analyses,
+        "total_quota": row.total_quota,
+        "used_quota": row.used_quota,
+    }
+
+
+async def get_dashboard_snapshot(db_session: AsyncSession) -> Dict[str, Any]:
+    """
+    Сводка для панели администратора одним запросом
+
+    Активные салоны и мастера, всего анализов и за сегодня, суммы квот.
+    Результат кешируется на DASHBOARD_CACHE_TTL секунд; одновременные
+    запросы при пустом кеше ждут один и тот же запрос к БД.
+    """
+    today = date.today()
+    return await dashboard_cache.get_or_load(
+        today, lambda: _load_dashboard_snapshot(db_session, today)
+    )
+
+
+def invalidate_dashboard():
+    """Сброс кеша сводки после изменений салонов, мастеров, квот или анализов"""
+    dashboard_cache.invalidate()
+
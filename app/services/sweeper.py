@@ -0,0 +1,263 @@
+"""
+Уборка зависших анализов
+
+- черновики в статусах started/ready_for_ai без активности мастера дольше
+  ANALYSIS_DRAFT_EXPIRE_HOURS или созданные раньше ANALYSIS_RESUME_DAYS назад
+  (их уже нельзя продолжить) переводятся в статус expired;
+- анализы в статусе ai_analyzing без сердцебиения дольше AI_HEARTBEAT_TIMEOUT
+  (процесс упал во время ИИ анализа) возвращаются в ready_for_ai для повторного
+  запуска, а после AI_MAX_ATTEMPTS попыток помечаются ai_error; мастер получает
+  уведомление через outbox.
+
+Если ИИ анализ на самом деле еще шел, его итог записывается только при
+совпадении статуса ai_analyzing и номера попытки (finish_ai_attempt), поэтому
+опоздавший результат не перезаписывает решение уборки и не учитывается в
+агрегатах повторно.
+
+Строки обрабатываются пачками с FOR UPDATE SKIP LOCKED и коммитом после каждой
+пачки, поэтому уборка не держит долгих блокировок и не мешает обработчикам.
+Квота списывается только при принятии результатов, поэтому резервов квоты,
+которые нужно было бы освобождать, у зависших анализов нет.
+"""
+
+import asyncio
+import contextvars
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Optional, Sequence, Set
+
+from loguru import logger
+from sqlalchemy import select, update, func, tuple_
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.database import db_manager
+from app.database.models import Analysis, Master
+from app.keyboards.master_kb import get_retry_analysis_keyboard, get_start_ai_analysis_keyboard
+from app.services.analysis_drafts import abandoned_drafts, analysis_drafts
+from app.services.outbox import enqueue_notification
+from app.services.rollups import record_status_transition
+from app.services.statistics import invalidate_master_statistics, invalidate_dashboard
+from config.settings import settings
+
+
+async def _lock_batch(db_session: AsyncSession, condition, batch_size: int) -> Sequence[Row]:
+    result = await db_session.execute(
+        select(
+            Analysis.id,
+            Analysis.created_at,
+            Analysis.salon_id,
+            Analysis.master_id,
+            Analysis.status,
+            Analysis.ai_attempts
+        )
+        .where(condition)
+        .order_by(Analysis.created_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    return result.all()
+
+
+async def _set_status(db_session: AsyncSession, rows: Sequence[Row], new_status: str, masters: Set[int]):
+    for row in rows:
+        await record_status_transition(
+            db_session, row.created_at, row.salon_id, row.master_id, row.status, new_status
+        )
+        masters.add(row.master_id)
+
+    await db_session.execute(
+        update(Analysis)
+        .where(tuple_(Analysis.id, Analysis.created_at).in_([(row.id, row.created_at) for row in rows]))
+        .values(status=new_status)
+    )
+
+
+async def expire_abandoned_drafts(
+        db_session: AsyncSession,
+        now: datetime,
+        batch_size: int,
+        masters: Set[int]
+) -> int:
+    """Перевод брошенных черновиков в статус expired"""
+    expired = 0
+    condition = abandoned_drafts(now)
+
+    while True:
+        rows = await _lock_batch(db_session, condition, batch_size)
+        if not rows:
+            break
+
+        await _set_status(db_session, rows, "expired", masters)
+        await db_session.commit()
+
+        # Черновики в памяти других процессов статус не перезапишут: их запись
+        # не совпадет с новым статусом в БД, и черновик будет удален при сбросе
+        for row in rows:
+            await analysis_drafts.discard(row.id)
+
+        expired += len(rows)
+        if len(rows) < batch_size:
+            break
+
+    return expired
+
+
+async def recover_orphaned_ai(
+        db_session: AsyncSession,
+        stale_before: datetime,
+        max_attempts: int,
+        batch_size: int,
+        masters: Set[int]
+) -> int:
+    """Возврат анализов без сердцебиения ИИ в очередь или пометка ошибкой"""
+    recovered = 0
+    last_seen = func.coalesce(Analysis.ai_heartbeat_at, Analysis.ai_started_at, Analysis.created_at)
+    condition = (Analysis.status == "ai_analyzing") & (last_seen < stale_before)
+
+    while True:
+        rows = await _lock_batch(db_session, condition, batch_size)
+        if not rows:
+            break
+
+        retry = [row for row in rows if (row.ai_attempts or 0) < max_attempts]
+        failed = [row for row in rows if (row.ai_attempts or 0) >= max_attempts]
+        if retry:
+            await _set_status(db_session, retry, "ready_for_ai", masters)
+        if failed:
+            await _set_status(db_session, failed, "ai_error", masters)
+        await _notify_masters(db_session, retry, failed)
+        await db_session.commit()
+
+        recovered += len(rows)
+        if len(rows) < batch_size:
+            break
+
+    return recovered
+
+
+async def _notify_masters(db_session: AsyncSession, retry: Sequence[Row], failed: Sequence[Row]):
+    """Уведомления мастерам о возвращенных в очередь и неудавшихся ИИ анализах (в транзакции уборки)"""
+    master_ids = {row.master_id for row in [*retry, *failed]}
+    if not master_ids:
+        return
+    result = await db_session.execute(select(Master.id, Master.telegram_id).where(Master.id.in_(master_ids)))
+    chats = dict(result.all())
+
+    for row in retry:
+        await enqueue_notification(
+            db_session,
+            f"analysis:{row.id}:requeued:{row.ai_attempts}",
+            chats[row.master_id],
+            f"⏸ *ИИ анализ прерван*\n\n"
+            f"Анализ {row.id} не завершился. Данные сохранены - запустите анализ заново.",
+            parse_mode="Markdown",
+            reply_markup=get_start_ai_analysis_keyboard()
+        )
+    for row in failed:
+        # Тот же ключ, что у ошибки в обработчике: мастер получит одно уведомление о попытке
+        await enqueue_notification(
+            db_session,
+            f"analysis:{row.id}:ai_error:{row.ai_attempts}",
+            chats[row.master_id],
+            f"❌ *Ошибка ИИ анализа*\n\n"
+            f"Анализ {row.id} не удалось выполнить за {row.ai_attempts} попыток.\n"
+            f"Попробуйте еще раз или обратитесь к администратору.",
+            parse_mode="Markdown",
+            reply_markup=get_retry_analysis_keyboard()
+        )
+
+
+async def sweep_stale_analyses(batch_size: Optional[int] = None) -> int:
+    """Периодическая уборка брошенных черновиков и осиротевших ИИ анализов"""
+    batch_size = batch_size or settings.ANALYSIS_SWEEP_BATCH_SIZE
+    now = datetime.now()
+    masters: Set[int] = set()
+    expired = recovered = 0
+
+    async for db_session in db_manager.get_session():
+        expired = await expire_abandoned_drafts(
+            db_session,
+            now=now,
+            batch_size=batch_size,
+            masters=masters
+        )
+        recovered = await recover_orphaned_ai(
+            db_session,
+            stale_before=now - timedelta(seconds=settings.AI_HEARTBEAT_TIMEOUT),
+            max_attempts=settings.AI_MAX_ATTEMPTS,
+            batch_size=batch_size,
+            masters=masters
+        )
+
+    if masters:
+        for master_id in masters:
+            invalidate_master_statistics(master_id)
+        invalidate_dashboard()
+    if expired or recovered:
+        logger.info(f"Analysis sweep: {expired} drafts expired, {recovered} orphaned AI analyses recovered")
+    return expired + recovered
+
+
+# === ИТОГ ПОПЫТКИ ИИ АНАЛИЗА ===
+async def finish_ai_attempt(db_session: AsyncSession, analysis: Analysis, attempt: int, new_status: str, **values) -> bool:
+    """
+    Запись итога попытки ИИ анализа (коммит - за вызывающим)
+
+    Анализ обновляется, только если он все еще в статусе ai_analyzing с номером
+    попытки attempt. Иначе уборка уже вернула его в очередь или пометила ошибкой:
+    итог устарел, не записывается и не учитывается в агрегатах (False).
+    """
+    result = await db_session.execute(
+        update(Analysis)
+        .where(
+            Analysis.id == analysis.id,
+            Analysis.created_at == analysis.created_at,
+            Analysis.status == "ai_analyzing",
+            Analysis.ai_attempts == attempt
+        )
+        .values(status=new_status, **values)
+    )
+    if not result.rowcount:
+        logger.warning(f"AI attempt {attempt} of analysis {analysis.id} superseded by the sweeper, result dropped")
+        return False
+
+    await record_status_transition(
+        db_session, analysis.created_at, analysis.salon_id, analysis.master_id, "ai_analyzing", new_status
+    )
+    return True
+
+
+# === СЕРДЦЕБИЕНИЕ ИИ АНАЛИЗА ===
+async def _beat(analysis_id: int, created_at: datetime, interval: int):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async for db_session in db_manager.get_session():
+                await db_session.execute(
+                    update(Analysis)
+                    .where(Analysis.id == analysis_id, Analysis.created_at == created_at)
+                    .values(ai_heartbeat_at=datetime.now())
+                )
+                await db_session.commit()
+        except Exception as e:
+            logger.warning(f"AI heartbeat for analysis {analysis_id} failed: {e}")
+
+
+@asynccontextmanager
+async def ai_heartbeat(analysis_id: int, created_at: datetime):
+    """Периодическое обновление ai_heartbeat_at, пока выполняется ИИ анализ"""
+    # Пустой контекст: запросы сердцебиения не засчитываются обновлению,
+    # запустившему анализ (бюджет запросов, поиск N+1, метрики)
+    task = asyncio.create_task(
+        _beat(analysis_id, created_at, settings.AI_HEARTBEAT_INTERVAL),
+        context=contextvars.Context()
+    )
+    try:
+        yield
+    finally:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
@@ -0,0 +1,233 @@
+"""
+Исполнитель обновлений: порядок внутри чата, параллельность между чатами
+
+Обновления разных чатов обрабатываются одновременно, но не больше
+UPDATE_CONCURRENCY сразу. Обновления одного чата выполняются строго по одному
+в порядке поступления (две фотографии мастера не гоняются за одну строку Analysis).
+
+Обратное давление:
+- в очереди одного чата не больше UPDATE_MAX_PER_CHAT обновлений
+  (флуд одного пользователя не занимает общую очередь);
+- всего в работе и в очередях не больше UPDATE_MAX_PENDING обновлений.
+Вебхук при заполненной общей очереди или очереди чата ждет место до
+UPDATE_ADMISSION_TIMEOUT и отвечает Telegram 503 (доставка будет повторена),
+поллинг отбрасывает лишнее.
+
+При остановке бота drain() прекращает прием и дожидается принятых обновлений.
+
+Очередь чата занимает OrderedDispatcher еще до встроенных middleware aiogram:
+чтение состояния FSM следующего обновления чата происходит только после того,
+как предыдущее обновление записало свое состояние.
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.types import Update
+from loguru import logger
+
+from config.settings import settings
+
+
+class _ChatLane:
+    """Очередь обновлений одного чата"""
+
+    __slots__ = ("lock", "pending", "has_room")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.pending = 0
+        self.has_room = asyncio.Event()
+        self.has_room.set()
+
+
+class UpdateExecutor:
+    """Упорядоченное по чатам выполнение обработчиков с общим лимитом"""
+
+    def __init__(self, concurrency: int, max_pending: int, max_per_chat: int):
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.max_per_chat = max_per_chat
+        self._slots = asyncio.Semaphore(concurrency)
+        self._lanes: Dict[int, _ChatLane] = {}
+        self._has_capacity = asyncio.Event()
+        self._has_capacity.set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        # Задачи принятых обновлений (в очереди и в работе) - для отмены при остановке
+        self._tasks: Set[asyncio.Task] = set()
+        self.accepting = True
+        # Отбрасывать обновления сверх max_pending и max_per_chat; вебхук отключает
+        # это, потому что сам не принимает обновления без места в очередях
+        self.shed_on_overflow = True
+
+        # Счетчики для /health и метрик
+        self.pending = 0
+        self.running = 0
+        self.processed = 0
+        self.dropped = 0
+        self.wait_seconds_sum = 0.0
+        self.wait_seconds_max = 0.0
+
+    @property
+    def chats(self) -> int:
+        return len(self._lanes)
+
+    def deepest_queue(self) -> int:
+        return max((lane.pending for lane in self._lanes.values()), default=0)
+
+    async def wait_for_capacity(self, timeout: float, chat_id: Optional[int] = None) -> bool:
+        """
+        Ожидание места в общей очереди и в очереди чата
+
+        False - место не освободилось за timeout или идет остановка.
+        """
+        deadline = time.monotonic() + timeout
+        while self.accepting:
+            if self.pending >= self.max_pending:
+                waiter = self._has_capacity
+            else:
+                lane = self._lanes.get(chat_id) if chat_id is not None else None
+                if lane is None or lane.pending < self.max_per_chat:
+                    return True
+                waiter = lane.has_room
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(waiter.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return False
+        return False
+
+    async def run(self, chat_id: Optional[int], call: Callable[[], Awaitable[Any]]) -> Any:
+        """Выполнение обработчика в очереди чата (chat_id=None - без упорядочивания)"""
+        lane = self._lanes.get(chat_id) if chat_id is not None else None
+        if self.shed_on_overflow and (
+                self.pending >= self.max_pending or (lane is not None and lane.pending >= self.max_per_chat)
+        ):
+            self.dropped += 1
+            logger.warning(f"Update dropped: queue full (chat {chat_id}, pending {self.pending})")
+            return None
+
+        if chat_id is not None and lane is None:
+            lane = self._lanes[chat_id] = _ChatLane()
+
+        # До захвата очереди чата нет ни одного await - порядок поступления сохраняется
+        self._enter(lane)
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        queued_at = time.monotonic()
+        try:
+            if lane is not None:
+                await lane.lock.acquire()
+            try:
+                async with self._slots:
+                    waited = time.monotonic() - queued_at
+                    self.wait_seconds_sum += waited
+                    self.wait_seconds_max = max(self.wait_seconds_max, waited)
+                    self.running += 1
+                    try:
+                        return await call()
+                    finally:
+                        self.running -= 1
+                        self.processed += 1
+            finally:
+                if lane is not None:
+                    lane.lock.release()
+        finally:
+            self._tasks.discard(task)
+            self._leave(chat_id, lane)
+
+    def _enter(self, lane: Optional[_ChatLane]):
+        self.pending += 1
+        self._idle.clear()
+        if lane is not None:
+            lane.pending += 1
+            if lane.pending >= self.max_per_chat:
+                lane.has_room.clear()
+        if self.pending >= self.max_pending:
+            self._has_capacity.clear()
+
+    def _leave(self, chat_id: Optional[int], lane: Optional[_ChatLane]):
+        self.pending -= 1
+        if lane is not None:
+            lane.pending -= 1
+            if lane.pending < self.max_per_chat:
+                lane.has_room.set()
+            if lane.pending == 0 and self._lanes.get(chat_id) is lane:
+                del self._lanes[chat_id]
+        if self.pending < self.max_pending:
+            self._has_capacity.set()
+        if self.pending == 0:
+            self._idle.set()
+
+    async def drain(self, timeout: float, cancel_timeout: float) -> int:
+        """
+        Остановка приема и ожидание принятых обновлений
+
+        Вебхук перестает принимать новые обновления (Telegram получает 503 и
+        повторит доставку), уже принятые дорабатываются до timeout секунд.
+        Оставшиеся обработчики отменяются; на возврат работы в очередь
+        (см. start_ai_analysis) им дается cancel_timeout секунд.
+        Возвращает число отмененных обработчиков.
+        """
+        self.accepting = False
+        self._has_capacity.set()
+        for lane in self._lanes.values():
+            lane.has_room.set()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+            return 0
+        except asyncio.TimeoutError:
+            pass
+
+        tasks = list(self._tasks)
+        logger.warning(f"{len(tasks)} updates still in progress after {timeout}s, cancelling")
+        for task in tasks:
+            task.cancel()
+        _, pending = await asyncio.wait(tasks, timeout=cancel_timeout)
+        if pending:
+            logger.error(f"{len(pending)} cancelled updates did not finish in {cancel_timeout}s")
+        return len(tasks)
+
+    def stats(self) -> Dict[str, Any]:
+        """Глубина очередей и время ожидания"""
+        return {
+            "pending": self.pending,
+            "running": self.running,
+            "chats": self.chats,
+            "deepest_chat_queue": self.deepest_queue(),
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "wait_avg_ms": round(self.wait_seconds_sum / self.processed * 1000, 1) if self.processed else 0,
+            "wait_max_ms": round(self.wait_seconds_max * 1000, 1),
+        }
+
+
+class OrderedDispatcher(Dispatcher):
+    """Диспетчер, обрабатывающий обновление целиком в очереди его чата"""
+
+    def __init__(self, *, executor: UpdateExecutor, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.executor = executor
+
+    async def feed_update(self, bot: Bot, update: Update, **kwargs: Any) -> Any:
+        # Поллинг и вебхук передают обновления сюда; очередь чата берется до
+        # FSMContextMiddleware, который читает состояние диалога
+        chat, user, _ = UserContextMiddleware.resolve_event_context(event=update)
+        chat_id = chat.id if chat else (user.id if user else None)
+        feed = super().feed_update
+        return await self.executor.run(chat_id, lambda: feed(bot, update, **kwargs))
+
+
+# Глобальный исполнитель обновлений
+update_executor = UpdateExecutor(
+    concurrency=settings.UPDATE_CONCURRENCY,
+    max_pending=settings.UPDATE_MAX_PENDING,
+    max_per_chat=settings.UPDATE_MAX_PER_CHAT
+)
@@ -0,0 +1,283 @@
+"""
+Получение обновлений через вебхук
+
+Telegram доставляет обновления POST-запросами на WEBHOOK_BASE_URL + WEBHOOK_PATH.
+Запросы без правильного заголовка X-Telegram-Bot-Api-Secret-Token отклоняются,
+а на принятые сразу отвечаем 200 - обработка идет в фоне, поэтому медленный
+обработчик не задерживает доставку остальных обновлений. Если общая очередь
+исполнителя обновлений или очередь чата заполнена, ответ задерживается, а затем
+возвращается 503: Telegram повторит доставку позже.
+
+При запуске через supervisor.py несколько процессов-воркеров слушают один порт
+(SO_REUSEPORT). Ядро распределяет соединения между ними без учета чата, поэтому
+каждое обновление закреплено за воркером chat_id % WEBHOOK_WORKERS: чужие
+обновления пересылаются владельцу на его внутренний адрес 127.0.0.1, и все
+обновления одного чата обрабатываются в одном процессе. При перезапуске
+воркера новый процесс отвечает 503 на обновления своих чатов, пока супервизор
+не сообщит о выходе старого.
+
+Для локальной проверки TELEGRAM_API_URL указывается на локальный Bot API
+сервер (telegram-bot-api --local) или его заглушку, а WEBHOOK_BASE_URL - на
+адрес, доступный этому серверу, например http://localhost:8080.
+"""
+
+import asyncio
+import os
+import secrets
+import time
+from typing import Any, Dict, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import ClientError, ClientSession, ClientTimeout, web
+from loguru import logger
+
+from app.services.outbox import outbox_dispatcher
+from app.services.send_queue import outbound_dispatcher
+from app.services.update_executor import update_executor
+from config.settings import settings
+
+INTERNAL_UPDATE_PATH = "/internal/update"
+HEALTH_PATH = "/health"
+WORKER_SECRET_HEADER = "X-Worker-Secret"
+
+
+class WorkerInfo:
+    """Параметры воркера, запущенного супервизором"""
+
+    def __init__(self, index: int, count: int, secret: str, ready=None, owns_chats=None):
+        self.index = index
+        self.count = count
+        self.secret = secret
+        # multiprocessing.Event: воркер готов принимать запросы
+        self.ready = ready
+        # multiprocessing.Event: прежний воркер с этим номером завершился,
+        # можно обрабатывать обновления своих чатов
+        self.owns_chats = owns_chats
+        self._owns_chats = owns_chats is None
+
+    def can_handle(self) -> bool:
+        """Обновления своих чатов можно принимать (событие после установки не сбрасывается)"""
+        if not self._owns_chats:
+            self._owns_chats = self.owns_chats.is_set()
+        return self._owns_chats
+
+    @property
+    def internal_port(self) -> int:
+        return internal_port(self.index)
+
+
+# Заполняется супервизором в процессе воркера; None - обычный запуск одним процессом
+current_worker: Optional[WorkerInfo] = None
+
+
+def webhook_url() -> str:
+    return settings.WEBHOOK_BASE_URL.rstrip("/") + settings.WEBHOOK_PATH
+
+
+def internal_port(index: int) -> int:
+    return settings.WEBHOOK_INTERNAL_PORT + index
+
+
+def update_chat_id(update: Dict[str, Any]) -> Optional[int]:
+    """Чат (или пользователь, если чата нет) из необработанного обновления"""
+    for key, payload in update.items():
+        if key == "update_id" or not isinstance(payload, dict):
+            continue
+        chat = payload.get("chat") or (payload.get("message") or {}).get("chat")
+        if chat and "id" in chat:
+            return chat["id"]
+        user = payload.get("from") or payload.get("user")
+        if user and "id" in user:
+            return user["id"]
+    return None
+
+
+def update_owner(update: Dict[str, Any], workers: int) -> int:
+    """Номер воркера, обрабатывающего обновления этого чата"""
+    chat_id = update_chat_id(update)
+    return chat_id % workers if chat_id is not None else 0
+
+
+class BackpressureRequestHandler(SimpleRequestHandler):
+    """Обработчик вебхука, принимающий обновление только при наличии места в очереди"""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, **data: Any):
+        super().__init__(
+            dispatcher=dispatcher,
+            bot=bot,
+            handle_in_background=True,
+            secret_token=settings.WEBHOOK_SECRET or None,
+            **data
+        )
+
+    def _feed_in_background(self, bot: Bot, update: Dict[str, Any]) -> web.Response:
+        task = asyncio.create_task(self._background_feed_update(bot=bot, update=update))
+        self._background_feed_update_tasks.add(task)
+        task.add_done_callback(self._background_feed_update_tasks.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        if not await update_executor.wait_for_capacity(settings.UPDATE_ADMISSION_TIMEOUT, update_chat_id(update)):
+            return web.Response(status=503)
+        return self._feed_in_background(bot, update)
+
+
+class RoutingRequestHandler(BackpressureRequestHandler):
+    """Обработчик вебхука с пересылкой обновлений воркеру-владельцу чата"""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, worker: WorkerInfo, **data: Any):
+        super().__init__(dispatcher=dispatcher, bot=bot, **data)
+        self.worker = worker
+        self.started_at = time.time()
+        self.received = 0
+        self.forwarded = 0
+        self.forward_errors = 0
+        self.handled = 0
+        self._client: Optional[ClientSession] = None
+
+    def register_internal(self, app: web.Application):
+        app.router.add_route("POST", INTERNAL_UPDATE_PATH, self.handle_internal)
+        app.router.add_route("GET", HEALTH_PATH, self.handle_health)
+
+    def _feed_in_background(self, bot: Bot, update: Dict[str, Any]) -> web.Response:
+        self.handled += 1
+        return super()._feed_in_background(bot, update)
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        body = await request.read()
+        update = bot.session.json_loads(body)
+        self.received += 1
+
+        owner = update_owner(update, self.worker.count)
+        if owner != self.worker.index:
+            return await self._forward(owner, body)
+        # Прежний воркер еще дорабатывает эти чаты - Telegram повторит доставку
+        if not self.worker.can_handle():
+            return web.Response(status=503)
+        if not await update_executor.wait_for_capacity(settings.UPDATE_ADMISSION_TIMEOUT, update_chat_id(update)):
+            return web.Response(status=503)
+        return self._feed_in_background(bot, update)
+
+    async def _forward(self, owner: int, body: bytes) -> web.Response:
+        if self._client is None:
+            self._client = ClientSession(timeout=ClientTimeout(total=10))
+        try:
+            async with self._client.post(
+                    f"http://127.0.0.1:{internal_port(owner)}{INTERNAL_UPDATE_PATH}",
+                    data=body,
+                    headers={WORKER_SECRET_HEADER: self.worker.secret, "Content-Type": "application/json"}
+            ) as response:
+                response.raise_for_status()
+        except (ClientError, asyncio.TimeoutError) as e:
+            # Telegram повторит доставку, порядок обновлений чата сохранится
+            self.forward_errors += 1
+            logger.warning(f"Forwarding update to worker {owner} failed: {e}")
+            return web.Response(status=503)
+        self.forwarded += 1
+        return web.json_response({})
+
+    async def handle_internal(self, request: web.Request) -> web.Response:
+        if not secrets.compare_digest(request.headers.get(WORKER_SECRET_HEADER, ""), self.worker.secret):
+            return web.Response(body="Unauthorized", status=401)
+        update = await request.json(loads=self.bot.session.json_loads)
+        # Переславший воркер ответит Telegram 503, и доставка повторится
+        if not self.worker.can_handle():
+            return web.Response(status=503)
+        if not await update_executor.wait_for_capacity(settings.UPDATE_ADMISSION_TIMEOUT, update_chat_id(update)):
+            return web.Response(status=503)
+        return self._feed_in_background(self.bot, update)
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "worker": self.worker.index,
+            "pid": os.getpid(),
+            "uptime": int(time.time() - self.started_at),
+            "owns_chats": self.worker.can_handle(),
+            "received": self.received,
+            "forwarded": self.forwarded,
+            "forward_errors": self.forward_errors,
+            "handled": self.handled,
+            "in_flight": len(self._background_feed_update_tasks),
+            "executor": update_executor.stats(),
+            "outbound": outbound_dispatcher.stats(),
+            "outbox": outbox_dispatcher.stats(),
+        })
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+        await super().close()
+
+
+async def set_webhook(dp: Dispatcher, bot: Bot, drop_pending_updates: bool = False):
+    await bot.set_webhook(
+        webhook_url(),
+        secret_token=settings.WEBHOOK_SECRET or None,
+        max_connections=settings.WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=dp.resolve_used_update_types(),
+        drop_pending_updates=drop_pending_updates
+    )
+    logger.info(f"Webhook set: {webhook_url()}")
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """Запуск HTTP-сервера вебхука и регистрация вебхука в Telegram (до отмены)"""
+    if not settings.WEBHOOK_BASE_URL:
+        raise ValueError("WEBHOOK_BASE_URL must be set when BOT_MODE=webhook")
+
+    worker = current_worker
+    # Место в очереди проверяется до ответа Telegram, отбрасывать уже принятое нельзя
+    update_executor.shed_on_overflow = False
+    app = web.Application()
+    runners = []
+
+    if worker is None:
+        BackpressureRequestHandler(dispatcher=dp, bot=bot).register(app, path=settings.WEBHOOK_PATH)
+    else:
+        handler = RoutingRequestHandler(dispatcher=dp, bot=bot, worker=worker)
+        handler.register(app, path=settings.WEBHOOK_PATH)
+        internal_app = web.Application()
+        handler.register_internal(internal_app)
+    setup_application(app, dp, bot=bot)
+
+    try:
+        runner = web.AppRunner(app)
+        await runner.setup()
+        runners.append(runner)
+        # SO_REUSEPORT: порт вебхука делят все воркеры
+        await web.TCPSite(
+            runner, settings.WEBHOOK_HOST, settings.WEBHOOK_PORT, reuse_port=worker is not None
+        ).start()
+
+        if worker is None:
+            logger.info(f"Webhook server listening on {settings.WEBHOOK_HOST}:{settings.WEBHOOK_PORT}")
+            await set_webhook(dp, bot)
+        else:
+            internal_runner = web.AppRunner(internal_app)
+            await internal_runner.setup()
+            runners.append(internal_runner)
+            # Внутренний порт тоже с SO_REUSEPORT: при перезапуске новый воркер
+            # поднимается до остановки старого (и до выхода старого отвечает 503)
+            await web.TCPSite(internal_runner, "127.0.0.1", worker.internal_port, reuse_port=True).start()
+            logger.info(
+                f"Worker {worker.index}/{worker.count} listening on "
+                f"{settings.WEBHOOK_HOST}:{settings.WEBHOOK_PORT}, internal port {worker.internal_port}"
+            )
+            # Вебхук регистрирует первый воркер, удаляет - супервизор при остановке
+            if worker.index == 0:
+                await set_webhook(dp, bot)
+            if worker.ready is not None:
+                worker.ready.set()
+
+        # Сервер работает до остановки процесса
+        await asyncio.Event().wait()
+    finally:
+        if worker is None:
+            try:
+                await bot.delete_webhook()
+            except Exception as e:
+                logger.warning(f"Error deleting webhook: {e}")
+        for runner in reversed(runners):
+            await runner.cleanup()
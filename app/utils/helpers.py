@@ -4,6 +4,8 @@ from datetime import datetime
 from typing import Optional, Dict, Any
 from loguru import logger
 
+from app.services.audit import audit_writer
+
 
 def hash_password(password: str) -> str:
     """Хеширование пароля"""
@@ -43,9 +45,10 @@ def escape_markdown(text: str) -> str:
     return text
 
 
-async def log_user_action(user_id: int, action: str, details: Optional[Dict[str, Any]] = None):
-    """Логирование действий пользователя"""
+async def log_user_action(user_id: Optional[int], action: str, details: Optional[Dict[str, Any]] = None):
+    """Логирование действий пользователя в журнал system_logs (запись в БД выполняется в фоне)"""
     logger.info(f"User {user_id} performed action: {action}", extra={"details": details})
+    audit_writer.record(user_id, action, details)
 
 
 def generate_analysis_id() -> str:
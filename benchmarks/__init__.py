@@ -0,0 +1,5 @@
+"""
+Замеры производительности на БД из DATABASE_URL (в приложение не входят)
+
+Запуск из корня проекта: python -m benchmarks.<замер> --help
+"""
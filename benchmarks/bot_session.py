@@ -0,0 +1,116 @@
+"""
+Пропускная способность отправки против локальной заглушки Bot API
+
+Стандартная сессия aiogram на asyncio против сессии create_bot_session
+на uvloop (если установлен) и orjson:
+    python -m benchmarks.bot_session --requests 5000 --concurrency 100 --rounds 3
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import time
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiohttp import web
+
+from app.services.bot_session import create_bot_session, install_event_loop_policy, orjson, uvloop
+from benchmarks.harness import run
+from config.settings import settings
+
+BENCH_TOKEN = "123456:benchmark-token"
+
+
+async def _stub_send_message(request: web.Request) -> web.Response:
+    """Заглушка sendMessage: ответ в формате Bot API"""
+    form = await request.post()
+    return web.json_response({
+        "ok": True,
+        "result": {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": int(form["chat_id"]), "type": "private"},
+            "text": form["text"],
+        },
+    })
+
+
+def _run_stub_server(port: int):
+    """Заглушка Bot API в отдельном процессе, чтобы не делить цикл событий с клиентом"""
+    app = web.Application()
+    app.router.add_post("/bot{token}/sendMessage", _stub_send_message)
+    web.run_app(app, host="127.0.0.1", port=port, access_log=None, print=None)
+
+
+async def _wait_for_port(port: int, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+            continue
+        writer.close()
+        return
+
+
+async def _measure(session: AiohttpSession, requests: int, concurrency: int) -> float:
+    """Отправленных сообщений в секунду"""
+    bot = Bot(token=BENCH_TOKEN, session=session)
+    counter = iter(range(requests))
+
+    async def sender():
+        for index in counter:
+            await bot.send_message(chat_id=1000 + index % 100, text=f"Сообщение {index}")
+
+    try:
+        # Прогрев соединений
+        await bot.send_message(chat_id=1, text="warmup")
+        started = time.perf_counter()
+        await asyncio.gather(*(sender() for _ in range(concurrency)))
+        return requests / (time.perf_counter() - started)
+    finally:
+        await bot.session.close()
+
+
+def _bench(args: argparse.Namespace):
+    server = multiprocessing.get_context("spawn").Process(target=_run_stub_server, args=(args.port,), daemon=True)
+    server.start()
+    api_url = f"http://127.0.0.1:{args.port}"
+    baseline = tuned = 0.0
+    try:
+        asyncio.run(_wait_for_port(args.port))
+        # Раунды чередуются, берется лучший результат: до - стандартная сессия
+        # и цикл asyncio, после - настроенная сессия и uvloop (если установлен)
+        for _ in range(args.rounds):
+            asyncio.set_event_loop_policy(None)
+            baseline = max(baseline, asyncio.run(_measure(
+                AiohttpSession(api=TelegramAPIServer.from_base(api_url)), args.requests, args.concurrency
+            )))
+            install_event_loop_policy()
+            tuned = max(tuned, asyncio.run(_measure(create_bot_session(api_url), args.requests, args.concurrency)))
+    finally:
+        server.terminate()
+        server.join()
+
+    loop = "uvloop" if settings.USE_UVLOOP and uvloop is not None else "asyncio"
+    print(f"before (default session, asyncio): {baseline:.0f} msg/s")
+    print(f"after (tuned session, {loop}, {'orjson' if orjson else 'json'}): {tuned:.0f} msg/s "
+          f"({(tuned / baseline - 1) * 100:+.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер отправки сообщений против локальной заглушки Bot API")
+    parser.add_argument("--requests", type=int, default=5000, help="число сообщений")
+    parser.add_argument("--concurrency", type=int, default=100, help="одновременных отправителей")
+    parser.add_argument("--rounds", type=int, default=3, help="раундов замера")
+    parser.add_argument("--port", type=int, default=8199, help="порт заглушки")
+    run(parser, _bench)
+
+
+if __name__ == "__main__":
+    main()
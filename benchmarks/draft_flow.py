@@ -0,0 +1,188 @@
+"""
+Запросы к БД и объем полученных данных за сбор фото и опрос мастера
+
+Один и тот же сценарий анализа (фото обеих рук с просмотром и удалением,
+опрос, запуск ИИ) выполняется двумя способами:
+- до: каждый шаг загружает строку анализа целиком (со всеми JSON полями)
+  и записывает ее после изменения;
+- после: шаги работают с черновиком AnalysisDraftStore, в БД он записывается
+  в контрольных точках (переход к опросу, запуск ИИ), а анализ загружается
+  без результатов ИИ (get_analysis).
+Печатаются запросы, записи в analyses и полученные строки и байты на анализ.
+    python -m benchmarks.draft_flow --analyses 50 --photos 3
+"""
+
+import argparse
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer, undefer_group
+
+from app.database.models import Analysis, Master
+from app.services.analysis_drafts import AnalysisDraftStore
+from app.services.analysis_queries import AI_PAYLOAD_GROUP, get_analysis
+from app.services.archive import ensure_analysis_partitions
+from app.services.metrics import track_queries
+from app.services.rollups import record_status_transition, set_analysis_status
+from benchmarks.harness import create_bench_master, database, delete_bench_data, run, track_fetched
+
+SURVEY_RESPONSE = "Кутикула сухая, ногти ломкие, клиент просит укрепление и нюдовое покрытие"
+
+
+async def _create_analysis(db_session: AsyncSession, master: Master) -> Analysis:
+    """Начало анализа (одинаково в обоих вариантах)"""
+    analysis = Analysis(
+        master_id=master.id,
+        salon_id=master.salon_id,
+        status="started",
+        first_hand_photos=[],
+        second_hand_photos=[],
+        created_at=datetime.now()
+    )
+    db_session.add(analysis)
+    await record_status_transition(db_session, analysis.created_at, master.salon_id, master.id, None, analysis.status)
+    await db_session.commit()
+    await db_session.refresh(analysis)
+    return analysis
+
+
+async def _row_per_step(db_session: AsyncSession, master: Master, photos: int):
+    """До: каждое обновление загружает анализ целиком и записывает изменения"""
+    analysis_id = (await _create_analysis(db_session, master)).id
+
+    async def step(change: Optional[Callable[[Analysis], Awaitable[None]]] = None):
+        result = await db_session.execute(
+            select(Analysis)
+            .where(Analysis.id == analysis_id)
+            .options(undefer_group(AI_PAYLOAD_GROUP), undefer(Analysis.result_data))
+        )
+        analysis = result.scalar_one()
+        if change is not None:
+            await change(analysis)
+            await db_session.commit()
+        # Следующее обновление работает в новой сессии
+        db_session.expunge_all()
+
+    def add_photo(field: str, index: int):
+        async def change(analysis: Analysis):
+            setattr(analysis, field, getattr(analysis, field) + [f"{field}-{index}"])
+        return change
+
+    async def remove_last_first_hand(analysis: Analysis):
+        analysis.first_hand_photos = analysis.first_hand_photos[:-1]
+
+    async def answer_survey(analysis: Analysis):
+        analysis.survey_response = SURVEY_RESPONSE
+        await set_analysis_status(db_session, analysis, "ready_for_ai")
+
+    async def start_ai(analysis: Analysis):
+        await set_analysis_status(db_session, analysis, "ai_analyzing")
+
+    for index in range(photos):
+        await step(add_photo("first_hand_photos", index))
+    await step()
+    await step(remove_last_first_hand)
+    await step(add_photo("first_hand_photos", photos))
+    await step()
+    for index in range(photos):
+        await step(add_photo("second_hand_photos", index))
+    await step()
+    await step(answer_survey)
+    await step(start_ai)
+
+
+async def _drafts(db_session: AsyncSession, master: Master, photos: int, drafts: AnalysisDraftStore):
+    """После: шаги меняют черновик, запись в БД - в контрольных точках"""
+    analysis = await _create_analysis(db_session, master)
+    drafts.put(analysis)
+    analysis_id = analysis.id
+    db_session.expunge_all()
+
+    for index in range(photos):
+        draft = await drafts.get(db_session, analysis_id)
+        draft.first_hand_photos.append(f"first_hand_photos-{index}")
+        drafts.mark_dirty(draft)
+    await drafts.get(db_session, analysis_id)
+    draft = await drafts.get(db_session, analysis_id)
+    draft.first_hand_photos.pop()
+    drafts.mark_dirty(draft)
+    draft = await drafts.get(db_session, analysis_id)
+    draft.first_hand_photos.append(f"first_hand_photos-{photos}")
+    drafts.mark_dirty(draft)
+    await drafts.get(db_session, analysis_id)
+    for index in range(photos):
+        draft = await drafts.get(db_session, analysis_id)
+        draft.second_hand_photos.append(f"second_hand_photos-{index}")
+        drafts.mark_dirty(draft)
+
+    # Контрольная точка: переход к опросу
+    await drafts.get(db_session, analysis_id)
+    await drafts.flush(db_session, analysis_id)
+
+    draft = await drafts.get(db_session, analysis_id)
+    draft.survey_response = SURVEY_RESPONSE
+    draft.status = "ready_for_ai"
+    drafts.mark_dirty(draft)
+
+    # Контрольная точка: запуск ИИ
+    await drafts.get(db_session, analysis_id)
+    await drafts.flush(db_session, analysis_id)
+    await drafts.discard(analysis_id)
+    analysis = await get_analysis(db_session, analysis_id)
+    await set_analysis_status(db_session, analysis, "ai_analyzing")
+    await db_session.commit()
+    db_session.expunge_all()
+
+
+def _analyses_writes(statements: Dict[str, int]) -> int:
+    return sum(
+        count for statement, count in statements.items()
+        if statement.lstrip().upper().startswith(("INSERT INTO ANALYSES", "UPDATE ANALYSES"))
+    )
+
+
+async def _profile(label: str, flows: int, flow: Callable[[], Awaitable]):
+    started = time.perf_counter()
+    with track_queries() as queries, track_fetched() as fetched:
+        for _ in range(flows):
+            await flow()
+    elapsed = time.perf_counter() - started
+    print(
+        f"{label}: {queries.count / flows:.1f} statements, "
+        f"{_analyses_writes(queries.statements) / flows:.1f} writes to analyses, "
+        f"{fetched.rows / flows:.1f} rows / {fetched.bytes / flows / 1024:.1f} KiB fetched, "
+        f"{elapsed / flows * 1000:.1f} ms per analysis"
+    )
+
+
+async def _bench(args: argparse.Namespace):
+    async with database() as db_session:
+        await ensure_analysis_partitions()
+        master = await create_bench_master(db_session)
+        drafts = AnalysisDraftStore(max_entries=args.analyses, flush_interval=3600)
+        try:
+            print(f"{args.analyses} analyses, {args.photos} photos per hand")
+            await _profile(
+                "before (full row loaded and written on every step)", args.analyses,
+                lambda: _row_per_step(db_session, master, args.photos)
+            )
+            await _profile(
+                "after (draft store, checkpoints, deferred JSON)", args.analyses,
+                lambda: _drafts(db_session, master, args.photos, drafts)
+            )
+        finally:
+            await delete_bench_data(db_session)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Запросы и объем данных сценария сбора фото и опроса")
+    parser.add_argument("--analyses", type=int, default=50, help="анализов в каждом варианте")
+    parser.add_argument("--photos", type=int, default=3, help="фото каждой руки")
+    run(parser, _bench)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Задержка чтения и записи состояния FSM на обновление
+
+Хранилище в памяти процесса (BoundedMemoryStorage, как при FSM_STORAGE=memory)
+против PostgresStorage в границах обновления (одно чтение и одна запись на
+обновление) и без них (каждое обращение - запрос к БД из DATABASE_URL):
+    python -m benchmarks.fsm_storage --dialogs 200 --steps 20 --rounds 3
+"""
+
+import argparse
+import time
+from contextlib import AsyncExitStack
+from typing import List, Optional
+
+from aiogram.fsm.storage.base import BaseEventIsolation, BaseStorage, StorageKey
+from sqlalchemy import delete
+
+from app.database.database import db_manager
+from app.database.models import FsmState
+from app.services.fsm_storage import BoundedMemoryStorage, PostgresStorage
+from benchmarks.harness import database, describe, report, run
+
+# Ключи замера создаются с этим bot_id и удаляются после замера
+BENCH_BOT_ID = 0
+
+
+async def _delete_bench_states():
+    async for db_session in db_manager.get_session():
+        await db_session.execute(delete(FsmState).where(FsmState.bot_id == BENCH_BOT_ID))
+        await db_session.commit()
+
+
+async def _run_dialogs(
+        storage: BaseStorage,
+        keys: List[StorageKey],
+        steps: int,
+        isolation: Optional[BaseEventIsolation] = None
+) -> List[float]:
+    """Задержка обновлений: обработчик читает состояние и данные и записывает следующий шаг"""
+    samples = []
+    for step in range(steps):
+        for key in keys:
+            started = time.perf_counter()
+            async with AsyncExitStack() as update:
+                if isolation is not None:
+                    await update.enter_async_context(isolation.lock(key))
+                await storage.get_state(key)
+                data = await storage.get_data(key)
+                data["step"] = step
+                await storage.set_data(key, data)
+                await storage.set_state(key, f"BenchStates:step_{step % 5}")
+            samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def _bench(args: argparse.Namespace):
+    keys = [StorageKey(bot_id=BENCH_BOT_ID, chat_id=index, user_id=index) for index in range(1, args.dialogs + 1)]
+    memory: List[float] = []
+    per_update: List[float] = []
+    per_call: List[float] = []
+    async with database():
+        try:
+            # Раунды чередуются, чтобы прогрев кеша БД не давал преимущества одному из вариантов
+            for _ in range(args.rounds):
+                storage = BoundedMemoryStorage(max_entries=len(keys), idle_ttl=3600)
+                memory += await _run_dialogs(storage, keys, args.steps)
+
+                await _delete_bench_states()
+                storage = PostgresStorage()
+                per_update += await _run_dialogs(storage, keys, args.steps, storage.create_isolation())
+
+                await _delete_bench_states()
+                per_call += await _run_dialogs(PostgresStorage(), keys, args.steps)
+        finally:
+            await _delete_bench_states()
+
+    print(f"{len(keys)} dialogs, {args.steps} updates each")
+    report("memory storage, one process", memory, "Postgres, one read and one write per update", per_update)
+    print(f"Postgres, query on every storage call: {describe(per_call)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер чтения и записи состояний FSM")
+    parser.add_argument("--dialogs", type=int, default=200, help="число диалогов")
+    parser.add_argument("--steps", type=int, default=20, help="обновлений на диалог в раунде")
+    parser.add_argument("--rounds", type=int, default=3, help="раундов замера")
+    run(parser, _bench)
+
+
+if __name__ == "__main__":
+    main()
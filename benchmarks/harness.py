@@ -0,0 +1,159 @@
+"""
+Общие средства замеров: задержка, число запросов к БД и объем полученных строк
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, List, Optional
+
+from loguru import logger
+from sqlalchemy import delete, event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.database import db_manager
+from app.database.models import Analysis, AnalysisDailyStat, Master, Salon
+from app.services.metrics import instrument_engine
+
+# Мастер замера (настоящие telegram_id положительны); его данные удаляются после замера
+BENCH_TELEGRAM_ID = -1
+
+
+async def measure(call: Callable[[], Awaitable], iterations: int) -> List[float]:
+    """Время выполнения call в секундах для каждой из iterations попыток"""
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await call()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def percentile(samples: List[float], share: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * share), len(ordered) - 1)]
+
+
+def describe(samples: List[float]) -> str:
+    """Сводка задержек в миллисекундах"""
+    return (
+        f"avg {sum(samples) / len(samples) * 1000:.2f} ms, "
+        f"p50 {percentile(samples, 0.5) * 1000:.2f} ms, "
+        f"p95 {percentile(samples, 0.95) * 1000:.2f} ms, "
+        f"max {max(samples) * 1000:.2f} ms"
+    )
+
+
+def report(before_label: str, before: List[float], after_label: str, after: List[float]):
+    """Печать задержек до и после оптимизации"""
+    change = (sum(after) / sum(before) - 1) * 100
+    print(f"before ({before_label}): {describe(before)}")
+    print(f"after ({after_label}): {describe(after)} ({change:+.0f}% avg)")
+
+
+def check(condition: bool, message: str):
+    """Проверка регрессии: замер завершается с ошибкой, если условие не выполнено"""
+    if not condition:
+        sys.exit(f"FAILED: {message}")
+    print(f"ok: {message}")
+
+
+# === ОБЪЕМ ПОЛУЧЕННЫХ ДАННЫХ ===
+class FetchCounter:
+    """Строки и байты, полученные из БД в пределах track_fetched()"""
+
+    __slots__ = ("rows", "bytes")
+
+    def __init__(self):
+        self.rows = 0
+        self.bytes = 0
+
+
+_current_fetch: ContextVar[Optional[FetchCounter]] = ContextVar("current_fetch", default=None)
+
+
+@contextmanager
+def track_fetched() -> Iterator[FetchCounter]:
+    """Подсчет строк и байт, полученных запросами внутри блока"""
+    counter = FetchCounter()
+    token = _current_fetch.set(counter)
+    try:
+        yield counter
+    finally:
+        _current_fetch.reset(token)
+
+
+def _value_size(value: Any) -> int:
+    """Размер значения в текстовом виде (примерно столько же передается по сети)"""
+    if value is None:
+        return 0
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode())
+    if isinstance(value, (dict, list)):
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode())
+    return len(str(value))
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    counter = _current_fetch.get()
+    if counter is None:
+        return
+    # Курсор asyncpg получает результат целиком при выполнении запроса
+    rows = getattr(cursor, "_rows", None) or ()
+    counter.rows += len(rows)
+    counter.bytes += sum(_value_size(value) for row in rows for value in row)
+
+
+@asynccontextmanager
+async def database() -> AsyncIterator[AsyncSession]:
+    """Сессия БД с учетом запросов (track_queries, track_fetched); движок закрывается после замера"""
+    sync_engine = db_manager.engine.sync_engine
+    instrument_engine(db_manager.engine)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    try:
+        async with db_manager.session_factory() as db_session:
+            yield db_session
+    finally:
+        await db_manager.close()
+
+
+# === ДАННЫЕ ЗАМЕРА ===
+async def create_bench_master(db_session: AsyncSession) -> Master:
+    """Отдельные салон и мастер для данных замера"""
+    await delete_bench_data(db_session)
+    salon = Salon(name="benchmark", city="benchmark", quota_limit=1_000_000)
+    db_session.add(salon)
+    await db_session.flush()
+    master = Master(name="benchmark", telegram_id=BENCH_TELEGRAM_ID, salon_id=salon.id)
+    db_session.add(master)
+    await db_session.commit()
+    return master
+
+
+async def delete_bench_data(db_session: AsyncSession):
+    """Удаление мастера замера вместе с его салоном, анализами и их агрегатами"""
+    await db_session.rollback()
+    salon_ids = (await db_session.execute(
+        select(Master.salon_id).where(Master.telegram_id == BENCH_TELEGRAM_ID)
+    )).scalars().all()
+    await db_session.execute(delete(Analysis).where(Analysis.salon_id.in_(salon_ids)))
+    await db_session.execute(delete(AnalysisDailyStat).where(AnalysisDailyStat.salon_id.in_(salon_ids)))
+    await db_session.execute(delete(Master).where(Master.telegram_id == BENCH_TELEGRAM_ID))
+    await db_session.execute(delete(Salon).where(Salon.id.in_(salon_ids)))
+    await db_session.commit()
+
+
+def run(parser: argparse.ArgumentParser, bench: Callable[[argparse.Namespace], Any]):
+    """Разбор аргументов и запуск замера (асинхронный замер выполняется в asyncio.run)"""
+    args = parser.parse_args()
+    logger.remove()
+    if asyncio.iscoroutinefunction(bench):
+        asyncio.run(bench(args))
+    else:
+        bench(args)
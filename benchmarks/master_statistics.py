@@ -0,0 +1,145 @@
+"""
+Статистика мастера: память и число запросов не зависят от истории анализов
+
+Мастеру замера создается N, затем 10·N анализов с результатами ИИ.
+get_master_statistics должна выполнить один запрос, а ее пик памяти
+(tracemalloc) не должен расти вместе с историей. Для сравнения печатается
+прежний подсчет в Python по всем загруженным анализам.
+    python -m benchmarks.master_statistics --analyses 200 --iterations 20
+"""
+
+import argparse
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer, undefer_group
+
+from app.database.models import Analysis
+from app.services.analysis_queries import AI_PAYLOAD_GROUP
+from app.services.archive import ensure_analysis_partitions
+from app.services.metrics import track_queries
+from app.services.statistics import IN_PROGRESS_STATUSES, get_master_statistics, invalidate_master_statistics
+from benchmarks.harness import check, create_bench_master, database, delete_bench_data, describe, measure, run
+
+STATUSES = ("completed", "completed", "completed", "disputed", "ai_completed", "started")
+
+# Результат ИИ примерно того же размера, что и настоящий
+AI_RESULT = {
+    "summary": "Ногтевая пластина ровная, кутикула аккуратная. " * 20,
+    "recommendations": [f"Рекомендация {index}: увлажнение кутикулы маслом" for index in range(20)],
+    "scores": {f"criterion_{index}": index % 10 for index in range(20)},
+}
+
+# Пик памяти на 10·N анализах может превышать пик на N не больше чем в
+# MEMORY_GROWTH раз плюс MEMORY_SLACK байт (шум аллокатора и драйвера)
+MEMORY_GROWTH = 1.1
+MEMORY_SLACK = 64 * 1024
+
+
+async def _seed(db_session: AsyncSession, salon_id: int, master_id: int, count: int):
+    """count анализов мастера с результатами ИИ пачками по 500"""
+    now = datetime.now()
+    rows = [
+        {
+            "salon_id": salon_id,
+            "master_id": master_id,
+            "status": STATUSES[index % len(STATUSES)],
+            "first_hand_photos": [f"photo-{index}-{photo}" for photo in range(5)],
+            "second_hand_photos": [f"photo-{index}-{photo}" for photo in range(5, 10)],
+            "survey_response": "Кутикула сухая, клиент просит укрепление",
+            "ai_first_analysis": AI_RESULT,
+            "ai_second_analysis": AI_RESULT,
+            "ai_diary": AI_RESULT,
+            "result_data": AI_RESULT,
+            "created_at": now - timedelta(milliseconds=index),
+        }
+        for index in range(count)
+    ]
+    for start in range(0, len(rows), 500):
+        await db_session.execute(insert(Analysis), rows[start:start + 500])
+    await db_session.commit()
+
+
+async def _count_in_python(db_session: AsyncSession, master_id: int) -> Dict[str, Any]:
+    """Прежний подсчет: все анализы мастера вместе с результатами ИИ загружаются в память"""
+    result = await db_session.execute(
+        select(Analysis)
+        .where(Analysis.master_id == master_id)
+        .options(undefer_group(AI_PAYLOAD_GROUP), undefer(Analysis.result_data))
+    )
+    analyses = result.scalars().all()
+    stats = {
+        "total": len(analyses),
+        "completed": len([a for a in analyses if a.status == "completed"]),
+        "disputed": len([a for a in analyses if a.status == "disputed"]),
+        "in_progress": len([a for a in analyses if a.status in IN_PROGRESS_STATUSES]),
+    }
+    db_session.expunge_all()
+    return stats
+
+
+async def _profile(call: Callable[[], Awaitable]) -> Tuple[int, int]:
+    """Пик памяти (байт) и число запросов к БД за один вызов"""
+    tracemalloc.start()
+    try:
+        with track_queries() as queries:
+            await call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak, queries.count
+
+
+async def _bench(args: argparse.Namespace):
+    profiles: Dict[int, Tuple[int, int]] = {}
+    async with database() as db_session:
+        await ensure_analysis_partitions()
+        master = await create_bench_master(db_session)
+        salon_id, master_id = master.salon_id, master.id
+        db_session.expunge_all()
+
+        async def aggregate():
+            # Замеряется запрос, а не кеш
+            invalidate_master_statistics(master_id)
+            return await get_master_statistics(db_session, master_id)
+
+        try:
+            seeded = 0
+            for size in (args.analyses, args.analyses * 10):
+                await _seed(db_session, salon_id, master_id, size - seeded)
+                seeded = size
+
+                # Прогрев: компиляция запроса и соединение из пула
+                await aggregate()
+                profiles[size] = await _profile(aggregate)
+                python_peak, _ = await _profile(lambda: _count_in_python(db_session, master_id))
+                latency = await measure(aggregate, args.iterations)
+
+                peak, statements = profiles[size]
+                print(
+                    f"{size} analyses: aggregate peak {peak / 1024:.0f} KiB, {statements} statement(s), "
+                    f"{describe(latency)}; loaded and counted in Python peak {python_peak / 1024:.0f} KiB"
+                )
+        finally:
+            await delete_bench_data(db_session)
+
+    (small_peak, small_statements), (large_peak, large_statements) = profiles.values()
+    check(small_statements == 1 and large_statements == 1, "get_master_statistics runs a single statement")
+    check(
+        large_peak <= small_peak * MEMORY_GROWTH + MEMORY_SLACK,
+        f"peak memory does not grow with history ({small_peak} -> {large_peak} bytes for 10x analyses)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Память и число запросов статистики мастера")
+    parser.add_argument("--analyses", type=int, default=200, help="анализов мастера в меньшем замере (N)")
+    parser.add_argument("--iterations", type=int, default=20, help="запросов статистики для замера задержки")
+    run(parser, _bench)
+
+
+if __name__ == "__main__":
+    main()
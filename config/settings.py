@@ -18,6 +18,125 @@ class Settings(BaseSettings):
     ADMIN_PASSWORD: str = "admin123"
     FIRST_RUN: bool = True
     
+    # Analysis drafts
+    ANALYSIS_DRAFT_MAX_ENTRIES: int = 10000
+    ANALYSIS_DRAFT_FLUSH_INTERVAL: int = 60  # секунды
+
+    # FSM storage
+    FSM_STORAGE: str = "postgres"  # postgres или memory (один экземпляр)
+    FSM_STATE_RETENTION_DAYS: int = 30
+    FSM_PRUNE_CRON: str = "30 4 * * *"
+    FSM_MEMORY_MAX_ENTRIES: int = 5000  # для FSM_STORAGE=memory
+    FSM_MEMORY_IDLE_TTL: int = 86400  # секунды
+
+    # Statistics
+    MASTER_STATS_CACHE_TTL: int = 30  # секунды
+    DASHBOARD_CACHE_TTL: int = 15  # секунды
+    STATS_RECONCILE_INTERVAL: int = 3600  # секунды
+    STATS_RECONCILE_DAYS: int = 3
+
+    # Admin lists
+    ADMIN_LIST_PAGE_SIZE: int = 20
+    ADMIN_LIST_CACHE_TTL: int = 300  # секунды
+    SEARCH_CACHE_TTL: int = 60  # секунды
+
+    # Analyses partitioning and archive
+    ANALYSIS_PARTITIONS_AHEAD: int = 2  # месяцы
+    ANALYSIS_ARCHIVE_AFTER_DAYS: int = 90
+    ANALYSIS_ARCHIVE_BATCH_SIZE: int = 500
+    ANALYSIS_MAINTENANCE_INTERVAL: int = 3600  # секунды
+
+    # Stale analyses sweeper
+    ANALYSIS_DRAFT_EXPIRE_HOURS: int = 24  # часы без активности мастера
+    AI_HEARTBEAT_INTERVAL: int = 30  # секунды
+    AI_HEARTBEAT_TIMEOUT: int = 300  # секунды
+    AI_MAX_ATTEMPTS: int = 3
+    ANALYSIS_SWEEP_INTERVAL: int = 300  # секунды
+    ANALYSIS_SWEEP_BATCH_SIZE: int = 200
+    ANALYSIS_RESUME_DAYS: int = 7  # предельный возраст черновика и незавершенного анализа
+
+    # Scheduler
+    SCHEDULER_JITTER: int = 10  # секунды
+    SCHEDULER_JOB_TIMEOUT: int = 900  # секунды
+    SCHEDULER_HISTORY_DAYS: int = 30
+    SCHEDULER_HISTORY_PRUNE_CRON: str = "15 4 * * *"
+
+    # Data export
+    EXPORT_BATCH_SIZE: int = 2000
+    EXPORT_PART_SIZE_MB: int = 45  # лимит документа в Telegram - 50 МБ
+
+    # Backup
+    BACKUP_DIR: str = "backups"
+    BACKUP_KEEP: int = 7
+    BACKUP_CRON: str = "0 3 * * *"  # пустая строка отключает автоматические копии
+
+    # Update delivery
+    BOT_MODE: str = "polling"  # polling или webhook
+    TELEGRAM_API_URL: str = ""  # свой Bot API сервер, например http://localhost:8081
+    WEBHOOK_BASE_URL: str = ""  # публичный адрес, например https://bot.example.com
+    WEBHOOK_PATH: str = "/telegram/webhook"
+    WEBHOOK_SECRET: str = ""
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8080
+    WEBHOOK_MAX_CONNECTIONS: int = 40
+    UPDATE_CONCURRENCY: int = 100  # одновременно обрабатываемых обновлений (разных чатов)
+    UPDATE_MAX_PENDING: int = 1000  # всего в обработке и в очередях
+    UPDATE_MAX_PER_CHAT: int = 20  # в очереди одного чата
+    UPDATE_ADMISSION_TIMEOUT: float = 5  # секунды ожидания места в очереди для вебхука
+
+    # Bot API client
+    BOT_API_POOL_SIZE: int = 100  # соединений с Bot API
+    BOT_API_DNS_CACHE_TTL: int = 300  # секунды
+    BOT_API_KEEPALIVE_TIMEOUT: float = 30  # секунды простоя соединения в пуле
+    BOT_API_TIMEOUT: float = 60  # секунды на запрос
+    USE_UVLOOP: bool = True  # если установлен uvloop
+
+    # Outbound sending (лимиты Bot API)
+    SEND_GLOBAL_RATE: float = 30  # сообщений в секунду на бота
+    SEND_CHAT_RATE: float = 1  # сообщений в секунду в личный чат
+    SEND_CHAT_BURST: int = 3
+    SEND_GROUP_RATE: float = 0.33  # ~20 сообщений в минуту в группу
+    SEND_MAX_RETRIES: int = 3  # повторов после ответа 429
+    SEND_MAX_RETRY_AFTER: int = 60  # секунды; при большем retry_after ошибка возвращается сразу
+
+    # Outbox (уведомления после коммита)
+    OUTBOX_BATCH_SIZE: int = 100
+    OUTBOX_POLL_INTERVAL: int = 5  # секунды
+    OUTBOX_MAX_ATTEMPTS: int = 10
+    OUTBOX_RETRY_BASE: int = 5  # секунды до первого повтора, дальше вдвое больше
+    OUTBOX_RETRY_MAX: int = 3600  # секунды
+    OUTBOX_LEASE: int = 120  # секунды аренды пачки экземпляром
+    OUTBOX_RETENTION_DAYS: int = 14
+    OUTBOX_PRUNE_CRON: str = "45 4 * * *"
+
+    # Webhook workers (supervisor.py)
+    WEBHOOK_WORKERS: int = 0  # 0 - по числу ядер
+    WEBHOOK_INTERNAL_PORT: int = 8180  # внутренние порты воркеров: 8180, 8181, ...
+    WORKER_HEALTH_INTERVAL: int = 10  # секунды
+    WORKER_HEALTH_FAILURES: int = 3
+    WORKER_START_TIMEOUT: int = 60  # секунды
+    WORKER_STOP_TIMEOUT: int = 40  # секунды, больше суммы таймаутов SHUTDOWN_*
+
+    # Graceful shutdown
+    SHUTDOWN_TIMEOUT: int = 20  # секунды на доработку принятых обновлений и задач планировщика
+    SHUTDOWN_CANCEL_TIMEOUT: int = 5  # секунды на возврат прерванной работы в очередь
+    SHUTDOWN_OUTBOX_TIMEOUT: int = 5  # секунды на отправку накопленных уведомлений
+
+    # Metrics (Prometheus)
+    METRICS_HOST: str = "0.0.0.0"
+    METRICS_PORT: int = 9100  # 0 - без /metrics; воркеры супервизора: 9100, 9101, ...
+
+    # Query budget (запросов к БД на обновление)
+    QUERY_BUDGET_DEFAULT: int = 20  # для обработчиков без @query_budget; 0 - без ограничения
+    QUERY_REPEAT_THRESHOLD: int = 5  # повторов одного запроса за обновление - признак N+1; 0 - не проверять
+    QUERY_REPORT_INTERVAL: int = 3600  # секунды между сводками в лог; 0 - без сводки
+
+    # Audit log
+    AUDIT_BATCH_SIZE: int = 200
+    AUDIT_FLUSH_INTERVAL: int = 5  # секунды
+    AUDIT_MAX_PENDING: int = 10000
+    SYSTEM_LOG_RETENTION_DAYS: int = 90
+
     # Other
     DEBUG: bool = True
     LOG_LEVEL: str = "INFO"
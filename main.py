@@ -1,6 +1,10 @@
 import asyncio
+import signal
 import sys
 import logging
+from contextlib import suppress
+from typing import Optional
+
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
@@ -8,17 +12,48 @@ from loguru import logger
 
 from config.settings import settings
 from app.database.database import db_manager
-from app.middlewares.auth import AuthMiddleware, DatabaseMiddleware, LoggingMiddleware
+from app.middlewares.auth import (
+    AuthMiddleware, DatabaseMiddleware, LoggingMiddleware, MetricsMiddleware
+)
 from app.handlers import common, admin, master
+from app.services.analysis_drafts import analysis_drafts
+from app.services.archive import archive_ai_payloads, ensure_analysis_partitions
+from app.services.audit import audit_writer, ensure_log_partitions, maintain_system_logs
+from app.services.backup import create_backup
+from app.services.bot_session import create_bot_session, install_event_loop_policy
+from app.services.fsm_storage import PostgresStorage, fsm_storage, prune_fsm_states
+from app.services.metrics import instrument_engine, metrics_server
+from app.services.query_budget import query_watch
+from app.services.outbox import outbox_dispatcher, prune_outbox
+from app.services.rollups import reconcile_daily_stats
+from app.services.scheduler import scheduler, prune_job_runs
+from app.services.send_queue import outbound_dispatcher
+from app.services.sweeper import sweep_stale_analyses
+from app.services.update_executor import OrderedDispatcher, update_executor
+from app.services import webhook
+
+
+def create_bot() -> Bot:
+    """Экземпляр бота (TELEGRAM_API_URL - собственный или локальный Bot API сервер)"""
+    session = create_bot_session()
+    # Все отправки - через очередь с лимитами Bot API и повтором после 429
+    session.middleware(outbound_dispatcher)
+    return Bot(
+        token=settings.BOT_TOKEN,
+        session=session,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+    )
 
 
 async def main():
     """Основная функция запуска бота"""
     
-    # Настройка логирования
+    # Настройка логирования (у каждого воркера супервизора свой файл)
+    worker = webhook.current_worker
+    log_file = "logs/bot.log" if worker is None else f"logs/bot.worker{worker.index}.log"
     logger.remove()
     logger.add(
-        "logs/bot.log",
+        log_file,
         level=settings.LOG_LEVEL,
         rotation="1 day",
         retention="7 days",
@@ -35,22 +70,37 @@ async def main():
     
     logger.info("Starting Hair Analysis Bot...")
     
+    # Лимиты чатов соблюдает воркер-владелец чата, общий лимит бота делится между воркерами
+    if worker is not None:
+        outbound_dispatcher.share_global_rate(worker.count)
+    
     # Инициализируем бота
-    bot = Bot(
-        token=settings.BOT_TOKEN,
-        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
-    )
+    bot = create_bot()
     
-    # Инициализируем диспетчер
-    dp = Dispatcher()
+    # Инициализируем диспетчер (состояния диалогов - в Postgres, общие для всех экземпляров,
+    # или в ограниченном хранилище в памяти при FSM_STORAGE=memory)
+    use_db_storage = isinstance(fsm_storage, PostgresStorage)
+    # Обновления одного чата - по очереди, разных чатов - параллельно (до UPDATE_CONCURRENCY)
+    dp = OrderedDispatcher(
+        storage=fsm_storage,
+        events_isolation=fsm_storage.create_isolation() if use_db_storage else None,
+        executor=update_executor
+    )
     
     # Подключаем middleware
+    # Метрики обработчиков - снаружи остальных middleware, чтобы учесть их запросы к БД
+    dp.message.middleware(MetricsMiddleware())
+    dp.callback_query.middleware(MetricsMiddleware())
+    dp.inline_query.middleware(MetricsMiddleware())
     dp.message.middleware(LoggingMiddleware())
     dp.callback_query.middleware(LoggingMiddleware())
+    dp.inline_query.middleware(LoggingMiddleware())
     dp.message.middleware(DatabaseMiddleware())
     dp.callback_query.middleware(DatabaseMiddleware())
+    dp.inline_query.middleware(DatabaseMiddleware())
     dp.message.middleware(AuthMiddleware())
     dp.callback_query.middleware(AuthMiddleware())
+    dp.inline_query.middleware(AuthMiddleware())
     
     # Подключаем роутеры
     dp.include_router(common.router)
@@ -59,6 +109,10 @@ async def main():
     
     logger.info("Bot configuration complete")
     
+    serving: Optional[asyncio.Task] = None
+    stop_requested = asyncio.Event()
+    install_stop_handlers(stop_requested)
+    
     try:
         # Проверяем подключение к базе данных
         async for session in db_manager.get_session():
@@ -69,20 +123,114 @@ async def main():
         bot_info = await bot.get_me()
         logger.info(f"Bot started: @{bot_info.username}")
         
-        # Запускаем поллинг
-        await dp.start_polling(bot, skip_updates=True)
+        # Запускаем периодический сброс черновиков анализов
+        analysis_drafts.start()
+        
+        # Секции analyses и system_logs на ближайшие месяцы
+        await ensure_analysis_partitions()
+        await ensure_log_partitions()
+        
+        # Журнал действий пишется в БД пачками в фоне
+        audit_writer.start()
+        
+        # Уведомления, записанные обработчиками в outbox, отправляются в фоне
+        outbox_dispatcher.start(bot)
+        
+        # Учет запросов к БД по обновлениям: метрики, бюджет запросов и поиск N+1
+        instrument_engine(db_manager.engine)
+        query_watch.start()
+        
+        # Метрики Prometheus (у воркеров супервизора - каждый на своем порту)
+        await metrics_server.start(worker.index if worker is not None else 0)
+        
+        # Фоновые задачи планировщика (при нескольких экземплярах каждую выполняет один)
+        scheduler.add_interval_job("stats_reconcile", settings.STATS_RECONCILE_INTERVAL, reconcile_daily_stats)
+        scheduler.add_interval_job("analysis_sweeper", settings.ANALYSIS_SWEEP_INTERVAL, sweep_stale_analyses)
+        scheduler.add_interval_job(
+            "analysis_partitions", settings.ANALYSIS_MAINTENANCE_INTERVAL, ensure_analysis_partitions
+        )
+        scheduler.add_interval_job("analysis_archive", settings.ANALYSIS_MAINTENANCE_INTERVAL, archive_ai_payloads)
+        scheduler.add_interval_job(
+            "system_logs_maintenance", settings.ANALYSIS_MAINTENANCE_INTERVAL, maintain_system_logs
+        )
+        scheduler.add_cron_job("scheduler_history_prune", settings.SCHEDULER_HISTORY_PRUNE_CRON, prune_job_runs)
+        if use_db_storage:
+            scheduler.add_cron_job("fsm_states_prune", settings.FSM_PRUNE_CRON, prune_fsm_states)
+        scheduler.add_cron_job("outbox_prune", settings.OUTBOX_PRUNE_CRON, prune_outbox)
+        if settings.BACKUP_CRON:
+            scheduler.add_cron_job("backup", settings.BACKUP_CRON, create_backup)
+        scheduler.start()
+        
+        if settings.BOT_MODE == "webhook":
+            serving = asyncio.create_task(webhook.run_webhook(dp, bot))
+        else:
+            # Запускаем поллинг (сигналы и закрытие сессии бота - в main)
+            serving = asyncio.create_task(
+                dp.start_polling(bot, skip_updates=True, handle_signals=False, close_bot_session=False)
+            )
+        await wait_for_stop(serving, stop_requested)
         
     except Exception as e:
         logger.error(f"Error starting bot: {e}")
         raise
     finally:
-        # Закрываем соединения
+        # Прием обновлений прекращается, принятые обновления и запуски задач
+        # планировщика дорабатываются до SHUTDOWN_TIMEOUT
+        await stop_intake(dp, serving)
+        cancelled, _ = await asyncio.gather(
+            update_executor.drain(settings.SHUTDOWN_TIMEOUT, settings.SHUTDOWN_CANCEL_TIMEOUT),
+            scheduler.stop(timeout=settings.SHUTDOWN_TIMEOUT)
+        )
+        if serving is not None and not serving.done():
+            serving.cancel()
+            await asyncio.gather(serving, return_exceptions=True)
+        
+        # Сохраняем черновики, отправляем уведомления, записываем журнал
+        await analysis_drafts.stop()
+        await outbox_dispatcher.stop(timeout=settings.SHUTDOWN_OUTBOX_TIMEOUT)
+        await audit_writer.stop()
+        await metrics_server.stop()
+        await query_watch.stop()
         await bot.session.close()
         await db_manager.close()
-        logger.info("Bot stopped")
+        logger.info(f"Bot stopped (cancelled updates: {cancelled})")
+
+
+def install_stop_handlers(stop_requested: asyncio.Event):
+    """SIGTERM (и SIGINT вне супервизора) запускают плавную остановку"""
+    loop = asyncio.get_running_loop()
+    signals = [signal.SIGTERM]
+    if webhook.current_worker is None:
+        # Воркеры супервизора игнорируют Ctrl+C, их останавливает супервизор
+        signals.append(signal.SIGINT)
+    for sig in signals:
+        with suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop_requested.set)
+
+
+async def wait_for_stop(serving: asyncio.Task, stop_requested: asyncio.Event):
+    """Ожидание сигнала остановки (или завершения приема обновлений с ошибкой)"""
+    waiter = asyncio.create_task(stop_requested.wait())
+    try:
+        await asyncio.wait({serving, waiter}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        waiter.cancel()
+    if serving.done():
+        serving.result()
+    logger.info("Stop requested, finishing in-flight updates...")
+
+
+async def stop_intake(dp: Dispatcher, serving: Optional[asyncio.Task]):
+    """Прекращение приема новых обновлений"""
+    # Вебхук отвечает 503 на новые обновления (Telegram повторит доставку)
+    update_executor.accepting = False
+    if settings.BOT_MODE != "webhook" and serving is not None and not serving.done():
+        with suppress(RuntimeError):
+            await dp.stop_polling()
 
 
 if __name__ == "__main__":
+    install_event_loop_policy()
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
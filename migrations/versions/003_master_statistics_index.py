@@ -0,0 +1,27 @@
+"""Add index for per-master analysis statistics
+
+Revision ID: 003_master_statistics_index
+Revises: 002_extended_analysis
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '003_master_statistics_index'
+down_revision: Union[str, None] = '002_extended_analysis'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Индекс для агрегатов и поиска последнего анализа мастера"""
+    op.create_index('ix_analyses_master_id_created_at', 'analyses', ['master_id', 'created_at'])
+
+
+def downgrade() -> None:
+    """Откат миграции"""
+    op.drop_index('ix_analyses_master_id_created_at', table_name='analyses')
@@ -0,0 +1,48 @@
+"""Add daily analysis rollup table
+
+Revision ID: 004_analysis_daily_stats
+Revises: 003_master_statistics_index
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '004_analysis_daily_stats'
+down_revision: Union[str, None] = '003_master_statistics_index'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Создание таблицы суточных агрегатов и заполнение по истории анализов"""
+    op.create_table(
+        'analysis_daily_stats',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('salon_id', sa.Integer(), nullable=False),
+        sa.Column('master_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=50), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('day', 'salon_id', 'master_id', 'status')
+    )
+    op.create_index('ix_analysis_daily_stats_salon_id_day', 'analysis_daily_stats', ['salon_id', 'day'])
+    op.create_index('ix_analysis_daily_stats_master_id_day', 'analysis_daily_stats', ['master_id', 'day'])
+
+    # Заполняем агрегаты по существующим анализам
+    op.execute("""
+        INSERT INTO analysis_daily_stats (day, salon_id, master_id, status, count)
+        SELECT date(created_at), salon_id, master_id, status, count(*)
+        FROM analyses
+        WHERE created_at IS NOT NULL
+        GROUP BY date(created_at), salon_id, master_id, status
+    """)
+
+
+def downgrade() -> None:
+    """Откат миграции"""
+    op.drop_index('ix_analysis_daily_stats_master_id_day', table_name='analysis_daily_stats')
+    op.drop_index('ix_analysis_daily_stats_salon_id_day', table_name='analysis_daily_stats')
+    op.drop_table('analysis_daily_stats')
@@ -0,0 +1,35 @@
+"""Add indexes for paginated salon and master lists
+
+Revision ID: 005_admin_list_indexes
+Revises: 004_analysis_daily_stats
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '005_admin_list_indexes'
+down_revision: Union[str, None] = '004_analysis_daily_stats'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Частичные индексы по (name, id) для постраничных списков активных записей"""
+    op.create_index(
+        'ix_salons_active_name_id', 'salons', ['name', 'id'],
+        postgresql_where=sa.text('is_active')
+    )
+    op.create_index(
+        'ix_masters_active_name_id', 'masters', ['name', 'id'],
+        postgresql_where=sa.text('is_active')
+    )
+
+
+def downgrade() -> None:
+    """Откат миграции"""
+    op.drop_index('ix_masters_active_name_id', table_name='masters')
+    op.drop_index('ix_salons_active_name_id', table_name='salons')
@@ -0,0 +1,42 @@
+"""Add pg_trgm indexes for salon and master search
+
+Revision ID: 006_trigram_search
+Revises: 005_admin_list_indexes
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '006_trigram_search'
+down_revision: Union[str, None] = '005_admin_list_indexes'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TRIGRAM_INDEXES = (
+    ('ix_salons_name_trgm', 'salons', 'name'),
+    ('ix_salons_city_trgm', 'salons', 'city'),
+    ('ix_masters_name_trgm', 'masters', 'name'),
+    ('ix_masters_telegram_username_trgm', 'masters', 'telegram_username'),
+)
+
+
+def upgrade() -> None:
+    """Расширение pg_trgm и GIN индексы для поиска по части строки"""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    for index_name, table_name, column_name in TRIGRAM_INDEXES:
+        op.create_index(
+            index_name, table_name, [column_name],
+            postgresql_using='gin',
+            postgresql_ops={column_name: 'gin_trgm_ops'}
+        )
+
+
+def downgrade() -> None:
+    """Откат миграции (расширение pg_trgm не удаляется)"""
+    for index_name, table_name, _ in reversed(TRIGRAM_INDEXES):
+        op.drop_index(index_name, table_name=table_name)
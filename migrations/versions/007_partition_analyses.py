@@ -0,0 +1,160 @@
+"""Partition analyses by month and add cold archive for AI payloads
+
+Revision ID: 007_partition_analyses
+Revises: 006_trigram_search
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '007_partition_analyses'
+down_revision: Union[str, None] = '006_trigram_search'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ANALYSIS_COLUMNS = (
+    "id, master_id, salon_id, first_hand_photos, second_hand_photos, survey_response, "
+    "ai_first_analysis, ai_second_analysis, ai_diary, status, result_data, "
+    "created_at, completed_at, ai_started_at, ai_completed_at"
+)
+
+# Месячные секции от месяца первой записи до следующего месяца после текущего
+CREATE_MONTHLY_PARTITIONS = """
+DO $$
+DECLARE
+    month_start date;
+    last_month date := date_trunc('month', now())::date + interval '1 month';
+BEGIN
+    SELECT coalesce(date_trunc('month', min(created_at))::date, date_trunc('month', now())::date)
+    INTO month_start
+    FROM analyses_legacy;
+
+    WHILE month_start <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF analyses FOR VALUES FROM (%L) TO (%L)',
+            'analyses_' || to_char(month_start, 'YYYY_MM'),
+            month_start,
+            (month_start + interval '1 month')::date
+        );
+        month_start := (month_start + interval '1 month')::date;
+    END LOOP;
+END $$;
+"""
+
+
+def upgrade() -> None:
+    """Перенос analyses в секционированную по месяцам таблицу и создание холодного архива"""
+
+    # Внешние ключи на секционированную таблицу должны включать ключ секционирования,
+    # поэтому ссылки из analysis_reviews и ai_processing_logs поддерживаются приложением
+    op.drop_constraint('analysis_reviews_analysis_id_fkey', 'analysis_reviews', type_='foreignkey')
+    op.drop_constraint('ai_processing_logs_analysis_id_fkey', 'ai_processing_logs', type_='foreignkey')
+
+    # Старая таблица переименовывается, последовательность id переходит к новой
+    op.rename_table('analyses', 'analyses_legacy')
+    op.execute("ALTER TABLE analyses_legacy ALTER COLUMN id DROP DEFAULT")
+    op.execute("ALTER SEQUENCE analyses_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE analyses_legacy RENAME CONSTRAINT analyses_pkey TO analyses_legacy_pkey")
+    op.drop_index('ix_analyses_status', table_name='analyses_legacy')
+    op.drop_index('ix_analyses_ai_started_at', table_name='analyses_legacy')
+    op.drop_index('ix_analyses_master_id_created_at', table_name='analyses_legacy')
+
+    op.create_table(
+        'analyses',
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('analyses_id_seq')"), nullable=False),
+        sa.Column('master_id', sa.Integer(), nullable=False),
+        sa.Column('salon_id', sa.Integer(), nullable=False),
+        sa.Column('first_hand_photos', sa.JSON(), nullable=True),
+        sa.Column('second_hand_photos', sa.JSON(), nullable=True),
+        sa.Column('survey_response', sa.Text(), nullable=True),
+        sa.Column('ai_first_analysis', sa.JSON(), nullable=True),
+        sa.Column('ai_second_analysis', sa.JSON(), nullable=True),
+        sa.Column('ai_diary', sa.JSON(), nullable=True),
+        sa.Column('status', sa.String(length=50), nullable=True),
+        sa.Column('result_data', sa.JSON(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.Column('ai_started_at', sa.DateTime(), nullable=True),
+        sa.Column('ai_completed_at', sa.DateTime(), nullable=True),
+        sa.Column('payload_archived_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['master_id'], ['masters.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['salon_id'], ['salons.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id', 'created_at'),
+        postgresql_partition_by='RANGE (created_at)'
+    )
+    op.execute("ALTER SEQUENCE analyses_id_seq OWNED BY analyses.id")
+
+    op.execute(CREATE_MONTHLY_PARTITIONS)
+    # Страховочная секция для строк вне созданных месяцев
+    op.execute("CREATE TABLE analyses_default PARTITION OF analyses DEFAULT")
+
+    op.create_index('ix_analyses_status', 'analyses', ['status'])
+    op.create_index('ix_analyses_ai_started_at', 'analyses', ['ai_started_at'])
+    op.create_index('ix_analyses_master_id_created_at', 'analyses', ['master_id', 'created_at'])
+
+    op.execute(f"INSERT INTO analyses ({ANALYSIS_COLUMNS}) SELECT {ANALYSIS_COLUMNS} FROM analyses_legacy")
+    op.drop_table('analyses_legacy')
+
+    # Холодный архив сжатых результатов ИИ
+    op.create_table(
+        'analysis_payload_archive',
+        sa.Column('analysis_id', sa.Integer(), nullable=False),
+        sa.Column('analysis_created_at', sa.DateTime(), nullable=False),
+        sa.Column('payload', sa.LargeBinary(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('analysis_id')
+    )
+
+
+def downgrade() -> None:
+    """Откат миграции (архивные результаты ИИ остаются сжатыми в analysis_payload_archive)"""
+    op.rename_table('analyses', 'analyses_partitioned')
+    op.execute("ALTER TABLE analyses_partitioned ALTER COLUMN id DROP DEFAULT")
+    op.execute("ALTER SEQUENCE analyses_id_seq OWNED BY NONE")
+    op.drop_index('ix_analyses_status', table_name='analyses_partitioned')
+    op.drop_index('ix_analyses_ai_started_at', table_name='analyses_partitioned')
+    op.drop_index('ix_analyses_master_id_created_at', table_name='analyses_partitioned')
+
+    op.create_table(
+        'analyses',
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('analyses_id_seq')"), nullable=False),
+        sa.Column('master_id', sa.Integer(), nullable=False),
+        sa.Column('salon_id', sa.Integer(), nullable=False),
+        sa.Column('photo_file_id', sa.String(length=255), nullable=True),
+        sa.Column('first_hand_photos', sa.JSON(), nullable=True),
+        sa.Column('second_hand_photos', sa.JSON(), nullable=True),
+        sa.Column('survey_response', sa.Text(), nullable=True),
+        sa.Column('ai_first_analysis', sa.JSON(), nullable=True),
+        sa.Column('ai_second_analysis', sa.JSON(), nullable=True),
+        sa.Column('ai_diary', sa.JSON(), nullable=True),
+        sa.Column('status', sa.String(length=50), nullable=True),
+        sa.Column('result_data', sa.JSON(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.Column('ai_started_at', sa.DateTime(), nullable=True),
+        sa.Column('ai_completed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['master_id'], ['masters.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['salon_id'], ['salons.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("ALTER SEQUENCE analyses_id_seq OWNED BY analyses.id")
+    op.execute(f"INSERT INTO analyses ({ANALYSIS_COLUMNS}) SELECT {ANALYSIS_COLUMNS} FROM analyses_partitioned")
+    op.drop_table('analyses_partitioned')
+
+    op.create_index('ix_analyses_status', 'analyses', ['status'])
+    op.create_index('ix_analyses_ai_started_at', 'analyses', ['ai_started_at'])
+    op.create_index('ix_analyses_master_id_created_at', 'analyses', ['master_id', 'created_at'])
+
+    op.create_foreign_key(
+        'analysis_reviews_analysis_id_fkey', 'analysis_reviews', 'analyses',
+        ['analysis_id'], ['id'], ondelete='CASCADE'
+    )
+    op.create_foreign_key(
+        'ai_processing_logs_analysis_id_fkey', 'ai_processing_logs', 'analyses',
+        ['analysis_id'], ['id'], ondelete='CASCADE'
+    )
+    op.drop_table('analysis_payload_archive')
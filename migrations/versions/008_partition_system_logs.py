@@ -0,0 +1,98 @@
+"""Partition system_logs by month
+
+Revision ID: 008_partition_system_logs
+Revises: 007_partition_analyses
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '008_partition_system_logs'
+down_revision: Union[str, None] = '007_partition_analyses'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SYSTEM_LOG_COLUMNS = "id, user_id, action, details, created_at"
+
+# Месячные секции от месяца первой записи до следующего месяца после текущего
+CREATE_MONTHLY_PARTITIONS = """
+DO $$
+DECLARE
+    month_start date;
+    last_month date := date_trunc('month', now())::date + interval '1 month';
+BEGIN
+    SELECT coalesce(date_trunc('month', min(created_at))::date, date_trunc('month', now())::date)
+    INTO month_start
+    FROM system_logs_legacy;
+
+    WHILE month_start <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF system_logs FOR VALUES FROM (%L) TO (%L)',
+            'system_logs_' || to_char(month_start, 'YYYY_MM'),
+            month_start,
+            (month_start + interval '1 month')::date
+        );
+        month_start := (month_start + interval '1 month')::date;
+    END LOOP;
+END $$;
+"""
+
+
+def upgrade() -> None:
+    """Перенос system_logs в секционированную по месяцам таблицу"""
+
+    # Старая таблица переименовывается, последовательность id переходит к новой
+    op.rename_table('system_logs', 'system_logs_legacy')
+    op.execute("ALTER TABLE system_logs_legacy ALTER COLUMN id DROP DEFAULT")
+    op.execute("ALTER SEQUENCE system_logs_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE system_logs_legacy RENAME CONSTRAINT system_logs_pkey TO system_logs_legacy_pkey")
+
+    op.create_table(
+        'system_logs',
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('system_logs_id_seq')"), nullable=False),
+        sa.Column('user_id', sa.BigInteger(), nullable=True),
+        sa.Column('action', sa.String(length=255), nullable=False),
+        sa.Column('details', sa.JSON(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id', 'created_at'),
+        postgresql_partition_by='RANGE (created_at)'
+    )
+    op.execute("ALTER SEQUENCE system_logs_id_seq OWNED BY system_logs.id")
+
+    op.execute(CREATE_MONTHLY_PARTITIONS)
+    # Страховочная секция для строк вне созданных месяцев
+    op.execute("CREATE TABLE system_logs_default PARTITION OF system_logs DEFAULT")
+
+    op.create_index('ix_system_logs_created_at', 'system_logs', ['created_at'])
+
+    op.execute(
+        f"INSERT INTO system_logs ({SYSTEM_LOG_COLUMNS}) SELECT {SYSTEM_LOG_COLUMNS} FROM system_logs_legacy"
+    )
+    op.drop_table('system_logs_legacy')
+
+
+def downgrade() -> None:
+    """Откат миграции: возврат к обычной таблице system_logs"""
+    op.rename_table('system_logs', 'system_logs_partitioned')
+    op.execute("ALTER TABLE system_logs_partitioned ALTER COLUMN id DROP DEFAULT")
+    op.execute("ALTER SEQUENCE system_logs_id_seq OWNED BY NONE")
+    op.drop_index('ix_system_logs_created_at', table_name='system_logs_partitioned')
+
+    op.create_table(
+        'system_logs',
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('system_logs_id_seq')"), nullable=False),
+        sa.Column('user_id', sa.BigInteger(), nullable=True),
+        sa.Column('action', sa.String(length=255), nullable=False),
+        sa.Column('details', sa.JSON(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("ALTER SEQUENCE system_logs_id_seq OWNED BY system_logs.id")
+    op.execute(
+        f"INSERT INTO system_logs ({SYSTEM_LOG_COLUMNS}) SELECT {SYSTEM_LOG_COLUMNS} FROM system_logs_partitioned"
+    )
+    op.drop_table('system_logs_partitioned')
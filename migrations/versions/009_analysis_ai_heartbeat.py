@@ -0,0 +1,29 @@
+"""Add AI heartbeat and attempts to analyses
+
+Revision ID: 009_analysis_ai_heartbeat
+Revises: 008_partition_system_logs
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '009_analysis_ai_heartbeat'
+down_revision: Union[str, None] = '008_partition_system_logs'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Сердцебиение и счетчик запусков ИИ анализа для уборки зависших анализов"""
+    op.add_column('analyses', sa.Column('ai_heartbeat_at', sa.DateTime(), nullable=True))
+    op.add_column('analyses', sa.Column('ai_attempts', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Откат миграции"""
+    op.drop_column('analyses', 'ai_attempts')
+    op.drop_column('analyses', 'ai_heartbeat_at')
@@ -0,0 +1,46 @@
+"""Add scheduler job runs history
+
+Revision ID: 010_scheduler_job_runs
+Revises: 009_analysis_ai_heartbeat
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '010_scheduler_job_runs'
+down_revision: Union[str, None] = '009_analysis_ai_heartbeat'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """История запусков фоновых задач планировщика"""
+    op.create_table(
+        'scheduler_job_runs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('job_name', sa.String(length=100), nullable=False),
+        sa.Column('scheduled_at', sa.DateTime(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=False),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('duration_ms', sa.Integer(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('instance', sa.String(length=255), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ux_scheduler_job_runs_job_name_scheduled_at', 'scheduler_job_runs',
+        ['job_name', 'scheduled_at'], unique=True
+    )
+    op.create_index('ix_scheduler_job_runs_started_at', 'scheduler_job_runs', ['started_at'])
+
+
+def downgrade() -> None:
+    """Откат миграции"""
+    op.drop_index('ix_scheduler_job_runs_started_at', table_name='scheduler_job_runs')
+    op.drop_index('ux_scheduler_job_runs_job_name_scheduled_at', table_name='scheduler_job_runs')
+    op.drop_table('scheduler_job_runs')
@@ -0,0 +1,41 @@
+"""Add FSM states table
+
+Revision ID: 011_fsm_states
+Revises: 010_scheduler_job_runs
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '011_fsm_states'
+down_revision: Union[str, None] = '010_scheduler_job_runs'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Хранилище состояний FSM (UNLOGGED-таблица)"""
+    op.create_table(
+        'fsm_states',
+        sa.Column('chat_id', sa.BigInteger(), nullable=False),
+        sa.Column('user_id', sa.BigInteger(), nullable=False),
+        sa.Column('bot_id', sa.BigInteger(), nullable=False),
+        sa.Column('thread_id', sa.BigInteger(), nullable=False),
+        sa.Column('destiny', sa.String(length=50), nullable=False),
+        sa.Column('state', sa.String(length=255), nullable=True),
+        sa.Column('data', sa.JSON(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('chat_id', 'user_id', 'bot_id', 'thread_id', 'destiny'),
+        prefixes=['UNLOGGED']
+    )
+    op.create_index('ix_fsm_states_updated_at', 'fsm_states', ['updated_at'])
+
+
+def downgrade() -> None:
+    """Откат миграции"""
+    op.drop_index('ix_fsm_states_updated_at', table_name='fsm_states')
+    op.drop_table('fsm_states')
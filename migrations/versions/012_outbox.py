@@ -0,0 +1,53 @@
+"""Add outbox for Telegram notifications
+
+Revision ID: 012_outbox
+Revises: 011_fsm_states
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '012_outbox'
+down_revision: Union[str, None] = '011_fsm_states'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Очередь уведомлений Telegram, записываемых вместе с изменением данных"""
+    op.create_table(
+        'outbox',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('dedup_key', sa.String(length=255), nullable=False),
+        sa.Column('chat_id', sa.BigInteger(), nullable=False),
+        sa.Column('body', sa.Text(), nullable=False),
+        sa.Column('parse_mode', sa.String(length=20), nullable=True),
+        sa.Column('reply_markup', sa.JSON(), nullable=True),
+        sa.Column('edit_message_id', sa.BigInteger(), nullable=True),
+        sa.Column('priority', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ux_outbox_dedup_key', 'outbox', ['dedup_key'], unique=True)
+    op.create_index(
+        'ix_outbox_pending_next_attempt_at', 'outbox', ['next_attempt_at'],
+        postgresql_where=sa.text("status = 'pending'")
+    )
+    op.create_index('ix_outbox_created_at', 'outbox', ['created_at'])
+
+
+def downgrade() -> None:
+    """Откат миграции"""
+    op.drop_index('ix_outbox_created_at', table_name='outbox')
+    op.drop_index('ix_outbox_pending_next_attempt_at', table_name='outbox')
+    op.drop_index('ux_outbox_dedup_key', table_name='outbox')
+    op.drop_table('outbox')
@@ -0,0 +1,27 @@
+"""Add last activity time to analyses
+
+Revision ID: 013_analysis_last_activity
+Revises: 012_outbox
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '013_analysis_last_activity'
+down_revision: Union[str, None] = '012_outbox'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Время последней активности мастера в черновике для уборки брошенных черновиков"""
+    op.add_column('analyses', sa.Column('last_activity_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    """Откат миграции"""
+    op.drop_column('analyses', 'last_activity_at')
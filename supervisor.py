@@ -0,0 +1,269 @@
+"""
+Запуск бота в режиме вебхука несколькими процессами
+
+    python supervisor.py [--workers N]
+
+Супервизор запускает N воркеров (у каждого свой цикл событий, пул соединений
+БД и сессия бота), все они слушают WEBHOOK_PORT через SO_REUSEPORT.
+Обновления одного чата обрабатывает один воркер (см. app/services/webhook.py).
+
+- упавший или не отвечающий на /health воркер перезапускается;
+- SIGHUP - поочередный перезапуск: новый воркер запускается и становится
+  готов до остановки старого, поэтому порт не простаивает, но обновления
+  своих чатов принимает только после выхода старого (до этого отвечает 503);
+- SIGUSR1 - сводка состояния воркеров в лог;
+- SIGTERM/SIGINT - остановка воркеров (каждый дорабатывает принятые
+  обновления) и удаление вебхука.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import secrets
+import signal
+import sys
+import time
+from typing import Dict, List, Optional
+
+from aiohttp import ClientError, ClientSession, ClientTimeout
+from loguru import logger
+
+from config.settings import settings
+
+RESTART_BACKOFF_MAX = 60  # секунды
+
+_context = multiprocessing.get_context("spawn")
+
+
+def _worker_entry(index: int, count: int, secret: str, ready, owns_chats):
+    """Точка входа процесса-воркера"""
+    # Ctrl+C получает вся группа процессов - воркеры останавливает супервизор
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    import main
+    from app.services import webhook
+    from app.services.bot_session import install_event_loop_policy
+
+    webhook.current_worker = webhook.WorkerInfo(index, count, secret, ready, owns_chats)
+    install_event_loop_policy()
+
+    # SIGTERM запускает плавную остановку воркера (см. main.install_stop_handlers)
+    asyncio.run(main.main())
+
+
+class WorkerProcess:
+    """Процесс-воркер и результаты проверок его состояния"""
+
+    def __init__(self, index: int, count: int, secret: str):
+        self.index = index
+        self.ready = _context.Event()
+        # Предыдущий воркер с этим номером завершился, чаты номера переходят к этому
+        self.owns_chats = _context.Event()
+        self.process = _context.Process(
+            target=_worker_entry,
+            args=(index, count, secret, self.ready, self.owns_chats),
+            name=f"bot-worker-{index}",
+            daemon=False
+        )
+        self.started_at: Optional[float] = None
+        self.health: Dict = {}
+        self.health_failures = 0
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.process.pid
+
+    def start(self):
+        self.process.start()
+        self.started_at = time.monotonic()
+
+    async def wait_ready(self, timeout: float) -> bool:
+        return await asyncio.to_thread(self.ready.wait, timeout)
+
+    async def stop(self, timeout: float):
+        """SIGTERM и ожидание завершения, по истечении timeout - SIGKILL"""
+        if self.process.is_alive():
+            self.process.terminate()
+            await asyncio.to_thread(self.process.join, timeout)
+        if self.process.is_alive():
+            logger.warning(f"Worker {self.index} (pid {self.pid}) did not stop in {timeout}s, killing")
+            self.process.kill()
+            await asyncio.to_thread(self.process.join)
+
+
+class Supervisor:
+    """Запуск, контроль состояния и перезапуск воркеров"""
+
+    def __init__(self, count: int):
+        self.count = count
+        # Общий секрет для пересылки обновлений между воркерами
+        self.secret = secrets.token_urlsafe(32)
+        self.workers: List[Optional[WorkerProcess]] = [None] * count
+        self.restarts = [0] * count
+        self._stopping = asyncio.Event()
+        self._restart_lock = asyncio.Lock()
+        self._client: Optional[ClientSession] = None
+
+    async def _spawn(self, index: int) -> WorkerProcess:
+        worker = WorkerProcess(index, self.count, self.secret)
+        worker.start()
+        if await worker.wait_ready(settings.WORKER_START_TIMEOUT):
+            logger.info(f"Worker {index} started (pid {worker.pid})")
+        else:
+            logger.error(f"Worker {index} (pid {worker.pid}) not ready after {settings.WORKER_START_TIMEOUT}s")
+        return worker
+
+    async def _take_over(self, index: int):
+        """
+        Запуск воркера на место прежнего
+
+        Новый воркер готов принимать запросы до остановки старого, но обновления
+        чатов номера index обрабатывает только после его выхода: старый воркер
+        успевает доработать принятые обновления и записать черновики и состояния,
+        и два процесса никогда не обрабатывают один чат одновременно.
+        """
+        old = self.workers[index]
+        new = await self._spawn(index)
+        self.workers[index] = new
+        if old is not None:
+            await old.stop(settings.WORKER_STOP_TIMEOUT)
+        new.owns_chats.set()
+
+    async def _replace(self, index: int, reason: str):
+        old = self.workers[index]
+        logger.warning(f"Restarting worker {index} (pid {old.pid if old else None}): {reason}")
+        # Частые падения - перезапуск с нарастающей задержкой
+        self.restarts[index] += 1
+        if old is not None and old.started_at and time.monotonic() - old.started_at < RESTART_BACKOFF_MAX:
+            await asyncio.sleep(min(2 ** self.restarts[index], RESTART_BACKOFF_MAX))
+        else:
+            self.restarts[index] = 0
+
+        await self._take_over(index)
+
+    async def rolling_restart(self):
+        """Поочередный перезапуск всех воркеров без остановки приема обновлений"""
+        async with self._restart_lock:
+            logger.info("Rolling restart of workers")
+            for index in range(self.count):
+                if self._stopping.is_set():
+                    return
+                await self._take_over(index)
+            logger.info("Rolling restart complete")
+
+    async def _check_health(self, worker: WorkerProcess) -> bool:
+        from app.services.webhook import HEALTH_PATH, internal_port
+
+        try:
+            async with self._client.get(f"http://127.0.0.1:{internal_port(worker.index)}{HEALTH_PATH}") as response:
+                response.raise_for_status()
+                worker.health = await response.json()
+        except (ClientError, asyncio.TimeoutError, ValueError):
+            return False
+        return True
+
+    async def _monitor(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=settings.WORKER_HEALTH_INTERVAL)
+                return
+            except asyncio.TimeoutError:
+                pass
+
+            async with self._restart_lock:
+                for index, worker in enumerate(self.workers):
+                    if self._stopping.is_set():
+                        return
+                    if not worker.process.is_alive():
+                        await self._replace(index, f"exited with code {worker.process.exitcode}")
+                        continue
+                    starting = time.monotonic() - worker.started_at < settings.WORKER_START_TIMEOUT
+                    if not worker.ready.is_set() and starting:
+                        continue
+
+                    if await self._check_health(worker):
+                        worker.health_failures = 0
+                        continue
+                    worker.health_failures += 1
+                    logger.warning(
+                        f"Worker {index} (pid {worker.pid}) health check failed "
+                        f"({worker.health_failures}/{settings.WORKER_HEALTH_FAILURES})"
+                    )
+                    if worker.health_failures >= settings.WORKER_HEALTH_FAILURES:
+                        await self._replace(index, "health checks failed")
+
+    def report(self):
+        """Сводка состояния воркеров в лог"""
+        for worker in self.workers:
+            if worker is None:
+                continue
+            health = worker.health
+            logger.info(
+                f"Worker {worker.index}: pid {worker.pid}, alive {worker.process.is_alive()}, "
+                f"uptime {health.get('uptime', 0)}s, received {health.get('received', 0)}, "
+                f"forwarded {health.get('forwarded', 0)}, handled {health.get('handled', 0)}, "
+                f"in flight {health.get('in_flight', 0)}, forward errors {health.get('forward_errors', 0)}, "
+                f"executor {health.get('executor', {})}, outbound {health.get('outbound', {})}"
+            )
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, self._stopping.set)
+        loop.add_signal_handler(signal.SIGINT, self._stopping.set)
+        loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.create_task(self.rolling_restart()))
+        loop.add_signal_handler(signal.SIGUSR1, self.report)
+
+        self._client = ClientSession(timeout=ClientTimeout(total=5))
+        logger.info(f"Supervisor (pid {os.getpid()}) starting {self.count} webhook workers")
+        try:
+            for index in range(self.count):
+                await self._take_over(index)
+            await self._monitor()
+        finally:
+            logger.info("Stopping workers...")
+            await asyncio.gather(*(
+                worker.stop(settings.WORKER_STOP_TIMEOUT) for worker in self.workers if worker is not None
+            ))
+            await self._client.close()
+            await self._delete_webhook()
+            logger.info("Supervisor stopped")
+
+    @staticmethod
+    async def _delete_webhook():
+        from main import create_bot
+
+        bot = create_bot()
+        try:
+            await bot.delete_webhook()
+        except Exception as e:
+            logger.warning(f"Error deleting webhook: {e}")
+        finally:
+            await bot.session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Запуск бота несколькими процессами в режиме вебхука")
+    parser.add_argument("--workers", type=int, default=None, help="число воркеров (по умолчанию WEBHOOK_WORKERS)")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(
+        "logs/supervisor.log",
+        level=settings.LOG_LEVEL,
+        rotation="1 day",
+        retention="7 days",
+        format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}"
+    )
+    logger.add(sys.stdout, level=settings.LOG_LEVEL, format="{time:HH:mm:ss} | supervisor | {level} | {message}")
+
+    if settings.BOT_MODE != "webhook" or not settings.WEBHOOK_BASE_URL:
+        logger.error("Supervisor requires BOT_MODE=webhook and WEBHOOK_BASE_URL")
+        sys.exit(1)
+
+    count = args.workers or settings.WEBHOOK_WORKERS or os.cpu_count() or 1
+    asyncio.run(Supervisor(count).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import asyncio
+from datetime import datetime
+
+from sqlalchemy.sql import Select, operators
+
+from app.services import analysis_drafts
+from app.services.analysis_drafts import AnalysisDraftStore
+
+CREATED_AT = datetime(2026, 10, 1, 12, 0)
+
+
+class FakeResult:
+    def __init__(self, row=None, rowcount=0):
+        self.row = row
+        self.rowcount = rowcount
+
+    def one_or_none(self):
+        return self.row
+
+
+class FakeAnalyses:
+    """Строки analyses: выполняет выборку черновика и условный UPDATE из AnalysisDraftStore"""
+
+    def __init__(self):
+        self.rows = {}
+        self.updates = 0
+
+    def add(self, analysis_id: int):
+        self.rows[analysis_id] = {
+            "id": analysis_id,
+            "salon_id": 1,
+            "master_id": 1,
+            "created_at": CREATED_AT,
+            "first_hand_photos": [],
+            "second_hand_photos": [],
+            "survey_response": None,
+            "status": "started",
+            "last_activity_at": None,
+        }
+
+    def _matches(self, row: dict, clause) -> bool:
+        expected = getattr(clause.right, "value", None)
+        if clause.operator is operators.is_not_distinct_from:
+            return row[clause.left.key] == expected
+        return clause.operator(row[clause.left.key], expected)
+
+    async def execute(self, statement):
+        clauses = statement._where_criteria
+        row = self.rows[next(clause.right.value for clause in clauses if clause.left.key == "id")]
+        if not all(self._matches(row, clause) for clause in clauses):
+            return FakeResult()
+        if isinstance(statement, Select):
+            return FakeResult(row=tuple(row[column.key] for column in statement.selected_columns))
+        self.updates += 1
+        row.update({column.key: value.value for column, value in statement._values.items()})
+        return FakeResult(rowcount=1)
+
+    async def commit(self):
+        pass
+
+
+async def no_rollups(*args):
+    pass
+
+
+def make_db(monkeypatch) -> FakeAnalyses:
+    monkeypatch.setattr(analysis_drafts, "record_status_transition", no_rollups)
+    db = FakeAnalyses()
+    db.add(1)
+    return db
+
+
+def test_stale_draft_does_not_overwrite_photos_written_by_another_process(monkeypatch):
+    db = make_db(monkeypatch)
+    # Чат передан другому воркеру: оба процесса держат черновик одного анализа
+    old_owner = AnalysisDraftStore(max_entries=10, flush_interval=60)
+    new_owner = AnalysisDraftStore(max_entries=10, flush_interval=60)
+
+    async def scenario():
+        stale = await old_owner.get(db, 1)
+        fresh = await new_owner.get(db, 1)
+
+        fresh.first_hand_photos.append("photo-new-owner")
+        new_owner.mark_dirty(fresh)
+        assert await new_owner.flush(db, 1)
+
+        stale.first_hand_photos.append("photo-old-owner")
+        old_owner.mark_dirty(stale)
+        assert not await old_owner.flush(db, 1)
+        assert stale.dropped
+
+        # Следующий шаг на старом воркере видит записанные фото
+        return await old_owner.get(db, 1)
+
+    reloaded = asyncio.run(scenario())
+
+    assert db.rows[1]["first_hand_photos"] == ["photo-new-owner"]
+    assert reloaded.first_hand_photos == ["photo-new-owner"]
+
+
+def test_photo_steps_are_written_only_at_checkpoints(monkeypatch):
+    db = make_db(monkeypatch)
+    store = AnalysisDraftStore(max_entries=10, flush_interval=60)
+
+    async def scenario():
+        for field in ("first_hand_photos", "second_hand_photos"):
+            for index in range(3):
+                draft = await store.get(db, 1)
+                getattr(draft, field).append(f"{field}-{index}")
+                store.mark_dirty(draft)
+        draft = await store.get(db, 1)
+        draft.first_hand_photos.pop()
+        store.mark_dirty(draft)
+
+        # Переход к опросу
+        await store.flush(db, 1)
+
+        draft = await store.get(db, 1)
+        draft.survey_response = "Кутикула сухая, ногти ломкие"
+        draft.status = "ready_for_ai"
+        store.mark_dirty(draft)
+
+        # Запуск ИИ
+        await store.flush(db, 1)
+
+    asyncio.run(scenario())
+
+    # 8 изменений черновика - 2 записи в analyses
+    assert db.updates == 2
+    assert db.rows[1]["first_hand_photos"] == ["first_hand_photos-0", "first_hand_photos-1"]
+    assert db.rows[1]["status"] == "ready_for_ai"
@@ -0,0 +1,65 @@
+import asyncio
+
+from sqlalchemy.exc import DataError, OperationalError
+
+from app.services import audit
+from app.services.audit import AuditWriter
+
+
+class FakeSession:
+    def __init__(self, db):
+        self.db = db
+
+    async def execute(self, statement, rows):
+        if self.db.down:
+            raise OperationalError("INSERT", {}, ConnectionError("connection refused"))
+        if any(row["action"] == "bad" for row in rows):
+            raise DataError("INSERT", {}, ValueError("value too long"))
+        self.db.pending = list(rows)
+
+    async def commit(self):
+        self.db.rows.extend(self.db.pending)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.rows = []
+        self.pending = []
+        self.down = False
+
+    async def get_session(self):
+        yield FakeSession(self)
+
+
+def make_writer(monkeypatch, batch_size=8):
+    db = FakeDatabase()
+    monkeypatch.setattr(audit, "db_manager", db)
+    return AuditWriter(batch_size=batch_size, flush_interval=60, max_pending=100), db
+
+
+def test_bad_event_is_dropped_and_the_rest_of_the_batch_written(monkeypatch):
+    writer, db = make_writer(monkeypatch)
+    for index in range(8):
+        writer.record(index, "bad" if index == 5 else "ok")
+
+    assert asyncio.run(writer.flush()) == 7
+    assert [row["user_id"] for row in db.rows] == [0, 1, 2, 3, 4, 6, 7]
+    assert len(writer) == 0
+
+    # Следующие события не блокируются отброшенным
+    writer.record(8, "ok")
+    assert asyncio.run(writer.flush()) == 1
+
+
+def test_batch_is_kept_in_order_when_the_database_is_down(monkeypatch):
+    writer, db = make_writer(monkeypatch, batch_size=4)
+    for index in range(6):
+        writer.record(index, "ok")
+
+    db.down = True
+    assert asyncio.run(writer.flush()) == 0
+    assert len(writer) == 6
+
+    db.down = False
+    assert asyncio.run(writer.flush()) == 6
+    assert [row["user_id"] for row in db.rows] == list(range(6))
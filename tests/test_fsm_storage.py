@@ -0,0 +1,107 @@
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+from sqlalchemy.sql import Select
+
+from app.services import fsm_storage
+from app.services.fsm_storage import PostgresStorage
+
+
+class FakeResult:
+    def __init__(self, row):
+        self.row = row
+
+    def one_or_none(self):
+        return self.row
+
+
+class FakeRow:
+    def __init__(self, state, data):
+        self.state = state
+        self.data = data
+
+
+class FakeSession:
+    def __init__(self, db):
+        self.db = db
+
+    async def execute(self, statement, rows=None):
+        if isinstance(statement, Select):
+            self.db.reads += 1
+            return FakeResult(FakeRow(self.db.row["state"], self.db.row["data"]) if self.db.row else None)
+        self.db.writes += 1
+        self.db.pending = rows[0] if rows else None
+
+    async def commit(self):
+        self.db.row = self.db.pending
+
+
+class FakeDatabase:
+    """Таблица fsm_states с одним диалогом"""
+
+    def __init__(self):
+        self.row = None
+        self.pending = None
+        self.reads = 0
+        self.writes = 0
+
+    async def get_session(self):
+        yield FakeSession(self)
+
+
+KEY = StorageKey(bot_id=1, chat_id=7, user_id=7)
+
+
+async def handle_step(storage: PostgresStorage, state: str):
+    data = await storage.get_data(KEY)
+    data["steps"] = data.get("steps", 0) + 1
+    await storage.set_data(KEY, data)
+    await storage.set_state(KEY, state)
+
+
+def test_update_reads_once_and_writes_before_it_finishes(monkeypatch):
+    db = FakeDatabase()
+    monkeypatch.setattr(fsm_storage, "db_manager", db)
+    storage = PostgresStorage()
+    isolation = storage.create_isolation()
+
+    async def update():
+        async with isolation.lock(KEY):
+            assert await storage.get_state(KEY) is None
+            await handle_step(storage, "MasterStates:waiting_for_first_hand_photos")
+            assert db.writes == 0
+        assert db.writes == 1
+
+    asyncio.run(update())
+
+    assert db.reads == 1
+    assert db.row["state"] == "MasterStates:waiting_for_first_hand_photos"
+    assert db.row["data"] == {"steps": 1}
+
+
+def test_next_update_on_another_instance_sees_written_state(monkeypatch):
+    db = FakeDatabase()
+    monkeypatch.setattr(fsm_storage, "db_manager", db)
+    first, second = PostgresStorage(), PostgresStorage()
+
+    async def update(storage: PostgresStorage, state: str):
+        async with storage.create_isolation().lock(KEY):
+            await handle_step(storage, state)
+
+    asyncio.run(update(first, "first"))
+    asyncio.run(update(second, "second"))
+    asyncio.run(update(first, "third"))
+
+    assert db.row["state"] == "third"
+    assert db.row["data"] == {"steps": 3}
+
+
+def test_change_outside_update_is_written_immediately(monkeypatch):
+    db = FakeDatabase()
+    monkeypatch.setattr(fsm_storage, "db_manager", db)
+    storage = PostgresStorage()
+
+    asyncio.run(storage.set_state(KEY, "reviewing_results"))
+
+    assert db.writes == 1
+    assert db.row["state"] == "reviewing_results"
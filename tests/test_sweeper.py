@@ -0,0 +1,87 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+from app.services import sweeper
+from app.services.sweeper import finish_ai_attempt, recover_orphaned_ai
+
+CREATED_AT = datetime(2026, 10, 1, 12, 0)
+
+
+class FakeResult:
+    def __init__(self, rows=(), rowcount=0):
+        self.rows = list(rows)
+        self.rowcount = rowcount
+
+    def all(self):
+        return self.rows
+
+
+class FakeSession:
+    """Анализ в статусе ai_analyzing; UPDATE совпадает, только если matches"""
+
+    def __init__(self, matches: bool, stale_rows=()):
+        self.matches = matches
+        self.stale_rows = list(stale_rows)
+        self.commits = 0
+
+    async def execute(self, statement):
+        if statement.is_select:
+            table = statement.get_final_froms()[0].name
+            if table == "masters":
+                return FakeResult([(1, 1001)])
+            rows, self.stale_rows = self.stale_rows, []
+            return FakeResult(rows)
+        return FakeResult(rowcount=1 if self.matches else 0)
+
+    async def commit(self):
+        self.commits += 1
+
+
+def record_calls(monkeypatch):
+    transitions, notifications = [], []
+
+    async def record_status_transition(db_session, created_at, salon_id, master_id, old_status, new_status):
+        transitions.append((old_status, new_status))
+
+    async def enqueue_notification(db_session, key, chat_id, text, **kwargs):
+        notifications.append((key, chat_id))
+
+    monkeypatch.setattr(sweeper, "record_status_transition", record_status_transition)
+    monkeypatch.setattr(sweeper, "enqueue_notification", enqueue_notification)
+    return transitions, notifications
+
+
+def test_late_ai_result_after_sweeper_reset_is_dropped(monkeypatch):
+    transitions, _ = record_calls(monkeypatch)
+    analysis = SimpleNamespace(id=5, created_at=CREATED_AT, salon_id=1, master_id=1)
+
+    written = asyncio.run(finish_ai_attempt(FakeSession(matches=False), analysis, 1, "ai_completed"))
+
+    assert written is False
+    assert transitions == []
+
+
+def test_ai_result_of_current_attempt_is_recorded_once(monkeypatch):
+    transitions, _ = record_calls(monkeypatch)
+    analysis = SimpleNamespace(id=5, created_at=CREATED_AT, salon_id=1, master_id=1)
+
+    assert asyncio.run(finish_ai_attempt(FakeSession(matches=True), analysis, 1, "ai_completed"))
+    assert transitions == [("ai_analyzing", "ai_completed")]
+
+
+def test_sweeper_notifies_master_about_failed_and_requeued_analyses(monkeypatch):
+    _, notifications = record_calls(monkeypatch)
+    row = dict(created_at=CREATED_AT, salon_id=1, master_id=1, status="ai_analyzing")
+    session = FakeSession(matches=True, stale_rows=[
+        SimpleNamespace(id=5, ai_attempts=1, **row),
+        SimpleNamespace(id=6, ai_attempts=3, **row),
+    ])
+
+    recovered = asyncio.run(recover_orphaned_ai(
+        session, stale_before=datetime.now(), max_attempts=3, batch_size=10, masters=set()
+    ))
+
+    assert recovered == 2
+    assert notifications == [("analysis:5:requeued:1", 1001), ("analysis:6:ai_error:3", 1001)]
+    assert session.commits == 1
@@ -0,0 +1,55 @@
+import asyncio
+from datetime import datetime
+
+from aiogram import Bot, Router
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Chat, Message, Update, User
+
+from app.services.update_executor import OrderedDispatcher, UpdateExecutor
+
+
+def make_update(update_id: int, chat_id: int) -> Update:
+    return Update(
+        update_id=update_id,
+        message=Message(
+            message_id=update_id,
+            date=datetime.now(),
+            chat=Chat(id=chat_id, type="private"),
+            from_user=User(id=chat_id, is_bot=False, first_name="Master"),
+            text="photo",
+        ),
+    )
+
+
+def test_updates_of_one_chat_see_previous_fsm_state():
+    seen = []
+    router = Router()
+
+    @router.message()
+    async def step(message: Message, state: FSMContext):
+        current = await state.get_state()
+        seen.append(current)
+        # Пока обработчик ждет, следующее обновление чата уже поставлено в очередь
+        await asyncio.sleep(0.01)
+        await state.set_state("second" if current == "first" else "first")
+
+    async def scenario():
+        executor = UpdateExecutor(concurrency=4, max_pending=100, max_per_chat=10)
+        dp = OrderedDispatcher(storage=MemoryStorage(), executor=executor)
+        dp.include_router(router)
+        bot = Bot(token="42:TEST")
+
+        await asyncio.gather(
+            dp.feed_update(bot, make_update(1, chat_id=7)),
+            dp.feed_update(bot, make_update(2, chat_id=7)),
+        )
+        state = await dp.fsm.get_context(bot, chat_id=7, user_id=7).get_state()
+        return executor, state
+
+    executor, state = asyncio.run(scenario())
+
+    assert seen == [None, "first"]
+    assert state == "second"
+    assert executor.processed == 2
+    assert executor.chats == 0